@@ -17,7 +17,11 @@ from datetime import datetime
 from dateutil import parser as date_parser
 
 sys.path.insert(0, str(Path(__file__).parent))
-from convert_lib import setup_google_auth, get_drive_service
+from convert_lib import (
+    setup_google_auth, get_drive_service, upload_file_to_drive, write_json_records, print_upload_summary,
+    get_drive_file_metadata, load_artifact
+)
+from convert_junestory_pl import load_pl_data
 
 JUNESTORY_FOLDER_ID = '1Bt8WpIQWUiHiOCct_c1AikDOZ5CKprCL'
 STORE_MANAGEMENT_FILE_ID = '1o8mLajjm8FOKVeJc2a-qaGNBMRCF0NDu'
@@ -40,11 +44,7 @@ def check_and_update_store_master(service):
 
     # スプレッドシートの更新日時を取得
     try:
-        file_info = service.files().get(
-            fileId=STORE_MANAGEMENT_FILE_ID,
-            fields='modifiedTime',
-            supportsAllDrives=True
-        ).execute()
+        file_info = get_drive_file_metadata(service, STORE_MANAGEMENT_FILE_ID, 'modifiedTime')
         remote_modified = file_info.get('modifiedTime')
     except Exception as e:
         print(f"[WARN] Could not check spreadsheet: {e}")
@@ -92,65 +92,6 @@ def get_fiscal_months_order(year_month):
     return month + (12 - FISCAL_YEAR_START_MONTH + 1)
 
 
-def load_json_from_drive(service, folder_id, filename):
-    """Google DriveからJSONファイルを読み込み"""
-    query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
-    results = service.files().list(
-        q=query,
-        fields='files(id)',
-        supportsAllDrives=True,
-        includeItemsFromAllDrives=True
-    ).execute()
-    files = results.get('files', [])
-
-    if not files:
-        return None
-
-    file_id = files[0]['id']
-    content = service.files().get_media(
-        fileId=file_id,
-        supportsAllDrives=True
-    ).execute()
-
-    return json.loads(content.decode('utf-8'))
-
-
-def upload_to_drive(service, data, filename, folder_id):
-    """Google Driveにアップロード"""
-    from googleapiclient.http import MediaInMemoryUpload
-
-    content = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
-
-    query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
-    results = service.files().list(
-        q=query,
-        fields='files(id)',
-        supportsAllDrives=True,
-        includeItemsFromAllDrives=True
-    ).execute()
-    existing = results.get('files', [])
-
-    media = MediaInMemoryUpload(content, mimetype='application/json')
-
-    if existing:
-        file_id = existing[0]['id']
-        service.files().update(
-            fileId=file_id,
-            media_body=media,
-            supportsAllDrives=True
-        ).execute()
-        print(f'  Updated: {filename}')
-    else:
-        file_metadata = {'name': filename, 'parents': [folder_id]}
-        service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id',
-            supportsAllDrives=True
-        ).execute()
-        print(f'  Created: {filename}')
-
-
 def calc_metrics():
     """指標を計算"""
     script_dir = Path(__file__).parent
@@ -161,17 +102,14 @@ def calc_metrics():
 
     store_master = {s['store_code']: s for s in stores_data['stores']}
 
-    # Google Drive APIサービス取得
+    # データ読み込み（pos / pl ステージの出力: メモリ → ローカル → Google Drive の順）
+    # PLはDrive上に月別パーティションのみ置くため、取得したパーティションから統合データを作る
+    data_dir = script_dir.parent / 'data' / 'junestory'
     service = get_drive_service()
-    if not service:
-        print("[ERROR] Google Drive API unavailable")
-        return None
-
-    # データ読み込み
     print("Loading POS data...")
-    pos_data = load_json_from_drive(service, JUNESTORY_FOLDER_ID, 'pos_data.json')
+    pos_data = load_artifact(data_dir / 'pos_data.json', service, JUNESTORY_FOLDER_ID, as_frame=True)
     print("Loading PL data...")
-    pl_data = load_json_from_drive(service, JUNESTORY_FOLDER_ID, 'pl_data.json')
+    pl_data = load_pl_data(data_dir, service, JUNESTORY_FOLDER_ID, as_frame=True)
 
     if not pos_data or not pl_data:
         print("[ERROR] Data not found")
@@ -181,29 +119,31 @@ def calc_metrics():
     print("Aggregating POS data...")
     pos_agg = {}  # { "store_code|year_month": { sales, customers } }
 
-    for rec in pos_data.get('data', []):
-        key = f"{rec['店舗コード']}|{rec['年月']}"
+    pos_rows = pos_data['data'].reindex(columns=['店舗コード', '店舗名', '年月', '中項目', '値'])
+    for store_code, store_name, year_month, item, value in pos_rows.itertuples(index=False, name=None):
+        key = f"{store_code}|{year_month}"
         if key not in pos_agg:
             pos_agg[key] = {
-                'store_code': rec['店舗コード'],
-                'store_name': rec['店舗名'],
-                'year_month': rec['年月'],
+                'store_code': store_code,
+                'store_name': store_name,
+                'year_month': year_month,
                 'sales': 0,
                 'customers': 0,
             }
 
-        if rec.get('中項目') == '純売上高(税抜)':
-            pos_agg[key]['sales'] = rec.get('値', 0)
-        if rec.get('中項目') == '客数':
-            pos_agg[key]['customers'] = rec.get('値', 0)
+        if item == '純売上高(税抜)':
+            pos_agg[key]['sales'] = value
+        if item == '客数':
+            pos_agg[key]['customers'] = value
 
     # PLデータから売上を取得（店舗×月）
     print("Aggregating PL sales...")
+    pl_rows = pl_data['data'].reindex(columns=['店舗コード', '店舗名', '年月', '大項目', '中項目', '値'])
     pl_sales = {}
-    for rec in pl_data.get('data', []):
-        if rec.get('大項目') == '売上高' and rec.get('中項目') == '純売上高':
-            key = f"{rec['店舗コード']}|{rec['年月']}"
-            pl_sales[key] = rec.get('値', 0)
+    for store_code, _, year_month, category, item, value in pl_rows.itertuples(index=False, name=None):
+        if category == '売上高' and item == '純売上高':
+            key = f"{store_code}|{year_month}"
+            pl_sales[key] = value
 
     # 指標計算
     print("Calculating metrics...")
@@ -258,35 +198,34 @@ def calc_metrics():
 
     # --- PL指標（費用比率）---
     expense_categories = ['売上原価', '販管費']
-    for rec in pl_data.get('data', []):
-        if rec.get('大項目') not in expense_categories:
+    for store_code, store_name, year_month, category, item, expense_value in pl_rows.itertuples(index=False, name=None):
+        if category not in expense_categories:
             continue
-        if '合計' in str(rec.get('中項目', '')):
+        if '合計' in str(item):
             continue
 
-        key = f"{rec['店舗コード']}|{rec['年月']}"
+        key = f"{store_code}|{year_month}"
         sales = pl_sales.get(key, 0)
         if sales <= 0:
             continue
 
-        store = store_master.get(rec['店舗コード'])
+        store = store_master.get(store_code)
         if not store:
             continue
 
-        expense_value = rec.get('値', 0)
         if expense_value == 0:
             continue
 
         metrics.append({
-            'year_month': rec['年月'],
-            'store_code': rec['店舗コード'],
-            'store_name': rec['店舗名'],
+            'year_month': year_month,
+            'store_code': store_code,
+            'store_name': store_name,
             'brand': store.get('brand_name', ''),
             'category': store.get('category', ''),
-            'fiscal_year': get_fiscal_year(rec['年月']),
+            'fiscal_year': get_fiscal_year(year_month),
             'period_type': 'monthly',
-            'metric': f"expense_ratio_{rec['大項目']}_{rec['中項目']}",
-            'metric_name': f"費用比率_{rec['大項目']}_{rec['中項目']}",
+            'metric': f"expense_ratio_{category}_{item}",
+            'metric_name': f"費用比率_{category}_{item}",
             'value': round(expense_value / sales * 100, 1),
             'unit': '%',
         })
@@ -377,15 +316,15 @@ def main():
     # ローカル保存
     output_path = project_dir / 'data' / 'junestory' / 'store_metrics.json'
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    header = {key: value for key, value in result.items() if key != 'data'}
+    write_json_records(output_path, header, [result['data']], indent=2)
     print(f"\nLocal save: {output_path}")
 
-    # Google Driveアップロード
+    # Google Driveアップロード（ローカル保存したファイルをそのまま送る）
     service = get_drive_service()
     if service:
         print("\nUploading to Google Drive...")
-        upload_to_drive(service, result, 'store_metrics.json', JUNESTORY_FOLDER_ID)
+        upload_file_to_drive(service, output_path, 'store_metrics.json', JUNESTORY_FOLDER_ID, 'application/json')
     else:
         print("\n[WARN] Google Drive API unavailable")
 
@@ -394,3 +333,4 @@ def main():
 
 if __name__ == '__main__':
     main()
+    print_upload_summary()
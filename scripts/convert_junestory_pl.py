@@ -2,7 +2,7 @@
 ジュネストリー損益データを縦持ち形式に変換するスクリプト
 
 入力: TKC部門別損益比較表PDF → CSV（既存スクリプトで変換済み）
-出力: pl_data.json（縦持ち形式）
+出力: pl/<年月>.json（月別パーティション）+ pl_data.json / pl_data.csv（全月を結合、縦持ち形式）
 
 出力形式:
 年月, 店舗コード, 店舗名, 大項目, 中項目, 単位, 区分, 値
@@ -16,11 +16,28 @@ import json
 import os
 import re
 import glob
+import hashlib
+import argparse
 
 from convert_lib import (
     setup_google_auth,
     get_drive_service,
-    upload_to_drive,
+    upload_files_concurrently,
+    list_drive_folder,
+    download_file_from_drive,
+    drive_execute,
+    file_md5,
+    write_json_records,
+    iter_dataframe_records,
+    print_upload_summary,
+    publish_artifact,
+    load_artifact,
+    read_csv_auto,
+    parse_numeric_column,
+    parse_numeric_frame,
+    resolve_store,
+    build_name_index,
+    match_name,
     load_junestory_master
 )
 
@@ -50,22 +67,11 @@ def get_store_info_from_pl_name(pl_name: str) -> tuple:
     if not master:
         return None, None
 
-    pl_mapping = master.get('mapping', {}).get('pl', {})
-    stores = master.get('stores', {})
-
-    # PLマッピングで検索（完全一致優先）
-    if pl_name in pl_mapping:
-        store_code = pl_mapping[pl_name]
-        if store_code in stores:
-            return store_code, stores[store_code]['name']
-
-    # 部分一致で検索
-    for mapped_pl_name, store_code in pl_mapping.items():
-        if mapped_pl_name in pl_name or pl_name in mapped_pl_name:
-            if store_code in stores:
-                return store_code, stores[store_code]['name']
-
-    return None, None
+    # PLマッピングで検索（完全一致優先 → 部分一致）
+    store_code, store_name = resolve_store(master, pl_name, ('pl',), mode='exact', fallback=False)
+    if store_code is None:
+        store_code, store_name = resolve_store(master, pl_name, ('pl',), fallback=False)
+    return store_code, store_name
 
 
 # TKC部門コード→正式店番マッピング（完全版）
@@ -158,8 +164,20 @@ ACCOUNT_CATEGORIES = {
 }
 
 
+# 勘定科目の分類用索引（ACCOUNT_CATEGORIES から1回だけ作成）
+# - 完全一致: カテゴリ順・キーワード順で最初の項目
+# - 部分一致: (キーワード長, カテゴリ, キーワード) の降順に並べ、最初に含まれる項目
+#   （全マッチを降順ソートした先頭と同じ）
+ACCOUNT_EXACT_INDEX = build_name_index(
+    (keyword, category) for category, keywords in ACCOUNT_CATEGORIES.items() for keyword in keywords)
+ACCOUNT_KEYWORD_INDEX = build_name_index(
+    (keyword, category) for _, category, keyword in sorted(
+        ((len(keyword), category, keyword) for category, keywords in ACCOUNT_CATEGORIES.items()
+         for keyword in keywords), reverse=True))
+
+
 def categorize_account(account_name: str) -> str:
-    """勘定科目を大項目に分類
+    """勘定科目を大項目に分類（結果は勘定科目名ごとにメモ化）
 
     判定順序が重要:
     1. 完全一致を優先
@@ -169,54 +187,25 @@ def categorize_account(account_name: str) -> str:
     account_name = account_name.strip()
 
     # 完全一致を最優先
-    for category, keywords in ACCOUNT_CATEGORIES.items():
-        for keyword in keywords:
-            if account_name == keyword:
-                return category
-
-    # 長いキーワードから順にマッチ（より具体的なマッチを優先）
-    all_matches = []
-    for category, keywords in ACCOUNT_CATEGORIES.items():
-        for keyword in keywords:
-            if keyword in account_name:
-                all_matches.append((len(keyword), category, keyword))
-
-    if all_matches:
-        # 最も長いキーワードにマッチしたカテゴリを返す
-        all_matches.sort(reverse=True)
-        return all_matches[0][1]
-
-    return 'その他'
+    category = match_name(ACCOUNT_EXACT_INDEX, account_name, mode='exact')
+    if category is not None:
+        return category
 
+    # 最も長いキーワードにマッチしたカテゴリ
+    category = match_name(ACCOUNT_KEYWORD_INDEX, account_name, mode='within')
+    if category is not None:
+        return category
 
-def parse_numeric_value(value) -> float:
-    """数値をパース（カンマ区切り、括弧負数対応）"""
-    if pd.isna(value) or value == '' or value is None:
-        return None
-
-    s = str(value).strip()
+    return 'その他'
 
-    # 空や非数値
-    if not s or s in ['-', '－', '―', '−', '*', '***']:
-        return None
 
-    # 括弧で囲まれた数値は負数
-    is_negative = False
-    if s.startswith('(') and s.endswith(')'):
-        is_negative = True
-        s = s[1:-1]
-    elif s.startswith('△') or s.startswith('▲'):
-        is_negative = True
-        s = s[1:]
+# 損益CSVの数値表記（カンマ区切り、括弧・△▲の負数）。数値にできない値はNaN
+PL_NUMERIC_OPTIONS = {'remove_chars': (',',), 'negative_markers': True, 'bools_as_numbers': False}
 
-    # カンマを除去
-    s = s.replace(',', '')
 
-    try:
-        val = float(s)
-        return -val if is_negative else val
-    except ValueError:
-        return None
+def parse_numeric_value(values: pd.Series) -> np.ndarray:
+    """数値列をパース（カンマ区切り、括弧・△▲の負数対応）。数値にできない値はNaN"""
+    return parse_numeric_column(values, **PL_NUMERIC_OPTIONS)
 
 
 def extract_yearmonth_from_filename(filename: str) -> str:
@@ -248,22 +237,32 @@ def load_store_map_auto(pl_folder: Path) -> dict:
     return {}
 
 
-def convert_pl_csv(csv_path: Path, yearmonth: str, store_map_auto: dict) -> list:
-    """損益CSVを縦持ち形式に変換"""
-    records = []
+# 勘定科目として扱わない行（空行・ヘッダー行・ページ見出し等）
+PL_HEADER_ACCOUNTS = ['勘定科目名', '科目名']
+PL_NOISE_PATTERN = re.compile('|'.join(re.escape(word) for word in ['部門別損益', 'TKC', 'ページ', '損益計算書']))
+
+# 縦持ち出力の列
+PL_COLUMNS = ['年月', '店舗コード', '店舗名', '大項目', '中項目', '単位', '区分', '値']
+
 
+def convert_pl_csv(csv_path: Path, yearmonth: str, store_map_auto: dict) -> pd.DataFrame:
+    """損益CSVを縦持ち形式に変換
+
+    勘定科目（行）× 店舗（(XXX)形式の列）の表を、行ごと・店舗列順の縦持ちにする。
+    数値にならないセルは出力しない。
+
+    Returns:
+        DataFrame: PL_COLUMNS の列（該当なしは空のDataFrame）
+    """
     try:
-        # cp932（Shift-JIS）で読み込み
-        df = pd.read_csv(csv_path, encoding='cp932', header=0)
-    except:
-        try:
-            df = pd.read_csv(csv_path, encoding='utf-8-sig', header=0)
-        except Exception as e:
-            print(f"  [ERROR] CSV読み込み失敗: {csv_path.name} - {e}")
-            return []
+        # 文字コードは判定して1回で読み込み（TKCの出力は通常cp932）
+        df = read_csv_auto(csv_path, header=0)
+    except Exception as e:
+        print(f"  [ERROR] CSV読み込み失敗: {csv_path.name} - {e}")
+        return pd.DataFrame()
 
     if len(df) == 0:
-        return []
+        return pd.DataFrame()
 
     # カラム名を取得
     columns = df.columns.tolist()
@@ -324,44 +323,173 @@ def convert_pl_csv(csv_path: Path, yearmonth: str, store_map_auto: dict) -> list
 
             store_columns.append((col, dept_code, store_code, store_name))
 
-    # 各行を処理
-    for idx, row in df.iterrows():
-        account_name = str(row[account_col]).strip() if pd.notna(row[account_col]) else ''
+    if not store_columns:
+        return pd.DataFrame()
 
-        # 空行やヘッダー行をスキップ
-        if not account_name or account_name in ['勘定科目名', '科目名', '']:
-            continue
+    # 勘定科目名（空行・ヘッダー行・ノイズ行は除く）
+    accounts = df[account_col].fillna('').astype(str).str.strip()
+    keep = ((accounts != '') & ~accounts.isin(PL_HEADER_ACCOUNTS)
+            & ~accounts.str.contains(PL_NOISE_PATTERN)).to_numpy()
+    rows = np.flatnonzero(keep)
+    accounts = accounts.to_numpy(dtype=object)[rows]
+
+    # 大項目は勘定科目ごとに1回だけ判定
+    category_map = {name: categorize_account(name) for name in pd.unique(accounts)}
+    big_categories = np.array([category_map[name] for name in accounts], dtype=object)
+
+    # 店舗列の数値をまとめてパースし、行 × 店舗列 の順に縦持ちにする（NaNのセルは除く）
+    values = parse_numeric_frame(df[[col for col, _, _, _ in store_columns]], **PL_NUMERIC_OPTIONS)[rows]
+    row_idx, col_idx = np.nonzero(~np.isnan(values))
+    store_codes = np.array([store_code for _, _, store_code, _ in store_columns], dtype=object)
+    store_names = np.array([store_name for _, _, _, store_name in store_columns], dtype=object)
+
+    return pd.DataFrame({
+        '年月': np.full(len(row_idx), yearmonth, dtype=object),
+        '店舗コード': store_codes[col_idx],
+        '店舗名': store_names[col_idx],
+        '大項目': big_categories[row_idx],
+        '中項目': accounts[row_idx],
+        '単位': np.full(len(row_idx), '円', dtype=object),
+        '区分': np.full(len(row_idx), '実績', dtype=object),
+        '値': values[row_idx, col_idx],
+    }, columns=PL_COLUMNS)
+
+
+# ========== 月別パーティション ==========
+# 年月ごとの変換結果を pl/<年月>.json に保存し、pl/manifest.json に元CSV（サイズ・更新日時・md5）を記録する。
+# 元CSVに変更のない月（締め済みの月）は再変換せず、保存済みのパーティションを読み込む。
+# 変換ロジックを変更した場合は PL_PARTITION_VERSION を上げて全月を作り直す。
+PL_PARTITION_VERSION = 1
+PL_PARTITION_DIRNAME = 'pl'
+PL_MANIFEST_FILENAME = 'manifest.json'
+PL_DRIVE_PREFIX = 'pl_'   # Drive上はフラットなフォルダに pl_<年月>.json / pl_manifest.json として置く
+PL_COMPANY_NAME = '株式会社ジュネストリー'
+# 以前はDriveに全月統合ファイルを置いていた（現在は更新しない）。--purge-legacy 指定時のみ削除する
+PL_LEGACY_DRIVE_FILES = ('pl_data.json', 'pl_data.csv')
+
+# 重複除去・ソートのキー（同じ年月・店舗・項目は後に読んだファイルを優先）
+PL_DUPLICATE_KEYS = ['年月', '店舗コード', '大項目', '中項目', '区分']
+PL_SORT_KEYS = ['年月', '店舗コード', '大項目', '中項目']
+
+
+def get_pl_inputs_hash(store_map_auto: dict) -> str:
+    """店舗マスタ・自動学習マッピングの内容ハッシュ（変わったら全月を作り直す）"""
+    content = json.dumps([get_store_master(), store_map_auto], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+def load_pl_manifest(partition_dir: Path) -> dict:
+    """月別パーティションのマニフェストを読み込み（なければ空）"""
+    manifest_path = partition_dir / PL_MANIFEST_FILENAME
+    if manifest_path.exists():
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] マニフェスト読み込み失敗: {e}")
+    return {}
 
-        # ノイズ行をスキップ
-        if any(noise in account_name for noise in ['部門別損益', 'TKC', 'ページ', '損益計算書']):
-            continue
 
-        # 大項目を決定
-        big_category = categorize_account(account_name)
+def save_pl_manifest(partition_dir: Path, manifest: dict):
+    """月別パーティションのマニフェストを保存"""
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = partition_dir / PL_MANIFEST_FILENAME
+    tmp_path = manifest_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def pl_source_signature(csv_file: Path, entry: dict) -> dict:
+    """元CSVのサイズ・更新日時・md5（サイズ・更新日時が記録と同じならmd5は再計算しない）"""
+    stat = csv_file.stat()
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if entry and entry.get('size') == signature['size'] and entry.get('mtime_ns') == signature['mtime_ns']:
+        signature['md5'] = entry.get('md5')
+    else:
+        signature['md5'] = file_md5(str(csv_file))
+    return signature
+
+
+def is_partition_current(partition_dir: Path, entry: dict, sources: dict) -> bool:
+    """元CSVの構成・内容が記録と同じで、パーティションファイルも書き出したままならTrue"""
+    if not entry or set(entry.get('sources', {})) != set(sources):
+        return False
+    if any(entry['sources'][name].get('md5') != info['md5'] for name, info in sources.items()):
+        return False
+    if not entry.get('file'):
+        return True   # 変換結果が0件の月
+    path = partition_dir / entry['file']
+    return path.exists() and path.stat().st_size == entry.get('size')
+
+
+def write_pl_partition(partition_dir: Path, yearmonth: str, df: pd.DataFrame, sources: dict) -> dict:
+    """1か月分のパーティションを書き出し、マニフェストのエントリを返す"""
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    filename = f'{yearmonth}.json'
+    header = {
+        'yearmonth': yearmonth,
+        'format': 'long',
+        'sources': sorted(sources),
+        'total_records': len(df),
+    }
+    hasher = hashlib.md5()
+    write_json_records(partition_dir / filename, header, iter_dataframe_records(df), hasher=hasher)
+    return {
+        'file': filename,
+        'md5': hasher.hexdigest(),
+        'size': (partition_dir / filename).stat().st_size,
+        'records': len(df),
+        'sources': sources,
+    }
+
+
+def read_pl_partition(path: Path) -> pd.DataFrame:
+    """パーティションファイルを読み込み"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return pd.DataFrame(json.load(f).get('data', []), columns=PL_COLUMNS)
+
+
+def merge_pl_partitions(frames: list) -> pd.DataFrame:
+    """月別の変換結果を結合（各月は重複除去・ソート済み）"""
+    frames = [frame for frame in frames if len(frame) > 0]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True).sort_values(PL_SORT_KEYS)
+
+
+def convert_pl_month(csv_files: list, yearmonth: str, store_map_auto: dict) -> pd.DataFrame:
+    """同じ年月のCSV群を変換し、重複除去・ソートした1か月分を返す"""
+    frames = []
+    for csv_file in csv_files:
+        frame = convert_pl_csv(csv_file, yearmonth, store_map_auto)
+        if len(frame) > 0:
+            frames.append(frame)
+            print(f"  -> {csv_file.name}: {len(frame)}件")
+
+    if not frames:
+        return pd.DataFrame()
+
+    df = pd.concat(frames, ignore_index=True)
+    df = df.drop_duplicates(subset=PL_DUPLICATE_KEYS, keep='last')
+    return df.sort_values(PL_SORT_KEYS)
 
-        # 各店舗のデータを抽出
-        for col, dept_code, store_code, store_name in store_columns:
-            value = parse_numeric_value(row[col])
 
-            if value is not None:
-                records.append({
-                    '年月': yearmonth,
-                    '店舗コード': store_code,
-                    '店舗名': store_name,
-                    '大項目': big_category,
-                    '中項目': account_name,
-                    '単位': '円',
-                    '区分': '実績',
-                    '値': value
-                })
+def process_pl_folder(pl_folder: str, output_path: str, use_cache: bool = True) -> pd.DataFrame:
+    """損益元データフォルダ内の全CSVを処理
 
-    return records
+    元CSVを年月ごとにまとめ、変更のあった月だけ変換して output_path/pl/<年月>.json に保存する。
+    変更のない月は保存済みのパーティションを使う。
 
+    Args:
+        pl_folder: 損益元データフォルダ
+        output_path: 出力先（月別パーティションを output_path/pl に保存）
+        use_cache: Falseなら全月を再変換
 
-def process_pl_folder(pl_folder: str, output_path: str) -> pd.DataFrame:
-    """損益元データフォルダ内の全CSVを処理"""
+    Returns:
+        DataFrame: 全月を結合した縦持ちデータ
+    """
     pl_folder = Path(pl_folder)
-    all_records = []
 
     # store_map_auto.jsonを読み込み
     store_map_auto = load_store_map_auto(pl_folder)
@@ -388,28 +516,72 @@ def process_pl_folder(pl_folder: str, output_path: str) -> pd.DataFrame:
 
     print(f"\n処理対象CSVファイル: {len(csv_files)}件")
 
+    # 年月ごとにまとめる（月内はファイル名順 = 重複時に後のファイルを優先）
+    months = {}
     for csv_file in sorted(csv_files):
         yearmonth = extract_yearmonth_from_filename(csv_file.name)
         if not yearmonth:
             print(f"  [SKIP] 年月が特定できません: {csv_file.name}")
             continue
+        months.setdefault(yearmonth, []).append(csv_file)
+
+    partition_dir = Path(output_path) / PL_PARTITION_DIRNAME
+    inputs_hash = get_pl_inputs_hash(store_map_auto)
+    manifest = load_pl_manifest(partition_dir)
+    cached_months = {}
+    if use_cache and manifest:
+        if manifest.get('version') == PL_PARTITION_VERSION and manifest.get('inputs_hash') == inputs_hash:
+            cached_months = manifest.get('months', {})
+        else:
+            print("[INFO] 店舗マスタまたは変換仕様が変わったため全月を再変換")
+
+    frames = []
+    new_months = {}
+    rebuilt = []
+    for yearmonth in sorted(months):
+        entry = cached_months.get(yearmonth)
+        cached_sources = entry.get('sources', {}) if entry else {}
+        sources = {csv_file.name: pl_source_signature(csv_file, cached_sources.get(csv_file.name))
+                   for csv_file in months[yearmonth]}
+
+        if is_partition_current(partition_dir, entry, sources):
+            new_months[yearmonth] = {**entry, 'sources': sources}
+            if entry.get('file'):
+                frames.append(read_pl_partition(partition_dir / entry['file']))
+            continue
 
-        records = convert_pl_csv(csv_file, yearmonth, store_map_auto)
-        if records:
-            all_records.extend(records)
-            print(f"  -> {csv_file.name}: {len(records)}件")
-
-    if not all_records:
-        print("\n[WARN] 変換されたレコードがありません")
-        return pd.DataFrame()
-
-    df = pd.DataFrame(all_records)
+        df = convert_pl_month(months[yearmonth], yearmonth, store_map_auto)
+        rebuilt.append(yearmonth)
+        if len(df) == 0:
+            new_months[yearmonth] = {'file': None, 'records': 0, 'sources': sources}
+            continue
+        new_months[yearmonth] = write_pl_partition(partition_dir, yearmonth, df, sources)
+        frames.append(df)
+
+    # 元CSVがなくなった月のパーティションを削除
+    if partition_dir.exists():
+        current_files = {entry['file'] for entry in new_months.values() if entry.get('file')}
+        for path in partition_dir.glob('*.json'):
+            if path.name != PL_MANIFEST_FILENAME and path.name not in current_files:
+                path.unlink()
+
+    new_manifest = {
+        'version': PL_PARTITION_VERSION,
+        'inputs_hash': inputs_hash,
+        'source_folder': str(pl_folder),
+        'months': new_months,
+    }
+    # 変更がなければマニフェストを書き換えない（Drive上の同一内容はアップロードをスキップ）
+    if {key: value for key, value in manifest.items() if key != 'updated_at'} != new_manifest:
+        save_pl_manifest(partition_dir, {**new_manifest, 'updated_at': datetime.now().isoformat()})
 
-    # 重複除去
-    df = df.drop_duplicates(subset=['年月', '店舗コード', '大項目', '中項目', '区分'], keep='last')
+    print(f"\n月別パーティション: {len(months) - len(rebuilt)}か月再利用 / {len(rebuilt)}か月変換"
+          + (f"（{', '.join(rebuilt)}）" if rebuilt else ''))
 
-    # ソート
-    df = df.sort_values(['年月', '店舗コード', '大項目', '中項目'])
+    df = merge_pl_partitions(frames)
+    if len(df) == 0:
+        print("\n[WARN] 変換されたレコードがありません")
+        return df
 
     print(f"\n合計レコード数: {len(df)}")
 
@@ -417,13 +589,18 @@ def process_pl_folder(pl_folder: str, output_path: str) -> pd.DataFrame:
 
 
 def save_pl_data(df: pd.DataFrame, output_path: str, company_name: str, source_folder: str,
-                 drive_folder_id: str = None):
-    """損益データを保存"""
+                 drive_folder_id: str = None, purge_legacy: bool = False):
+    """損益データを保存
+
+    全月を結合した pl_data.json / pl_data.csv はローカルに保存し、後続ステージに渡す。
+    Google Driveには月別パーティションとマニフェストを送る（内容が同じ月はスキップされる）。
+    purge_legacy=True なら、以前の実行でDriveに置いた統合ファイルを削除する。
+    """
     output_path = Path(output_path)
     output_path.mkdir(parents=True, exist_ok=True)
 
-    # JSON出力
-    json_data = {
+    # JSON出力（レコードは順次書き出し）
+    json_header = {
         'company_name': company_name,
         'generated_at': datetime.now().isoformat(),
         'format': 'long',
@@ -432,12 +609,12 @@ def save_pl_data(df: pd.DataFrame, output_path: str, company_name: str, source_f
         'stores': df['店舗コード'].unique().tolist(),
         'yearmonths': sorted(df['年月'].unique().tolist()),
         'categories': df['大項目'].unique().tolist(),
-        'data': df.to_dict(orient='records')
     }
 
     json_path = output_path / 'pl_data.json'
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(json_data, f, ensure_ascii=False, indent=2)
+    hasher = hashlib.md5()
+    write_json_records(json_path, json_header, iter_dataframe_records(df), indent=2, hasher=hasher)
+    publish_artifact(json_path, hasher.hexdigest(), json_header, df)
     print(f"\nJSON保存: {json_path}")
 
     # CSV出力
@@ -445,22 +622,129 @@ def save_pl_data(df: pd.DataFrame, output_path: str, company_name: str, source_f
     df.to_csv(csv_path, index=False, encoding='utf-8-sig')
     print(f"CSV保存: {csv_path}")
 
-    # Google Driveアップロード
+    # Google Driveアップロード（月別パーティション + マニフェスト）
     if drive_folder_id:
         print('\nGoogle Driveにアップロード中...')
         service = get_drive_service()
         if service:
-            json_content = json.dumps(json_data, ensure_ascii=False, indent=2).encode('utf-8')
-            upload_to_drive(service, json_content, 'pl_data.json', drive_folder_id, 'application/json')
-
-            csv_content = df.to_csv(index=False, encoding='utf-8-sig').encode('utf-8-sig')
-            upload_to_drive(service, csv_content, 'pl_data.csv', drive_folder_id, 'text/csv')
+            upload_pl_partitions(service, output_path / PL_PARTITION_DIRNAME, drive_folder_id)
+            if purge_legacy:
+                delete_legacy_pl_files(service, drive_folder_id)
         else:
             print('[WARN] Google Drive APIが利用できません')
 
 
-def main():
-    """メイン処理"""
+def upload_pl_partitions(service, partition_dir: Path, folder_id: str):
+    """月別パーティションとマニフェストをGoogle Driveにアップロード（変更のない月はmd5一致でスキップ）"""
+    manifest_path = partition_dir / PL_MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return
+    # マニフェストは1回だけ読み、内容をmd5計算・アップロードの両方に使う
+    manifest_bytes = manifest_path.read_bytes()
+    manifest = json.loads(manifest_bytes.decode('utf-8'))
+    items = [{
+        'path': manifest_path,
+        'filename': PL_DRIVE_PREFIX + PL_MANIFEST_FILENAME,
+        'md5': hashlib.md5(manifest_bytes).hexdigest(),
+        'size': len(manifest_bytes),
+        'mime_type': 'application/json',
+        'content': manifest_bytes,
+    }]
+    for entry in manifest.get('months', {}).values():
+        if entry.get('file'):
+            items.append({
+                'path': partition_dir / entry['file'],
+                'filename': PL_DRIVE_PREFIX + entry['file'],
+                'md5': entry['md5'],
+                'size': entry['size'],
+                'mime_type': 'application/json',
+            })
+
+    results = upload_files_concurrently(service, items, folder_id)
+    uploaded = [name for name, status in results.items() if status == 'uploaded']
+    print(f"  月別パーティション: {len(uploaded)}件送信 / {len(items) - len(uploaded)}件変更なし")
+    failed = [name for name, status in results.items() if status == 'failed']
+    if failed:
+        raise RuntimeError(f'アップロード失敗: {len(failed)}件')
+
+
+def delete_legacy_pl_files(service, folder_id: str):
+    """Drive上に残っている旧形式の統合ファイル（pl_data.json / pl_data.csv）を削除（--purge-legacy 指定時のみ）"""
+    names = ' or '.join(f"name='{name}'" for name in PL_LEGACY_DRIVE_FILES)
+    results = drive_execute(service.files().list(
+        q=f"({names}) and '{folder_id}' in parents and trashed=false",
+        fields='files(id, name, modifiedTime)',
+        supportsAllDrives=True,
+        includeItemsFromAllDrives=True
+    ))
+    files = results.get('files', [])
+    if not files:
+        print('[INFO] 削除対象の旧形式の統合ファイルはありません')
+        return
+    print('[INFO] 旧形式の統合ファイルを削除します:')
+    for f in files:
+        print(f"  - {f['name']}（id: {f['id']}, 更新: {f.get('modifiedTime', '')}）")
+    for f in files:
+        try:
+            drive_execute(service.files().delete(fileId=f['id'], supportsAllDrives=True))
+            print(f"[INFO] 旧形式の統合ファイルを削除: {f['name']}")
+        except Exception as e:
+            print(f"[WARN] 旧形式の統合ファイルの削除失敗: {f['name']} ({e})")
+
+
+def load_pl_data(output_path, service=None, folder_id: str = None, as_frame: bool = False) -> dict:
+    """PLステージの統合データ（pl_data.json の内容）を読み込み
+
+    メモリ・ローカルの pl_data.json がなければ、Google Driveの月別パーティションを取得して作り直す
+    （ローカルに同じ内容のパーティションがあればダウンロードしない）。
+
+    Returns:
+        dict: {...ヘッダー, 'data': [...]}（as_frame=True なら 'data' はDataFrame。取得できなければNone）
+    """
+    output_path = Path(output_path)
+    data = load_artifact(output_path / 'pl_data.json', as_frame=as_frame)
+    if data is not None or not (service and folder_id):
+        return data
+
+    existing = list_drive_folder(service, folder_id)
+    remote = existing.get(PL_DRIVE_PREFIX + PL_MANIFEST_FILENAME)
+    content = download_file_from_drive(service, remote['id']) if remote else None
+    if not content:
+        return None
+    print('[INFO] pl_data.json: Google Driveの月別パーティションから作成')
+    manifest = json.loads(content.decode('utf-8'))
+
+    partition_dir = output_path / PL_PARTITION_DIRNAME
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    frames = []
+    for yearmonth, entry in sorted(manifest.get('months', {}).items()):
+        if not entry.get('file'):
+            continue
+        path = partition_dir / entry['file']
+        if not (path.exists() and file_md5(str(path)) == entry['md5']):
+            remote = existing.get(PL_DRIVE_PREFIX + entry['file'])
+            content = download_file_from_drive(service, remote['id']) if remote else None
+            if not content:
+                print(f"[ERROR] パーティションを取得できません: {yearmonth}")
+                return None
+            with open(path, 'wb') as f:
+                f.write(content)
+        frames.append(read_pl_partition(path))
+    save_pl_manifest(partition_dir, manifest)
+
+    df = merge_pl_partitions(frames)
+    if len(df) == 0:
+        return None
+    save_pl_data(df, output_path, PL_COMPANY_NAME, manifest.get('source_folder', ''))
+    return load_artifact(output_path / 'pl_data.json', as_frame=as_frame)
+
+
+def main(purge_legacy: bool = False):
+    """メイン処理
+
+    Args:
+        purge_legacy: TrueならDrive上の旧形式の統合ファイル（pl_data.json / pl_data.csv）を削除
+    """
     script_dir = Path(__file__).parent
     project_dir = script_dir.parent
 
@@ -484,9 +768,10 @@ def main():
         save_pl_data(
             df,
             str(output_path),
-            '株式会社ジュネストリー',
+            PL_COMPANY_NAME,
             pl_folder,
-            drive_folder_id=os.environ.get('GOOGLE_DRIVE_JUNESTORY_FOLDER_ID')
+            drive_folder_id=os.environ.get('GOOGLE_DRIVE_JUNESTORY_FOLDER_ID'),
+            purge_legacy=purge_legacy
         )
 
         # サマリー
@@ -501,11 +786,9 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
-
-    # 次のスクリプトを自動実行
-    print("\n" + "=" * 50)
-    print("続けて マスターデータ作成を実行...")
-    print("=" * 50 + "\n")
-    from create_junestory_master_data import main as master_main
-    master_main()
+    parser = argparse.ArgumentParser(description='ジュネストリー損益データ変換')
+    parser.add_argument('--purge-legacy', action='store_true',
+                        help='Google Drive上の旧形式の統合ファイル（pl_data.json / pl_data.csv）を削除（1回だけ実行する想定）')
+    args = parser.parse_args()
+    main(purge_legacy=args.purge_legacy)
+    print_upload_summary()
@@ -2,7 +2,8 @@
 ジュネストリーPOSデータを縦持ち形式に変換するスクリプト
 
 入力: POS分析フォルダ内のCSVファイル
-出力: pos_data.json（縦持ち形式）
+出力: pos_data.json（縦持ち形式）、pos_daily.npz（日別ファクト）、
+      pos_items.npz（全商品の単品ファクト）、pos_items_abc.json（店舗×年月ごとのABC分類）
 
 対応CSVタイプ:
 - dinii単品/売上: UTF-8, 魚えもん用
@@ -20,18 +21,43 @@ from datetime import datetime
 import json
 import os
 import re
-import chardet
+import hashlib
+import heapq
+import argparse
+from fnmatch import fnmatchcase
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 # convert_lib.pyの関数をインポート
 from convert_lib import (
     setup_google_auth,
     get_drive_service,
-    upload_to_drive,
+    upload_file_to_drive,
+    write_json_records,
+    iter_dataframe_records,
+    print_upload_summary,
+    publish_artifact,
     find_folder_by_name,
     load_junestory_master,
-    ensure_file_downloaded
+    ensure_file_downloaded,
+    read_csv_auto,
+    read_csv_columns,
+    read_csv_chunks,
+    parse_numeric_column,
+    resolve_store,
+    save_daily_facts,
+    save_item_facts,
+    load_item_facts,
+    DAILY_FACTS_FILENAME,
+    ITEM_FACTS_FILENAME,
+    ITEM_FACT_VALUES,
+    ABC_THRESHOLDS,
+    file_md5
 )
 
+# POSデータフォルダ
+POS_FOLDER = Path(r"c:\Users\yasuh\OneDrive - 株式会社日本コンサルタントグループ　\MyDocuments\00_Junes\2026年10月期_データ\POS分析")
+
 
 def load_store_master(master_path: str = None, service=None) -> dict:
     """店舗マスタを読み込む（Google Drive優先、フォールバックでローカル）"""
@@ -62,25 +88,11 @@ def load_store_master(master_path: str = None, service=None) -> dict:
     }
 
 
-def detect_encoding(file_path: str) -> str:
-    """ファイルのエンコーディングを検出"""
-    # OneDriveファイルのダウンロードを確認
-    if not ensure_file_downloaded(file_path):
+def ensure_csv_available(file_path):
+    """OneDriveのCSVがローカルにあることを確認（ダウンロードできなければIOError）"""
+    if not ensure_file_downloaded(str(file_path)):
         raise IOError(f"ファイルをダウンロードできません: {file_path}")
 
-    with open(file_path, 'rb') as f:
-        raw = f.read(10000)
-    result = chardet.detect(raw)
-    encoding = result['encoding']
-
-    # cp932とshift_jisは同等扱い
-    if encoding and encoding.lower() in ['shift_jis', 'shift-jis', 'sjis']:
-        return 'cp932'
-    if encoding and encoding.lower() in ['utf-8', 'utf-8-sig', 'ascii']:
-        return 'utf-8-sig'
-
-    return encoding or 'utf-8'
-
 
 def extract_yearmonth_from_filename(filename: str) -> str:
     """ファイル名から年月を抽出"""
@@ -128,54 +140,75 @@ def extract_store_from_filename(filename: str, store_master: dict, source_type:
             return store_code, stores[store_code]['name']
         return pos_code, f"店舗{pos_code}"
 
-    # POS店舗名でマッチ（完全一致優先）
-    for pos_name, store_code in mapping.get('pos_name', {}).items():
-        if pos_name in filename and store_code in stores:
-            return store_code, stores[store_code]['name']
+    # POS店舗名 → fun/dinii店舗名 → 店舗名（空白・「!」除去）の順に、ファイル名に含まれる名前でマッチ
+    sources = ('pos_name', source_type) if source_type in ('fun', 'dinii') else ('pos_name',)
+    return resolve_store(store_master, filename, sources, mode='within')
 
-    # fun店舗名でマッチ
-    if source_type == 'fun':
-        for fun_name, store_code in mapping.get('fun', {}).items():
-            if fun_name in filename and store_code in stores:
-                return store_code, stores[store_code]['name']
 
-    # dinii店舗名でマッチ
-    if source_type == 'dinii':
-        for dinii_name, store_code in mapping.get('dinii', {}).items():
-            if dinii_name in filename and store_code in stores:
-                return store_code, stores[store_code]['name']
+def parse_numeric(values: pd.Series) -> pd.Series:
+    """数値列をパース（カンマ区切り、バックスラッシュ・円記号対応）。数値にできない値はNaN"""
+    return pd.Series(parse_numeric_column(values), index=values.index)
 
-    # フォールバック: 店舗名の部分一致
-    for store_code, store in stores.items():
-        store_name = store['name']
-        simplified_name = store_name.replace('!', '').replace('！', '').replace(' ', '')
-        if simplified_name in filename.replace(' ', ''):
-            return store_code, store_name
 
-    return None, None
+# ========== 日別ファクト ==========
+# 日別の売上CSV（POSレジ・fun売上詳細・dinii日別）は、月次集計と同じ読み込み結果から
+# 日別ファクトも取り出す。ファイルごとに変換結果キャッシュへ保存し、全ファイル分を
+# pos_daily.npz にまとめる（曜日別集計はCSVを読み直さずにこのファイルを使う）。
 
+# 変換中に取り出した日別ファクト {CSVパス: ファクト}（変換関数の戻り値と一緒に回収する）
+_DAILY_FACTS = {}
 
-def parse_numeric(value) -> float:
-    """数値をパース（カンマ区切り、バックスラッシュ対応）"""
-    if pd.isna(value):
-        return None
-    if isinstance(value, (int, float)):
-        return float(value)
-
-    s = str(value).strip()
-    # バックスラッシュと円記号を除去
-    s = s.replace('\\', '').replace('¥', '').replace('￥', '')
-    # カンマを除去
-    s = s.replace(',', '')
-    # 空や非数値
-    if not s or s in ['-', '－', '―', '−']:
-        return None
 
-    try:
-        return float(s)
-    except ValueError:
+def collect_daily_facts(csv_path: Path, pattern: str, df: pd.DataFrame, columns: dict,
+                        store_code: str, store_name, positions: dict = None):
+    """DataFrameから日別ファクトを取り出して _DAILY_FACTS に登録
+
+    Args:
+        csv_path: CSVファイル（ファイル名が pattern に合わない場合は対象外）
+        pattern: 日別データのファイル名パターン
+        df: 読み込み済みのCSV
+        columns: {'date': 日付列, 'sales': 売上列, 'customers': 客数列, 'groups': 組数列}
+        store_code: 店舗コード（特定できない場合はNone）
+        store_name: 店舗名（行ごとに異なる場合は店舗名の列）
+        positions: 列名が見つからない場合に使う列位置 {'date': 0, ...}（従来の位置指定の読み込みと同じ列）
+    """
+    if not fnmatchcase(csv_path.name, pattern):
+        return
+
+    def resolve(key):
+        column = columns.get(key)
+        if column in df.columns:
+            return column
+        position = (positions or {}).get(key)
+        if position is not None and position < len(df.columns):
+            print(f"  [WARN] {csv_path.name}: 列「{column}」がないため{position + 1}列目（{df.columns[position]}）を使用")
+            return df.columns[position]
+        print(f"  [WARN] {csv_path.name}: 日別ファクトの列「{column}」がありません（曜日別集計では0として扱われます）")
         return None
 
+    date_column = resolve('date')
+    if date_column is None:
+        return
+
+    # 日付は「2025/04/01」「2025/04/01(火)」形式。解釈できない行（TOTAL等）は除く
+    dates = pd.to_datetime(df[date_column].astype(str).str.split('(').str[0],
+                           format='%Y/%m/%d', errors='coerce')
+    valid = dates.notna().to_numpy()
+
+    if isinstance(store_name, pd.Series):
+        names = store_name.fillna('').astype(str)[valid].tolist()
+    else:
+        names = [store_name] * int(valid.sum())
+
+    facts = {'store_code': store_code or '', 'date': dates[valid].dt.strftime('%Y-%m-%d').tolist(), 'store_name': names}
+    for key in ('sales', 'customers', 'groups'):
+        column = resolve(key)
+        if column is not None:
+            facts[key] = parse_numeric(df[column])[valid].tolist()
+        else:
+            facts[key] = [np.nan] * len(names)
+    _DAILY_FACTS[str(csv_path)] = facts
+
 
 def convert_pos_sales_csv(csv_path: Path, store_master: dict) -> list:
     """POS売上CSVを縦持ち形式に変換（レジ集計データ）- 税抜き統一"""
@@ -185,18 +218,27 @@ def convert_pos_sales_csv(csv_path: Path, store_master: dict) -> list:
     yearmonth = extract_yearmonth_from_filename(filename)
     store_code, store_name = extract_store_from_filename(filename, store_master)
 
-    if not yearmonth or not store_code:
-        print(f"  [SKIP] 年月または店舗が特定できません: {filename}")
-        return []
-
-    encoding = detect_encoding(str(csv_path))
+    ensure_csv_available(csv_path)
 
     try:
-        df = pd.read_csv(csv_path, encoding=encoding, header=0)
+        df = read_csv_auto(csv_path, header=0)
     except Exception as e:
         print(f"  [ERROR] CSV読み込み失敗: {filename} - {e}")
         return []
 
+    # 日別ファクトは店舗・年月が特定できないファイルからも取り出す（曜日別集計はファイル名の店舗名で集計する）
+    # 列名が合わない場合は従来の列位置（日付=1列目, 組数=2列目, 客数=3列目, 純売上=9列目）を使う
+    parts = filename.split('_')
+    collect_daily_facts(csv_path, '*_レジ_*.csv', df,
+                        {'date': '日付', 'sales': '純売上', 'customers': '客数',
+                         'groups': '組数(組)' if '組数(組)' in df.columns else '組数'},
+                        store_code, parts[1] if len(parts) > 1 else '',
+                        positions={'date': 0, 'groups': 1, 'customers': 2, 'sales': 8})
+
+    if not yearmonth or not store_code:
+        print(f"  [SKIP] 年月または店舗が特定できません: {filename}")
+        return []
+
     # 日別データを月次集計
     monthly_totals = {}
 
@@ -212,7 +254,7 @@ def convert_pos_sales_csv(csv_path: Path, store_master: dict) -> list:
 
     for csv_col, output_name in col_mapping.items():
         if csv_col in df.columns:
-            values = df[csv_col].apply(parse_numeric).dropna()
+            values = parse_numeric(df[csv_col]).dropna()
             if len(values) > 0:
                 if '単価' in csv_col:
                     monthly_totals[output_name] = values.mean()
@@ -247,8 +289,91 @@ def convert_pos_sales_csv(csv_path: Path, store_master: dict) -> list:
     return records
 
 
+# ========== 単品CSVの読み込み（上位商品・全商品の集計） ==========
+# 単品CSV（数十万行のメニュー出力もある）は必要な列だけをチャンクごとに読み、
+# 売上（または出数）の大きい上位N商品をヒープに残しつつ、全商品の値を商品名ごとに集計する。
+# 上位商品は縦持ちレコードに、全商品の集計は単品ファクト（pos_items.npz）に使う。
+ITEM_TOP_N = 20
+ITEM_CHUNK_ROWS = 50000
+
+# 変換中に取り出した単品ファクト {CSVパス: ファクト}（変換関数の戻り値と一緒に回収する）
+_ITEM_FACTS = {}
+
+
+def scan_item_csv(csv_path: Path, item_col, value_cols: list, rank_col,
+                  top_n: int = ITEM_TOP_N, chunksize: int = ITEM_CHUNK_ROWS) -> tuple:
+    """単品CSVから rank_col の値が大きい上位 top_n 商品と、全商品の商品名ごとの合計を取り出す
+
+    商品名が空の行は除く。上位商品は行単位で、rank_col が数値にならない行は除き、
+    同じ値なら先に出現した行を優先する。
+
+    Args:
+        item_col: 商品名のカラム
+        value_cols: 取り出す数値カラム（rank_col を含む）
+        rank_col: 順位付けに使うカラム
+
+    Returns:
+        (top_items, totals)
+        top_items: [(商品名, {カラム: 値}), ...]（rank_col の大きい順。数値にならない値はNaN）
+        totals: {'items': [商品名, ...]（初出順）, 'values': ndarray（商品 × value_cols。数値が1つもなければNaN）}
+    """
+    columns = read_csv_columns(csv_path)
+    usecols = sorted({columns.index(item_col), *(columns.index(col) for col in value_cols)})
+    rank_index = value_cols.index(rank_col)
+
+    heap = []       # (順位付けの値, -行番号, 商品名, 値) の最小ヒープ（大きさ top_n まで）
+    partials = []   # チャンクごとの商品名別合計
+    offset = 0
+    for chunk in read_csv_chunks(csv_path, chunksize, usecols=usecols, dtype={item_col: str}):
+        names = chunk[item_col].fillna('').str.strip().to_numpy(dtype=object)
+        values = np.column_stack([parse_numeric_column(chunk[col]) for col in value_cols])
+        ranks = values[:, rank_index]
+        named = names != ''
+
+        partials.append(pd.DataFrame(values[named]).groupby(names[named], sort=False).sum(min_count=1))
+
+        # 順位付けの値が大きい順に、ヒープに入りうる行だけを比較する
+        rows = np.flatnonzero(named & ~np.isnan(ranks))
+        rows = rows[np.argsort(-ranks[rows], kind='stable')[:top_n]]
+        for row in rows.tolist():
+            item = (ranks[row], -(offset + row), names[row], values[row].tolist())
+            if len(heap) < top_n:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+            else:
+                break
+        offset += len(chunk)
+
+    top_items = [(name, dict(zip(value_cols, item_values)))
+                 for _, _, name, item_values in sorted(heap, reverse=True)]
+
+    if partials:
+        totals = pd.concat(partials).groupby(level=0, sort=False).sum(min_count=1)
+        totals = {'items': totals.index.tolist(), 'values': totals.to_numpy(dtype=float)}
+    else:
+        totals = {'items': [], 'values': np.empty((0, len(value_cols)))}
+    return top_items, totals
+
+
+def collect_item_facts(csv_path: Path, yearmonth: str, store_code: str, store_name: str,
+                       totals: dict, value_cols: list, columns: dict):
+    """商品名ごとの合計を単品ファクトとして _ITEM_FACTS に登録
+
+    Args:
+        totals: scan_item_csv の全商品の合計
+        value_cols: totals['values'] の列に対応するカラム
+        columns: {'sales': 売上カラム, 'quantity': 出数カラム}（ないものはNone）
+    """
+    facts = {'store_code': store_code, 'store_name': store_name, 'yearmonth': yearmonth, 'items': totals['items']}
+    for key in ITEM_FACT_VALUES:
+        column = columns.get(key)
+        facts[key] = totals['values'][:, value_cols.index(column)].tolist() if column in value_cols else None
+    _ITEM_FACTS[str(csv_path)] = facts
+
+
 def convert_pos_items_csv(csv_path: Path, store_master: dict, data_type: str = 'sales') -> list:
-    """POS単品CSVを縦持ち形式に変換"""
+    """POS単品CSVを縦持ち形式に変換（売上 / 出数の上位20商品）"""
     records = []
 
     filename = csv_path.name
@@ -259,10 +384,10 @@ def convert_pos_items_csv(csv_path: Path, store_master: dict, data_type: str = '
         print(f"  [SKIP] 年月または店舗が特定できません: {filename}")
         return []
 
-    encoding = detect_encoding(str(csv_path))
+    ensure_csv_available(csv_path)
 
     try:
-        df = pd.read_csv(csv_path, encoding=encoding, header=0)
+        columns = read_csv_columns(csv_path)
     except Exception as e:
         print(f"  [ERROR] CSV読み込み失敗: {filename} - {e}")
         return []
@@ -271,7 +396,7 @@ def convert_pos_items_csv(csv_path: Path, store_master: dict, data_type: str = '
     item_col = None
     value_col = None
 
-    for col in df.columns:
+    for col in columns:
         col_str = str(col).strip()
         if '商品' in col_str or '品名' in col_str or 'メニュー' in col_str:
             item_col = col
@@ -283,22 +408,26 @@ def convert_pos_items_csv(csv_path: Path, store_master: dict, data_type: str = '
     if not item_col or not value_col:
         return []
 
-    # 上位20商品のみ
-    for idx, row in df.head(20).iterrows():
-        item_name = str(row[item_col]).strip()
-        value = parse_numeric(row[value_col])
-
-        if item_name and value is not None:
-            records.append({
-                '年月': yearmonth,
-                '店舗コード': store_code,
-                '店舗名': store_name,
-                '大項目': '単品',
-                '中項目': item_name,
-                '単位': '円' if data_type == 'sales' else '個',
-                '区分': '実績',
-                '値': value
-            })
+    # 値の大きい上位20商品（全商品の合計は単品ファクトへ）
+    try:
+        top_items, totals = scan_item_csv(csv_path, item_col, [value_col], value_col)
+    except Exception as e:
+        print(f"  [ERROR] CSV読み込み失敗: {filename} - {e}")
+        return []
+    collect_item_facts(csv_path, yearmonth, store_code, store_name, totals, [value_col],
+                       {'sales' if data_type == 'sales' else 'quantity': value_col})
+
+    for item_name, values in top_items:
+        records.append({
+            '年月': yearmonth,
+            '店舗コード': store_code,
+            '店舗名': store_name,
+            '大項目': '単品',
+            '中項目': item_name,
+            '単位': '円' if data_type == 'sales' else '個',
+            '区分': '実績',
+            '値': values[value_col]
+        })
 
     return records
 
@@ -316,42 +445,27 @@ def convert_fun_sales_csv(csv_path: Path, store_master: dict) -> list:
         return []
 
     store_name_raw = store_name_match.group(1)
-    mapping = store_master.get('mapping', {})
-    stores = store_master.get('stores', {})
 
-    # funマッピングで検索（完全一致優先）
-    store_code, store_name = None, None
-    for fun_name, code in mapping.get('fun', {}).items():
-        if fun_name == store_name_raw or store_name_raw in fun_name or fun_name in store_name_raw:
-            if code in stores:
-                store_code = code
-                store_name = stores[code]['name']
-                break
-
-    # フォールバック: 店舗マスタから部分一致検索
-    if not store_code:
-        for code, store in stores.items():
-            name = store['name'].replace('!', '').replace('！', '').replace(' ', '')
-            if store_name_raw.replace(' ', '') in name or name in store_name_raw.replace(' ', ''):
-                store_code = code
-                store_name = store['name']
-                break
+    # funマッピングで検索 → フォールバック: 店舗マスタから部分一致検索
+    store_code, store_name = resolve_store(store_master, store_name_raw, ('fun',))
 
     if not store_code:
         store_code = 'UNKNOWN'
         store_name = store_name_raw
 
-    if not yearmonth:
+    try:
+        df = read_csv_auto(csv_path, header=0)
+    except Exception as e:
+        print(f"  [ERROR] CSV読み込み失敗: {filename} - {e}")
         return []
 
-    try:
-        df = pd.read_csv(csv_path, encoding='utf-8', header=0)
-    except:
-        try:
-            df = pd.read_csv(csv_path, encoding='utf-8-sig', header=0)
-        except Exception as e:
-            print(f"  [ERROR] CSV読み込み失敗: {filename} - {e}")
-            return []
+    # 日別ファクトは年月が特定できないファイルからも取り出す（年月は各行の集計期間から求める）
+    collect_daily_facts(csv_path, '*_売上詳細_*.csv', df,
+                        {'date': '集計期間', 'sales': '売上高（税抜）', 'customers': '客数', 'groups': '会計数'},
+                        store_code, filename.split('_売上詳細')[0])
+
+    if not yearmonth:
+        return []
 
     monthly_totals = {}
 
@@ -369,7 +483,7 @@ def convert_fun_sales_csv(csv_path: Path, store_master: dict) -> list:
         col_clean = str(col).strip()
         for csv_key, output_key in col_mapping.items():
             if csv_key == col_clean:
-                values = df[col].apply(parse_numeric).dropna()
+                values = parse_numeric(df[col]).dropna()
                 if len(values) > 0:
                     if '単価' in csv_key:
                         monthly_totals[output_key] = values.mean()
@@ -407,7 +521,7 @@ def convert_fun_sales_csv(csv_path: Path, store_master: dict) -> list:
 
 
 def convert_fun_items_csv(csv_path: Path, store_master: dict) -> list:
-    """fun単品CSVを縦持ち形式に変換（ABC分析）"""
+    """fun単品CSVを縦持ち形式に変換（ABC分析用の上位20商品）"""
     records = []
 
     filename = csv_path.name
@@ -418,26 +532,9 @@ def convert_fun_items_csv(csv_path: Path, store_master: dict) -> list:
         return []
 
     store_name_raw = store_name_match.group(1)
-    mapping = store_master.get('mapping', {})
-    stores = store_master.get('stores', {})
 
-    # funマッピングで検索
-    store_code, store_name = None, None
-    for fun_name, code in mapping.get('fun', {}).items():
-        if fun_name == store_name_raw or store_name_raw in fun_name or fun_name in store_name_raw:
-            if code in stores:
-                store_code = code
-                store_name = stores[code]['name']
-                break
-
-    # フォールバック
-    if not store_code:
-        for code, store in stores.items():
-            name = store['name'].replace('!', '').replace('！', '').replace(' ', '')
-            if store_name_raw.replace(' ', '') in name or name in store_name_raw.replace(' ', ''):
-                store_code = code
-                store_name = store['name']
-                break
+    # funマッピングで検索 → フォールバック: 店舗マスタから部分一致検索
+    store_code, store_name = resolve_store(store_master, store_name_raw, ('fun',))
 
     if not store_code:
         store_code = 'UNKNOWN'
@@ -447,19 +544,16 @@ def convert_fun_items_csv(csv_path: Path, store_master: dict) -> list:
         return []
 
     try:
-        df = pd.read_csv(csv_path, encoding='utf-8', header=0)
-    except:
-        try:
-            df = pd.read_csv(csv_path, encoding='utf-8-sig', header=0)
-        except:
-            return []
+        columns = read_csv_columns(csv_path)
+    except Exception:
+        return []
 
     # 商品名と売上/出数カラムを特定
     item_col = None
     sales_col = None
     qty_col = None
 
-    for col in df.columns:
+    for col in columns:
         col_str = str(col).strip()
         if '商品' in col_str or '品名' in col_str:
             item_col = col
@@ -471,36 +565,29 @@ def convert_fun_items_csv(csv_path: Path, store_master: dict) -> list:
     if not item_col:
         return []
 
-    # 上位20商品
-    for idx, row in df.head(20).iterrows():
-        item_name = str(row[item_col]).strip()
-
-        if sales_col:
-            value = parse_numeric(row[sales_col])
-            if item_name and value is not None:
-                records.append({
-                    '年月': yearmonth,
-                    '店舗コード': store_code,
-                    '店舗名': store_name,
-                    '大項目': '単品売上',
-                    '中項目': item_name,
-                    '単位': '円',
-                    '区分': '実績',
-                    '値': value
-                })
+    # 売上（売上カラムがなければ出数）の大きい上位20商品
+    value_cols = [col for col in (sales_col, qty_col) if col]
+    if not value_cols:
+        return []
+    try:
+        top_items, totals = scan_item_csv(csv_path, item_col, value_cols, value_cols[0])
+    except Exception:
+        return []
+    collect_item_facts(csv_path, yearmonth, store_code, store_name, totals, value_cols,
+                       {'sales': sales_col, 'quantity': qty_col})
 
-        if qty_col:
-            value = parse_numeric(row[qty_col])
-            if item_name and value is not None:
+    for item_name, values in top_items:
+        for col, big, unit in ((sales_col, '単品売上', '円'), (qty_col, '単品出数', '個')):
+            if col and not np.isnan(values[col]):
                 records.append({
                     '年月': yearmonth,
                     '店舗コード': store_code,
                     '店舗名': store_name,
-                    '大項目': '単品出数',
+                    '大項目': big,
                     '中項目': item_name,
-                    '単位': '個',
+                    '単位': unit,
                     '区分': '実績',
-                    '値': value
+                    '値': values[col]
                 })
 
     return records
@@ -511,16 +598,12 @@ def convert_dinii_sales_csv(csv_path: Path, store_master: dict) -> list:
     records = []
 
     filename = csv_path.name
-    mapping = store_master.get('mapping', {})
     stores = store_master.get('stores', {})
 
     try:
-        df = pd.read_csv(csv_path, encoding='utf-8-sig', header=0)
-    except:
-        try:
-            df = pd.read_csv(csv_path, encoding='utf-8', header=0)
-        except:
-            return []
+        df = read_csv_auto(csv_path, header=0)
+    except Exception:
+        return []
 
     # 店舗名カラムと日付カラムを確認
     store_col = None
@@ -542,12 +625,9 @@ def convert_dinii_sales_csv(csv_path: Path, store_master: dict) -> list:
     if store_col and len(df) > 0:
         first_store = str(df[store_col].iloc[0])
         # diniiマッピングで検索
-        for dinii_name, code in mapping.get('dinii', {}).items():
-            if dinii_name in first_store or first_store in dinii_name:
-                if code in stores:
-                    store_code = code
-                    store_name = stores[code]['name']
-                    break
+        code, name = resolve_store(store_master, first_store, ('dinii',), fallback=False)
+        if code is not None:
+            store_code, store_name = code, name
         else:
             # フォールバック: キーワードで判定
             if '新橋' in first_store:
@@ -557,6 +637,10 @@ def convert_dinii_sales_csv(csv_path: Path, store_master: dict) -> list:
                 store_code = '4103'
                 store_name = stores.get('4103', {}).get('name', '魚ゑもん大井町店')
 
+    collect_daily_facts(csv_path, '売上分析_日別_*.csv', df,
+                        {'date': '日付', 'sales': '売上', 'customers': '客数', 'groups': '組数'},
+                        store_code, df['店舗名'] if '店舗名' in df.columns else '')
+
     # 日別データを月次集計
     df['日付'] = pd.to_datetime(df[date_col])
     df['年月'] = df['日付'].dt.strftime('%Y-%m')
@@ -566,7 +650,7 @@ def convert_dinii_sales_csv(csv_path: Path, store_master: dict) -> list:
 
         # 売上（diniiは税込みの可能性が高い）
         if '売上' in df.columns:
-            values = group['売上'].apply(parse_numeric).dropna()
+            values = parse_numeric(group['売上']).dropna()
             if len(values) > 0:
                 sales_incl_tax = values.sum()
                 # 税抜きに変換（10%税率）
@@ -574,13 +658,13 @@ def convert_dinii_sales_csv(csv_path: Path, store_master: dict) -> list:
 
         # 客数
         if '客数' in df.columns:
-            values = group['客数'].apply(parse_numeric).dropna()
+            values = parse_numeric(group['客数']).dropna()
             if len(values) > 0:
                 monthly_totals['客数'] = values.sum()
 
         # 組数
         if '組数' in df.columns:
-            values = group['組数'].apply(parse_numeric).dropna()
+            values = parse_numeric(group['組数']).dropna()
             if len(values) > 0:
                 monthly_totals['組数'] = values.sum()
 
@@ -612,38 +696,269 @@ def convert_dinii_sales_csv(csv_path: Path, store_master: dict) -> list:
     return records
 
 
-def process_all_pos_data(pos_folder: str, store_master: dict, output_path: str) -> pd.DataFrame:
-    """POS分析フォルダ内の全CSVを処理"""
+# ========== 変換結果キャッシュ ==========
+# ファイルごとの変換結果をローカルに保存し、変更のないCSVは再パースしない
+# マニフェスト（pos_manifest.json）には各CSVのサイズ・更新日時・md5だけを持ち、
+# 変換結果（レコード・日別ファクト・単品ファクト）はCSVごとに cache/pos_files/ に保存する
+# （変換したCSVの分だけ書き出し、マニフェストは履歴が増えても小さいまま）。
+# 変換ロジックを変更した場合は POS_CACHE_VERSION を上げてキャッシュを無効化する
+POS_CACHE_VERSION = 7
+POS_CACHE_FILENAME = 'pos_manifest.json'
+POS_CACHE_DIRNAME = 'pos_files'
+
+
+def get_store_master_hash(store_master: dict) -> str:
+    """店舗マスタの内容ハッシュ（マスタ変更時にキャッシュを無効化するため）"""
+    content = json.dumps(store_master, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+def load_pos_manifest(cache_path: Path, master_hash: str) -> dict:
+    """POS変換キャッシュのマニフェストを読み込み（バージョン・マスタ不一致なら空）"""
+    if cache_path.exists():
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == POS_CACHE_VERSION and manifest.get('master_hash') == master_hash:
+                return manifest.get('files', {})
+            print("[INFO] 店舗マスタまたは変換仕様が変わったためキャッシュを破棄")
+        except (OSError, ValueError) as e:
+            print(f"[WARN] キャッシュ読み込み失敗: {e}")
+    return {}
+
+
+def save_pos_manifest(cache_path: Path, master_hash: str, files: dict):
+    """POS変換キャッシュのマニフェストを保存"""
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        'version': POS_CACHE_VERSION,
+        'master_hash': master_hash,
+        'updated_at': datetime.now().isoformat(),
+        'files': files,
+    }
+    tmp_path = cache_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, cache_path)
+
+
+def pos_cache_file_name(cache_key: str) -> str:
+    """CSVごとの変換結果のファイル名（キー: サブフォルダ/ファイル名）"""
+    return hashlib.md5(cache_key.encode('utf-8')).hexdigest() + '.json'
+
+
+def load_pos_cache_file(cache_dir: Path, name: str) -> dict:
+    """CSVごとの変換結果を読み込み（なければ・読めなければNone）"""
+    if not name:
+        return None
+    try:
+        with open(cache_dir / name, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_pos_cache_file(cache_dir: Path, name: str, result: dict):
+    """CSVごとの変換結果を保存"""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_dir / name
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def prune_pos_cache_files(cache_dir: Path, names: set):
+    """マニフェストにないCSV（削除・改名されたもの）の変換結果を削除"""
+    if not cache_dir.exists():
+        return
+    for path in cache_dir.glob('*.json'):
+        if path.name not in names:
+            path.unlink(missing_ok=True)
+
+
+def lookup_pos_cache(csv_file: Path, entry: dict) -> dict:
+    """キャッシュエントリが有効ならファイル情報を返す（無効ならNone）
+
+    サイズ・更新日時が一致すれば内容ハッシュは計算しない。
+    更新日時だけ変わった場合（OneDrive同期等）は内容ハッシュで判定する。
+    """
+    stat = csv_file.stat()
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    if entry and entry.get('size') == signature['size'] and entry.get('mtime_ns') == signature['mtime_ns']:
+        return {**signature, 'md5': entry.get('md5')}
+
+    if not ensure_file_downloaded(str(csv_file)):
+        raise IOError(f"ファイルをダウンロードできません: {csv_file}")
+    signature['md5'] = file_md5(str(csv_file))
+
+    if entry and entry.get('md5') == signature['md5']:
+        return signature
+
+    return {**signature, 'stale': True}
+
+
+# サブフォルダ → (データ種別, 変換関数)
+# プロセスプールへ渡すため、変換関数はpickle可能なもの（モジュール関数/partial）に限る
+POS_SUBFOLDERS = {
+    'POS売上': ('pos_sales', convert_pos_sales_csv),
+    'POS単品売上': ('pos_items_sales', partial(convert_pos_items_csv, data_type='sales')),
+    'POS単品出数': ('pos_items_volume', partial(convert_pos_items_csv, data_type='volume')),
+    'fun売上': ('fun_sales', convert_fun_sales_csv),
+    'fun単品': ('fun_items', convert_fun_items_csv),
+    'dinii売上': ('dinii_sales', convert_dinii_sales_csv),
+}
+
+# ワーカープロセス内の店舗マスタ（initializerで1回だけ受け渡す）
+_WORKER_STORE_MASTER = None
+
+
+def _init_pos_worker(store_master: dict):
+    """ワーカープロセスの初期化"""
+    global _WORKER_STORE_MASTER
+    _WORKER_STORE_MASTER = store_master
+
+
+def run_converter(converter, csv_file: Path, store_master: dict) -> tuple:
+    """1ファイルを変換し、(レコード, 日別ファクト, 単品ファクト) を返す（該当しないファクトはNone）"""
+    try:
+        records = converter(csv_file, store_master)
+    finally:
+        daily = _DAILY_FACTS.pop(str(csv_file), None)
+        items = _ITEM_FACTS.pop(str(csv_file), None)
+    return records, daily, items
+
+
+def _convert_in_worker(converter, csv_file: Path) -> tuple:
+    """ワーカープロセスで1ファイルを変換"""
+    return run_converter(converter, csv_file, _WORKER_STORE_MASTER)
+
+
+def convert_pos_files(tasks: list, store_master: dict, jobs: int = 1) -> list:
+    """変換タスクを実行し、タスクと同じ順序で結果を返す
+
+    Args:
+        tasks: [(converter, csv_file), ...]
+        store_master: 店舗マスタ
+        jobs: 並列プロセス数（1なら逐次実行）
+
+    Returns:
+        [((records, daily, items), error), ...]（errorは例外、成功時None）
+    """
+    results = []
+    if jobs <= 1 or len(tasks) <= 1:
+        for converter, csv_file in tasks:
+            try:
+                results.append((run_converter(converter, csv_file, store_master), None))
+            except Exception as e:
+                results.append((None, e))
+        return results
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_pos_worker,
+                             initargs=(store_master,)) as executor:
+        futures = [executor.submit(_convert_in_worker, converter, csv_file) for converter, csv_file in tasks]
+        for future in futures:
+            try:
+                results.append((future.result(), None))
+            except Exception as e:
+                results.append((None, e))
+    return results
+
+
+def process_all_pos_data(pos_folder: str, store_master: dict, output_path: str,
+                         use_cache: bool = True, jobs: int = 1) -> pd.DataFrame:
+    """POS分析フォルダ内の全CSVを処理
+
+    Args:
+        pos_folder: POS分析フォルダ
+        store_master: 店舗マスタ
+        output_path: 出力先（変換キャッシュを output_path/cache、日別ファクトを output_path/pos_daily.npz、
+                     単品ファクトを output_path/pos_items.npz、ABC分類結果を output_path/pos_items_abc.json に保存）
+        use_cache: Falseなら全ファイルを再変換
+        jobs: CSV変換の並列プロセス数（1なら逐次実行）
+    """
     pos_folder = Path(pos_folder)
     all_records = []
 
-    subfolders = {
-        'POS売上': ('pos_sales', convert_pos_sales_csv),
-        'POS単品売上': ('pos_items_sales', lambda p, m: convert_pos_items_csv(p, m, 'sales')),
-        'POS単品出数': ('pos_items_volume', lambda p, m: convert_pos_items_csv(p, m, 'volume')),
-        'fun売上': ('fun_sales', convert_fun_sales_csv),
-        'fun単品': ('fun_items', convert_fun_items_csv),
-        'dinii売上': ('dinii_sales', convert_dinii_sales_csv),
-    }
+    cache_path = Path(output_path) / 'cache' / POS_CACHE_FILENAME
+    cache_dir = cache_path.parent / POS_CACHE_DIRNAME
+    master_hash = get_store_master_hash(store_master)
+    cached_files = load_pos_manifest(cache_path, master_hash) if use_cache else {}
 
-    for subfolder_name, (data_type, converter) in subfolders.items():
+    # 1. 対象ファイルを列挙し、キャッシュで解決できないものを変換タスクにする
+    # entries: [(cache_key, csv_file, file_info, 保存済みの変換結果 or None)]（列挙順 = マージ順）
+    entries = []
+    tasks = []
+    for subfolder_name, (data_type, converter) in POS_SUBFOLDERS.items():
         subfolder_path = pos_folder / subfolder_name
         if not subfolder_path.exists():
             print(f"[SKIP] フォルダなし: {subfolder_name}")
             continue
 
-        print(f"\n処理中: {subfolder_name}")
-        csv_files = list(subfolder_path.glob('*.csv'))
-        print(f"  ファイル数: {len(csv_files)}")
+        csv_files = sorted(subfolder_path.glob('*.csv'))
+        print(f"{subfolder_name}: {len(csv_files)}ファイル")
 
         for csv_file in csv_files:
+            cache_key = f"{subfolder_name}/{csv_file.name}"
             try:
-                records = converter(csv_file, store_master)
-                if records:
-                    all_records.extend(records)
-                    print(f"  -> {csv_file.name}: {len(records)}件")
+                entry = cached_files.get(cache_key)
+                file_info = lookup_pos_cache(csv_file, entry)
             except Exception as e:
                 print(f"  [ERROR] {csv_file.name}: {e}")
+                continue
+
+            # 変更のないCSVは保存済みの変換結果を読む（読めなければ再変換）
+            cached = None if file_info.pop('stale', False) else load_pos_cache_file(cache_dir, entry.get('cache'))
+            entries.append((cache_key, csv_file, file_info, cached))
+            if cached is None:
+                tasks.append((converter, csv_file))
+
+    # 2. 変換（--jobs指定時はプロセスプールで並列実行）
+    if tasks:
+        mode = f"{jobs}プロセス" if jobs > 1 else "逐次"
+        print(f"\n変換中: {len(tasks)}ファイル（{mode}）")
+    converted = iter(convert_pos_files(tasks, store_master, jobs))
+
+    # 3. 列挙順にマージ（drop_duplicates(keep='last')の結果が逐次実行と一致する）
+    new_files = {}
+    daily_facts = []
+    item_facts = []
+    for cache_key, csv_file, file_info, cached in entries:
+        name = pos_cache_file_name(cache_key)
+        if cached is None:
+            converted_file, error = next(converted)
+            if error is not None:
+                print(f"  [ERROR] {csv_file.name}: {error}")
+                continue
+            records, daily, items = converted_file
+            if records:
+                print(f"  -> {csv_file.name}: {len(records)}件")
+            if use_cache:
+                save_pos_cache_file(cache_dir, name, {'records': records, 'daily': daily, 'items': items})
+        else:
+            records, daily, items = cached['records'], cached.get('daily'), cached.get('items')
+        new_files[cache_key] = {**file_info, 'cache': name}
+        all_records.extend(records)
+        if daily:
+            daily_facts.append(daily)
+        if items:
+            item_facts.append(items)
+
+    print(f"\nキャッシュ: {len(entries) - len(tasks)}件再利用 / {len(tasks)}件変換")
+    if use_cache:
+        save_pos_manifest(cache_path, master_hash, new_files)
+        prune_pos_cache_files(cache_dir, {entry['cache'] for entry in new_files.values()})
+
+    # 日別ファクト（曜日別集計などで使う）
+    daily_path = Path(output_path) / DAILY_FACTS_FILENAME
+    print(f"日別ファクト: {save_daily_facts(daily_path, daily_facts)}行 -> {daily_path.name}")
+
+    # 単品ファクト（全商品・店舗×年月ごとのABC分類）と、ダッシュボード用のABC分類結果
+    items_path = Path(output_path) / ITEM_FACTS_FILENAME
+    item_rows, partitions = save_item_facts(items_path, item_facts)
+    print(f"単品ファクト: {item_rows}行・{partitions}パーティション -> {items_path.name}")
+    save_item_abc(Path(output_path) / ITEM_ABC_FILENAME, items_path)
 
     # DataFrame変換
     if not all_records:
@@ -663,14 +978,71 @@ def process_all_pos_data(pos_folder: str, store_master: dict, output_path: str)
     return df
 
 
+# ========== ABC分析結果（ダッシュボード用） ==========
+# 単品ファクトのABC分類を、店舗×年月ごとの「ランク別の商品ID（基準値の大きい順）」と構成比にまとめる。
+# 商品名は商品ID表（items）に1回だけ持ち、ダッシュボードは全商品の行を読まずに分類結果を表示する。
+ITEM_ABC_FILENAME = 'pos_items_abc.json'
+
+
+def save_item_abc(path: Path, items_path: Path) -> int:
+    """単品ファクトからABC分類結果のJSONを作成
+
+    Returns:
+        int: 店舗×年月の数
+    """
+    frame = load_item_facts(items_path)
+    if frame is None:
+        return 0
+
+    item_ids = frame['item'].cat.codes.to_numpy()
+    classes = frame['abc'].cat.codes.to_numpy()
+    basis_codes = frame['basis'].cat.codes.to_numpy()
+    basis_values = np.where(basis_codes == 0, frame['sales'].to_numpy(dtype=float),
+                            frame['quantity'].to_numpy(dtype=float))
+
+    # パーティション（店舗×年月）の境界
+    keys = frame['store_code'].cat.codes.to_numpy() * max(len(frame['yearmonth'].cat.categories), 1) \
+        + frame['yearmonth'].cat.codes.to_numpy()
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.array([], dtype=int)
+    ends = np.r_[starts[1:], len(keys)]
+
+    partitions = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        part_classes = classes[start:end]
+        weights = np.maximum(np.nan_to_num(basis_values[start:end]), 0)
+        total = weights.sum()
+        entry = {
+            '年月': frame['yearmonth'].iat[start],
+            '店舗コード': frame['store_code'].iat[start],
+            '店舗名': frame['store_name'].iat[start],
+            '基準': '売上' if basis_codes[start] == 0 else '出数',
+            '商品数': int((part_classes >= 0).sum()),
+        }
+        for index, name in enumerate(('A', 'B', 'C')):
+            in_class = part_classes == index
+            entry[name] = item_ids[start:end][in_class].tolist()
+            entry[f'{name}構成比'] = round(float(weights[in_class].sum() / total), 4) if total > 0 else 0.0
+        partitions.append(entry)
+
+    header = {
+        'generated_at': datetime.now().isoformat(),
+        'thresholds': list(ABC_THRESHOLDS),
+        'total_partitions': len(partitions),
+        'items': frame['item'].cat.categories.tolist(),
+    }
+    write_json_records(path, header, [partitions])
+    print(f"ABC分類: {len(partitions)}件（店舗×年月） -> {path.name}")
+    return len(partitions)
+
+
 def save_pos_data(df: pd.DataFrame, output_path: str, company_name: str, source_folder: str,
                   drive_folder_id: str = None):
     """POSデータを保存"""
     output_path = Path(output_path)
     output_path.mkdir(parents=True, exist_ok=True)
 
-    # JSON出力
-    json_data = {
+    # JSON出力（レコードは順次書き出し）
+    json_header = {
         'company_name': company_name,
         'generated_at': datetime.now().isoformat(),
         'format': 'long',
@@ -678,12 +1050,12 @@ def save_pos_data(df: pd.DataFrame, output_path: str, company_name: str, source_
         'total_records': len(df),
         'stores': df['店舗コード'].unique().tolist(),
         'yearmonths': sorted(df['年月'].unique().tolist()),
-        'data': df.to_dict(orient='records')
     }
 
     json_path = output_path / 'pos_data.json'
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(json_data, f, ensure_ascii=False, indent=2)
+    hasher = hashlib.md5()
+    write_json_records(json_path, json_header, iter_dataframe_records(df), indent=2, hasher=hasher)
+    publish_artifact(json_path, hasher.hexdigest(), json_header, df)
     print(f"\nJSON保存: {json_path}")
 
     # CSV出力
@@ -691,22 +1063,26 @@ def save_pos_data(df: pd.DataFrame, output_path: str, company_name: str, source_
     df.to_csv(csv_path, index=False, encoding='utf-8-sig')
     print(f"CSV保存: {csv_path}")
 
-    # Google Driveアップロード
+    # Google Driveアップロード（ローカル保存したファイルをそのまま送る）
     if drive_folder_id:
         print('\nGoogle Driveにアップロード中...')
         service = get_drive_service()
         if service:
-            json_content = json.dumps(json_data, ensure_ascii=False, indent=2).encode('utf-8')
-            upload_to_drive(service, json_content, 'pos_data.json', drive_folder_id, 'application/json')
-
-            csv_content = df.to_csv(index=False, encoding='utf-8-sig').encode('utf-8-sig')
-            upload_to_drive(service, csv_content, 'pos_data.csv', drive_folder_id, 'text/csv')
+            upload_file_to_drive(service, json_path, 'pos_data.json', drive_folder_id, 'application/json')
+            upload_file_to_drive(service, csv_path, 'pos_data.csv', drive_folder_id, 'text/csv')
+            abc_path = output_path / ITEM_ABC_FILENAME
+            if abc_path.exists():
+                upload_file_to_drive(service, abc_path, ITEM_ABC_FILENAME, drive_folder_id, 'application/json')
         else:
             print('[WARN] Google Drive APIが利用できません')
 
 
-def main():
-    """メイン処理"""
+def main(jobs: int = 1):
+    """メイン処理
+
+    Args:
+        jobs: CSV変換の並列プロセス数（1なら逐次実行）
+    """
     # パス設定
     script_dir = Path(__file__).parent
     project_dir = script_dir.parent
@@ -722,7 +1098,7 @@ def main():
     print(f"店舗マスタ読み込み: {len(store_master['stores'])}店舗")
 
     # POSデータフォルダ
-    pos_folder = r"c:\Users\yasuh\OneDrive - 株式会社日本コンサルタントグループ　\MyDocuments\00_Junes\2026年10月期_データ\POS分析"
+    pos_folder = str(POS_FOLDER)
 
     # 出力先
     output_path = project_dir / 'data' / 'junestory'
@@ -734,7 +1110,7 @@ def main():
 
     # 変換実行
     print("\n========== POS データ変換開始 ==========")
-    df = process_all_pos_data(pos_folder, store_master, str(output_path))
+    df = process_all_pos_data(pos_folder, store_master, str(output_path), jobs=jobs)
 
     if len(df) > 0:
         # 保存
@@ -754,11 +1130,8 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
-
-    # 次のスクリプトを自動実行
-    print("\n" + "=" * 50)
-    print("続けて PL データ変換を実行...")
-    print("=" * 50 + "\n")
-    from convert_junestory_pl import main as pl_main
-    pl_main()
+    parser = argparse.ArgumentParser(description='ジュネストリーPOSデータ変換')
+    parser.add_argument('--jobs', type=int, default=1, help='CSV変換の並列プロセス数（既定: 1）')
+    args = parser.parse_args()
+    main(jobs=args.jobs)
+    print_upload_summary()
@@ -14,7 +14,11 @@ from datetime import datetime
 import json
 import os
 import base64
+import codecs
+import hashlib
 import time
+import random
+import threading
 import subprocess
 from io import BytesIO
 
@@ -59,11 +63,339 @@ def ensure_file_downloaded(file_path: str, max_retries: int = 3) -> bool:
                 return False
     return False
 
+
+def file_md5(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """ファイル内容のMD5ハッシュ（16進文字列）を計算"""
+    h = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+# ========== JSON書き出し（ストリーミング） ==========
+# {...ヘッダー, 'data': [レコード...]} 形式の出力を、レコード全件のdictやJSON文字列を
+# 一度に作らずに書き出す。出力バイト列は json.dump() と同じ。
+
+def iter_dataframe_records(df: pd.DataFrame, chunk_size: int = 10000):
+    """DataFrameを df.to_dict(orient='records') 形式のチャンクに分けて返す"""
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size].to_dict(orient='records')
+
+
+def write_json_records(file_path, header: dict, record_chunks, indent: int = None, hasher=None) -> int:
+    """{**header, 'data': [レコード...]} をレコードのチャンクごとにJSONファイルへ書き出す
+
+    Args:
+        file_path: 出力先
+        header: 'data' より前に出力するキー
+        record_chunks: レコード（dict）のリストを順に返すイテラブル
+        indent: None なら json.dump(separators=(',', ':')) と、
+                数値なら json.dump(indent=indent) と同じ形式
+        hasher: 指定時は書き出したバイト列で update する（例: hashlib.md5()）
+
+    Returns:
+        int: 書き出したレコード数
+    """
+    pad = ' ' * indent if indent is not None else ''
+    if indent is None:
+        head = json.dumps(header, ensure_ascii=False, separators=(',', ':'))
+        opening = head[:-1] + (',' if header else '') + '"data":['
+    else:
+        head = json.dumps(header, ensure_ascii=False, indent=indent)
+        opening = (head[:-2] + ',\n' if header else '{\n') + pad + '"data": ['
+
+    count = 0
+    # 改行はOSによらず \n（ハッシュとディスク上のバイト列を一致させる）
+    with open(file_path, 'w', encoding='utf-8', newline='') as out:
+        def write(text):
+            out.write(text)
+            if hasher is not None:
+                hasher.update(text.encode('utf-8'))
+
+        write(opening)
+        for records in record_chunks:
+            if not records:
+                continue
+            if indent is None:
+                text = json.dumps(records, ensure_ascii=False, separators=(',', ':'))[1:-1]
+            else:
+                # 配列の中身を1段深くインデント（文字列中の改行は \n にエスケープされるため行単位で安全）
+                text = json.dumps(records, ensure_ascii=False, indent=indent)[2:-2]
+                text = '\n' + pad + text.replace('\n', '\n' + pad)
+            write((',' if count else '') + text)
+            count += len(records)
+        if indent is None:
+            write(']}')
+        else:
+            write(('\n' + pad if count else '') + ']\n}')
+    return count
+
+
+# ========== 文字コード判定 ==========
+# CSVの文字コードを BOM → UTF-8（厳密にデコードできるか）→ cp932 → chardet の順で判定する。
+# chardet はデコードに失敗した部分で判定し、UTF-8 / cp932 と判定された場合は判定できなかったものとする。
+# 判定結果はフォルダ・ファイル名・サイズ・更新日時ごとに保持し、同じファイルは再判定しない。
+
+# chardet（オプション: UTF-8 / cp932 のどちらでもない場合のみ使用）
+try:
+    import chardet
+    CHARDET_AVAILABLE = True
+except ImportError:
+    CHARDET_AVAILABLE = False
+
+ENCODING_CACHE = {}   # { フォルダ: { ファイル名: (サイズ, 更新日時ns, エンコーディング) } }
+_ENCODING_CACHE_LOCK = threading.Lock()
+
+
+# 厳密にデコードを試す文字コード（デコードに使う名前, 判定結果として返す名前）
+STRICT_ENCODINGS = (('utf-8', 'utf-8-sig'), ('cp932', 'cp932'))
+
+
+def _chardet_encoding(raw: bytes) -> str:
+    """厳密にデコードできなかった部分から chardet で文字コードを推定
+
+    UTF-8 / cp932（およびその部分集合）と判定された場合は、すでにデコードに失敗しているためNone。
+    判定結果でもその部分をデコードできない場合もNone。
+    """
+    if not CHARDET_AVAILABLE or not raw:
+        return None
+    raw = raw[:100000]
+    detected = chardet.detect(raw).get('encoding')
+    if not detected:
+        return None
+    try:
+        name = codecs.lookup(detected).name
+    except LookupError:
+        return None
+    if name in ('utf-8', 'cp932', 'shift_jis', 'ascii'):
+        return None
+    try:
+        codecs.getincrementaldecoder(name)().decode(raw)
+    except UnicodeDecodeError:
+        return None
+    return detected
+
+
+def detect_bytes_encoding(raw: bytes) -> str:
+    """バイト列の文字コードを判定（判定できなければNone）"""
+    if raw.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    failed_at = 0
+    for encoding, name in STRICT_ENCODINGS:
+        try:
+            raw.decode(encoding)
+            return name
+        except UnicodeDecodeError as e:
+            failed_at = e.start
+    return _chardet_encoding(raw[max(0, failed_at - 50000):failed_at + 50000])
+
+
+def detect_file_encoding(file_path, block_size: int = 1024 * 1024) -> str:
+    """ファイルの文字コードを判定（ファイル全体をメモリに載せずにブロック単位で判定）
+
+    BOM → UTF-8 → cp932 を厳密に試し、どちらもデコードできなければ、最後にデコードに失敗した
+    箇所の前後を chardet で判定する（判定できなければNone。呼び出し側は cp932 + 置換文字で読む）。
+    """
+    decoders = [(codecs.getincrementaldecoder(encoding)(), name) for encoding, name in STRICT_ENCODINGS]
+    failed_block = previous = b''
+    with open(file_path, 'rb') as f:
+        block = f.read(100000)
+        if block.startswith(b'\xef\xbb\xbf'):
+            return 'utf-8-sig'
+        while decoders:
+            for decoder, name in list(decoders):
+                try:
+                    decoder.decode(block, final=not block)
+                except UnicodeDecodeError as e:
+                    decoders.remove((decoder, name))
+                    if block:
+                        failed_block = block[max(0, e.start - 50000):e.start + 50000]
+                    else:
+                        failed_block = previous[-50000:]   # 末尾で文字が途切れた場合は直前のブロックの末尾
+            if not block:
+                break
+            previous, block = block, f.read(block_size)
+    if decoders:
+        return decoders[0][1]
+    return _chardet_encoding(failed_block)
+
+
+def resolve_encoding(file_path, raw: bytes = None) -> str:
+    """ファイルの文字コードを判定（判定済みのファイルはキャッシュから返す）
+
+    Args:
+        raw: 読み込み済みのファイル内容（指定時はファイルを読まない。未指定時はブロック単位で判定）
+    """
+    path = Path(file_path)
+    stat = path.stat()
+    folder = str(path.parent)
+    with _ENCODING_CACHE_LOCK:
+        cached = ENCODING_CACHE.get(folder, {}).get(path.name)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+
+    encoding = detect_file_encoding(path) if raw is None else detect_bytes_encoding(raw)
+    with _ENCODING_CACHE_LOCK:
+        ENCODING_CACHE.setdefault(folder, {})[path.name] = (stat.st_size, stat.st_mtime_ns, encoding)
+    return encoding
+
+
+def read_csv_auto(csv_path, **kwargs) -> pd.DataFrame:
+    """文字コードを判定してCSVを読み込み（ファイルの読み込み・パースは1回）"""
+    with open(csv_path, 'rb') as f:
+        raw = f.read()
+    encoding = resolve_encoding(csv_path, raw)
+    if encoding is None:
+        print(f'[WARN] 文字コードを判定できません（cp932として読み込み）: {Path(csv_path).name}')
+        return pd.read_csv(BytesIO(raw), encoding='cp932', encoding_errors='replace', **kwargs)
+    return pd.read_csv(BytesIO(raw), encoding=encoding, **kwargs)
+
+
+def _csv_encoding_options(csv_path) -> dict:
+    encoding = resolve_encoding(csv_path)
+    if encoding is None:
+        print(f'[WARN] 文字コードを判定できません（cp932として読み込み）: {Path(csv_path).name}')
+        return {'encoding': 'cp932', 'encoding_errors': 'replace'}
+    return {'encoding': encoding}
+
+
+def read_csv_columns(csv_path, **kwargs) -> list:
+    """文字コードを判定してCSVのヘッダー（カラム名）だけを読み込み"""
+    return pd.read_csv(csv_path, nrows=0, **_csv_encoding_options(csv_path), **kwargs).columns.tolist()
+
+
+def read_csv_chunks(csv_path, chunksize: int, **kwargs):
+    """文字コードを判定してCSVを chunksize 行ずつ読み込む（ファイル全体をメモリに載せない）
+
+    Yields:
+        DataFrame: 各チャンク（kwargs は pd.read_csv にそのまま渡す。usecols で列を絞れる）
+    """
+    with pd.read_csv(csv_path, chunksize=chunksize, **_csv_encoding_options(csv_path), **kwargs) as reader:
+        yield from reader
+
+
+# ========== 数値列のパース（列単位） ==========
+# CSVの数値列（"1,234" / "¥1,234" / "(1,234)" / "△1,234" など）を列ごとにまとめて数値化する。
+# 各値の結果はセル単位で float() していた従来の処理と同じ（数値化できない値は default）。
+
+# 数値にならない表記（float() に渡さずに default とする）
+NUMERIC_BLANKS = frozenset(['', '-', '－', '―', '−', '*', '***'])
+
+
+def _parse_numeric_scalar(value, remove_chars, negative_markers, default, bools_as_numbers):
+    """parse_numeric_column の1セル版（文字列と数値が混在する列用）"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return default
+    if isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)):
+        return float(value)
+    if isinstance(value, (bool, np.bool_)) and bools_as_numbers:
+        return float(value)
+    s = str(value).strip()
+    negative = False
+    if negative_markers:
+        if s.startswith('(') and s.endswith(')'):
+            negative, s = True, s[1:-1]
+        elif s.startswith('△') or s.startswith('▲'):
+            negative, s = True, s[1:]
+    for ch in remove_chars:
+        s = s.replace(ch, '')
+    try:
+        result = float(s)
+    except ValueError:
+        return default
+    return -result if negative else result
+
+
+def _strings_to_float(texts: np.ndarray, default: float) -> np.ndarray:
+    """文字列配列を float() と同じ規則で数値化（できない値は default）"""
+    result = np.full(len(texts), default, dtype=float)
+    candidates = ~pd.Series(texts, dtype=object).isin(NUMERIC_BLANKS).to_numpy()
+    try:
+        result[candidates] = texts[candidates].astype(float)
+    except (ValueError, TypeError):
+        # 数値化できない値が混ざっている場合だけ1件ずつ変換
+        for i in np.flatnonzero(candidates):
+            try:
+                result[i] = float(texts[i])
+            except ValueError:
+                pass
+    return result
+
+
+def parse_numeric_column(values, remove_chars=('\\', '¥', '￥', ','), negative_markers: bool = False,
+                         default: float = np.nan, bools_as_numbers: bool = True) -> np.ndarray:
+    """数値列をまとめてパース
+
+    Args:
+        values: Series または配列（文字列・数値・欠損が混在してよい）
+        remove_chars: 数値化の前に取り除く文字（円記号・カンマなど）
+        negative_markers: Trueなら "(123)" と "△123" / "▲123" を負数にする
+        default: 欠損・数値化できない値の結果
+        bools_as_numbers: Falseなら True/False を数値化できない値として扱う
+
+    Returns:
+        np.ndarray: float64の配列
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values, dtype=object)
+    if len(series) == 0:
+        return np.empty(0, dtype=float)
+
+    if pd.api.types.is_bool_dtype(series.dtype):
+        if bools_as_numbers:
+            return series.to_numpy(dtype=float, na_value=default)
+        return np.full(len(series), default, dtype=float)
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.to_numpy(dtype=float, na_value=default)
+
+    if pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+        # 文字列と数値が混在する列
+        return np.array([_parse_numeric_scalar(v, remove_chars, negative_markers, default, bools_as_numbers)
+                         for v in series.tolist()], dtype=float)
+
+    missing = series.isna().to_numpy()
+    text = series.astype(object).where(~missing, '').str.strip()
+    negative = None
+    if negative_markers:
+        paren = (text.str.startswith('(') & text.str.endswith(')')).to_numpy()
+        triangle = ~paren & text.str.startswith(('△', '▲')).to_numpy()
+        text = text.mask(paren, text.str[1:-1]).mask(triangle, text.str[1:])
+        negative = paren | triangle
+    for ch in remove_chars:
+        text = text.str.replace(ch, '', regex=False)
+
+    result = _strings_to_float(text.to_numpy(dtype=object), default)
+    if negative is not None:
+        result = np.where(negative, -result, result)
+    result[missing] = default
+    return result
+
+
+def parse_numeric_frame(df: pd.DataFrame, **options) -> np.ndarray:
+    """DataFrameの全列をパースして 行 × 列 の配列で返す（options は parse_numeric_column と同じ）
+
+    数値型の列はそのまま変換し、文字列の列は 行 × 列 の順に1列へ並べて1回でパースする。
+    行数が少なく列数が多い表（部門別の損益表など）で、列ごとの呼び出しコストを避けるため。
+    """
+    result = np.empty((len(df), len(df.columns)), dtype=float)
+    text_positions = []
+    for j, dtype in enumerate(df.dtypes.tolist()):
+        if pd.api.types.is_numeric_dtype(dtype):
+            result[:, j] = parse_numeric_column(df.iloc[:, j], **options)
+        else:
+            text_positions.append(j)
+
+    if text_positions and len(df) > 0:
+        cells = df.iloc[:, text_positions].to_numpy(dtype=object).ravel()
+        parsed = parse_numeric_column(pd.Series(cells, dtype=object), **options)
+        result[:, text_positions] = parsed.reshape(len(df), len(text_positions))
+    return result
+
+
 # Google Drive API（オプション）
 try:
     from google.oauth2 import service_account
     from googleapiclient.discovery import build
-    from googleapiclient.http import MediaIoBaseUpload
+    from googleapiclient.http import MediaIoBaseUpload, MediaFileUpload
     GOOGLE_API_AVAILABLE = True
 except ImportError:
     GOOGLE_API_AVAILABLE = False
@@ -133,45 +465,397 @@ def get_drive_service():
         return None
 
 
+# ========== Drive API呼び出し（AIMD同時実行制御・リトライ） ==========
+# すべてのDrive API呼び出しを drive_execute / drive_call 経由にし、
+# 429 / 403 rateLimitExceeded を受けたら同時実行数を半減（Retry-After があればその間は全体で待機）、
+# 成功が続けば同時実行数を1ずつ戻す（AIMD）。5xx・通信エラーは指数バックオフでリトライする。
+
+DRIVE_MAX_RETRIES = 6
+DRIVE_MAX_BACKOFF_SEC = 32
+DRIVE_CONCURRENCY = {'initial': 4, 'min': 1, 'max': 16}
+
+# throttle_sec: 同時実行上限・Retry-After・レート制限時のバックオフで待った合計秒数（全スレッドの合計）
+DRIVE_STATS = {'requests': 0, 'retries': 0, 'throttled': 0, 'throttle_sec': 0.0, 'failures': 0}
+
+_DRIVE_LIMITER = {
+    'limit': float(DRIVE_CONCURRENCY['initial']),  # 同時実行数の上限（AIMDで増減）
+    'in_flight': 0,
+    'resume_at': 0.0,        # Retry-After による全体の待機終了時刻
+    'decreased_at': 0.0,     # 直近に上限を下げた時刻（同じバーストの429で何度も下げない）
+    'cond': threading.Condition(),
+}
+
+_RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+_TRANSIENT_STATUSES = (500, 502, 503, 504)
+
+
+def classify_drive_error(e: Exception) -> tuple:
+    """Drive APIの例外を分類
+
+    Returns:
+        tuple: ('throttle' | 'transient' | 'fatal', Retry-After秒 or None)
+    """
+    resp = getattr(e, 'resp', None)
+    status = getattr(resp, 'status', None)
+    if status is None:
+        # HttpError以外の通信エラー（タイムアウト・接続切断など）
+        import ssl
+        import http.client
+        network_errors = (ConnectionError, TimeoutError, ssl.SSLError, http.client.HTTPException)
+        return ('transient' if isinstance(e, network_errors) else 'fatal'), None
+
+    retry_after = None
+    try:
+        retry_after = float(resp.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        pass
+
+    status = int(status)
+    content = getattr(e, 'content', b'') or b''
+    if isinstance(content, bytes):
+        content = content.decode('utf-8', errors='replace')
+    if status == 429 or (status == 403 and any(reason in content for reason in _RATE_LIMIT_REASONS)):
+        return 'throttle', retry_after
+    if status in _TRANSIENT_STATUSES:
+        return 'transient', retry_after
+    return 'fatal', None
+
+
+def _acquire_drive_slot():
+    """同時実行数の上限と Retry-After の待機が空くまで待つ（待機時間を返す）"""
+    limiter = _DRIVE_LIMITER
+    waited = 0.0
+    with limiter['cond']:
+        while True:
+            now = time.monotonic()
+            if now < limiter['resume_at']:
+                wait = limiter['resume_at'] - now
+            elif limiter['in_flight'] < int(limiter['limit']):
+                limiter['in_flight'] += 1
+                return waited
+            else:
+                wait = None
+            started = time.monotonic()
+            limiter['cond'].wait(wait)
+            waited += time.monotonic() - started
+
+
+def _release_drive_slot(outcome: str, pause: float = 0.0):
+    """呼び出し結果に応じて同時実行数の上限を調整（success: 加算増加 / throttle: 乗算減少）
+
+    pause: 指定秒数、全スレッドの呼び出し開始を止める（Retry-After）
+    """
+    limiter = _DRIVE_LIMITER
+    with limiter['cond']:
+        limiter['in_flight'] -= 1
+        now = time.monotonic()
+        if outcome == 'success':
+            limiter['limit'] = min(DRIVE_CONCURRENCY['max'], limiter['limit'] + 1 / limiter['limit'])
+        elif outcome == 'throttle':
+            if now - limiter['decreased_at'] >= 1.0:
+                limiter['limit'] = max(DRIVE_CONCURRENCY['min'], limiter['limit'] / 2)
+                limiter['decreased_at'] = now
+        if pause:
+            limiter['resume_at'] = max(limiter['resume_at'], now + pause)
+        limiter['cond'].notify_all()
+
+
+def _record_drive_stat(key: str, amount=1):
+    with _DRIVE_LIMITER['cond']:
+        DRIVE_STATS[key] += amount
+
+
+def drive_call(func, *args, max_retries: int = None, **kwargs):
+    """Drive APIを呼び出す関数（request.execute・downloader.next_chunk など）を
+    同時実行制御・リトライ付きで実行"""
+    max_retries = DRIVE_MAX_RETRIES if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        waited = _acquire_drive_slot()
+        if waited:
+            _record_drive_stat('throttle_sec', waited)
+        _record_drive_stat('requests')
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            kind, retry_after = classify_drive_error(e)
+            if kind == 'fatal' or attempt >= max_retries:
+                _release_drive_slot('failure')
+                _record_drive_stat('failures')
+                raise
+            attempt += 1
+            _record_drive_stat('retries')
+            if kind == 'throttle':
+                _record_drive_stat('throttled')
+            if retry_after is not None:
+                # Retry-After はクォータ全体の指示なので、全スレッドの呼び出し開始を止める
+                _release_drive_slot(kind, pause=retry_after)
+                continue
+            # 指数バックオフ（ジッター付き）はこの呼び出しだけが待つ
+            _release_drive_slot(kind)
+            backoff = min(2 ** (attempt - 1), DRIVE_MAX_BACKOFF_SEC) * (0.5 + random.random() / 2)
+            if kind == 'throttle':
+                _record_drive_stat('throttle_sec', backoff)
+            time.sleep(backoff)
+            continue
+        _release_drive_slot('success')
+        return result
+
+
+def drive_execute(request, max_retries: int = None):
+    """Drive APIリクエストを同時実行制御・リトライ付きで実行（request.execute() の代わり）"""
+    return drive_call(request.execute, max_retries=max_retries)
+
+
+def drive_download(request) -> bytes:
+    """get_media / export_media のリクエストをチャンク単位でダウンロード（チャンクごとにリトライ）"""
+    from googleapiclient.http import MediaIoBaseDownload
+
+    fh = BytesIO()
+    downloader = MediaIoBaseDownload(fh, request)
+    done = False
+    while not done:
+        _, done = drive_call(downloader.next_chunk)
+    return fh.getvalue()
+
+
+def print_drive_api_summary():
+    """Drive API呼び出し実績（リクエスト数・リトライ・レート制限による待機）を表示"""
+    with _DRIVE_LIMITER['cond']:
+        stats = dict(DRIVE_STATS)
+        limit = _DRIVE_LIMITER['limit']
+    if not stats['requests']:
+        return
+    print(f"[INFO] Drive API: {stats['requests']}リクエスト / リトライ{stats['retries']}回"
+          f"（レート制限{stats['throttled']}回・待機{stats['throttle_sec']:.1f}秒） / "
+          f"失敗{stats['failures']}件 / 同時実行上限{int(limit)}")
+
+
+# ========== アップロードの重複スキップ ==========
+# Drive上の同名ファイルの md5Checksum（既存ファイル検索の files().list で一緒に取得）が
+# ローカルの内容と一致する場合はアップロードしない
+
+# resumable upload の1リクエストあたりの送信サイズ（googleapiclientの既定値）
+RESUMABLE_CHUNK_SIZE = 100 * 1024 * 1024
+
+UPLOAD_STATS = {'uploaded': 0, 'skipped': 0, 'bytes_sent': 0, 'bytes_saved': 0, 'requests_saved': 0}
+_UPLOAD_STATS_LOCK = threading.Lock()
+
+
+def find_drive_file(service, filename: str, folder_id: str) -> dict:
+    """フォルダ内の同名ファイルを検索（なければNone）
+
+    Returns:
+        dict: {'id', 'md5Checksum', 'size'}（Googleドキュメント形式はmd5Checksumなし）
+    """
+    query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
+    results = drive_execute(service.files().list(
+        q=query,
+        fields='files(id, md5Checksum, size)',
+        supportsAllDrives=True,
+        includeItemsFromAllDrives=True
+    ))
+    files = results.get('files', [])
+    return files[0] if files else None
+
+
+def is_same_on_drive(existing: dict, local_md5: str) -> bool:
+    """Drive上のファイルがローカルと同じ内容ならTrue"""
+    return bool(existing) and existing.get('md5Checksum') == local_md5
+
+
+def upload_request_count(size: int, resumable: bool) -> int:
+    """1ファイルのアップロードに必要なリクエスト数（resumableは開始 + チャンク数）"""
+    if not resumable:
+        return 1
+    return 1 + max(1, -(-size // RESUMABLE_CHUNK_SIZE))
+
+
+def record_upload(size: int, skipped: bool, requests: int = 1):
+    """アップロード実績を集計（スキップ時は削減できたバイト数・リクエスト数）"""
+    with _UPLOAD_STATS_LOCK:
+        if skipped:
+            UPLOAD_STATS['skipped'] += 1
+            UPLOAD_STATS['bytes_saved'] += size
+            UPLOAD_STATS['requests_saved'] += requests
+        else:
+            UPLOAD_STATS['uploaded'] += 1
+            UPLOAD_STATS['bytes_sent'] += size
+
+
+def print_upload_summary():
+    """アップロード実績（送信・変更なしでスキップ）とDrive API呼び出し実績を表示"""
+    print_drive_api_summary()
+    stats = dict(UPLOAD_STATS)
+    if not stats['uploaded'] and not stats['skipped']:
+        return
+    print(f"[INFO] Driveアップロード: {stats['uploaded']}件送信 ({stats['bytes_sent'] / 1024 / 1024:.1f} MB) / "
+          f"{stats['skipped']}件スキップ（変更なし: {stats['bytes_saved'] / 1024 / 1024:.1f} MB・"
+          f"{stats['requests_saved']}リクエスト削減）")
+
+
 def upload_to_drive(service, file_content: bytes, filename: str, folder_id: str, mime_type: str) -> str:
-    """ファイルをGoogle Driveにアップロード（既存ファイルは上書き）"""
+    """ファイルをGoogle Driveにアップロード（既存ファイルは上書き、同じ内容ならスキップ）"""
     if not service:
         return None
+    media = MediaIoBaseUpload(BytesIO(file_content), mimetype=mime_type, resumable=True)
+    return _upload_media(service, media, filename, folder_id, hashlib.md5(file_content).hexdigest(), len(file_content))
+
+
+def upload_file_to_drive(service, file_path, filename: str, folder_id: str, mime_type: str) -> str:
+    """ローカルファイルをそのままGoogle Driveにアップロード（既存ファイルは上書き、同じ内容ならスキップ）
 
+    ローカル保存したバイト列をディスクから分割送信するため、内容をメモリに載せ直さない。
+    """
+    if not service:
+        return None
+    media = MediaFileUpload(str(file_path), mimetype=mime_type, resumable=True)
+    return _upload_media(service, media, filename, folder_id, file_md5(file_path), os.path.getsize(file_path))
+
+
+def _upload_media(service, media, filename: str, folder_id: str, local_md5: str, size: int) -> str:
+    """同名ファイルがあれば更新、なければ作成"""
     try:
-        query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
-        results = service.files().list(q=query, fields="files(id)", supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-        existing_files = results.get('files', [])
+        existing = find_drive_file(service, filename, folder_id)
 
-        media = MediaIoBaseUpload(BytesIO(file_content), mimetype=mime_type, resumable=True)
+        if is_same_on_drive(existing, local_md5):
+            record_upload(size, skipped=True, requests=upload_request_count(size, resumable=True))
+            print(f'  -> 変更なし（スキップ）: {filename}')
+            return existing['id']
 
-        if existing_files:
-            file_id = existing_files[0]['id']
-            file = service.files().update(
+        if existing:
+            file_id = existing['id']
+            file = drive_execute(service.files().update(
                 fileId=file_id,
                 media_body=media,
                 supportsAllDrives=True
-            ).execute()
+            ))
             print(f'  -> Drive更新: {filename} (ID: {file_id})')
         else:
             file_metadata = {
                 'name': filename,
                 'parents': [folder_id]
             }
-            file = service.files().create(
+            file = drive_execute(service.files().create(
                 body=file_metadata,
                 media_body=media,
                 fields='id',
                 supportsAllDrives=True
-            ).execute()
+            ))
             print(f'  -> Driveアップロード: {filename} (ID: {file.get("id")})')
 
+        record_upload(size, skipped=False)
         return file.get('id')
     except Exception as e:
         print(f'[ERROR] アップロード失敗 ({filename}): {e}')
         return None
 
 
+# ========== 一括アップロード（並列・レート制限付き） ==========
+# 多数の小さいファイルを、フォルダ一覧1回 + 複数ワーカー + トークンバケットでアップロードする
+
+def list_drive_folder(service, folder_id: str) -> dict:
+    """フォルダ内のファイル一覧を取得
+
+    Returns:
+        dict: { ファイル名: {'id', 'md5Checksum', 'size'} }（同名が複数あれば最初のもの）
+    """
+    files = {}
+    page_token = None
+    while True:
+        results = drive_execute(service.files().list(
+            q=f"'{folder_id}' in parents and trashed=false",
+            fields='nextPageToken, files(id, name, md5Checksum, size)',
+            pageSize=1000,
+            pageToken=page_token,
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True
+        ))
+        for f in results.get('files', []):
+            files.setdefault(f['name'], f)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return files
+
+
+def create_token_bucket(rate: float, capacity: int) -> dict:
+    """トークンバケット（rate: 1秒あたりの補充数, capacity: 最大トークン数）"""
+    return {'rate': rate, 'capacity': capacity, 'tokens': float(capacity),
+            'updated': time.monotonic(), 'lock': threading.Lock()}
+
+
+def acquire_token(bucket: dict):
+    """トークンを1つ取得（なければ補充されるまで待つ）"""
+    while True:
+        with bucket['lock']:
+            now = time.monotonic()
+            bucket['tokens'] = min(bucket['capacity'], bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+            bucket['updated'] = now
+            if bucket['tokens'] >= 1:
+                bucket['tokens'] -= 1
+                return
+            wait = (1 - bucket['tokens']) / bucket['rate']
+        time.sleep(wait)
+
+
+def upload_files_concurrently(service, items: list, folder_id: str, workers: int = 4,
+                              rate: float = 3.0) -> dict:
+    """ローカルファイルをまとめてGoogle Driveにアップロード（既存は上書き、同じ内容はスキップ）
+
+    Args:
+        service: フォルダ一覧の取得に使うDriveサービス
+        items: [{'path', 'filename', 'md5', 'size', 'mime_type'}, ...]
+               （'content' にファイル内容を指定した項目はファイルを読まずにその内容を送る）
+        workers: 同時アップロード数（ワーカーごとにDriveサービスを作る）
+        rate: 1秒あたりのアップロード開始数の上限
+
+    Returns:
+        dict: { ファイル名: 'uploaded' | 'skipped' | 'failed' }
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    existing = list_drive_folder(service, folder_id)
+    results = {}
+    pending = []
+    for item in items:
+        if is_same_on_drive(existing.get(item['filename']), item['md5']):
+            record_upload(item['size'], skipped=True)
+            results[item['filename']] = 'skipped'
+        else:
+            pending.append(item)
+
+    bucket = create_token_bucket(rate, capacity=max(1, workers))
+    local = threading.local()
+
+    def upload(item):
+        # googleapiclientのサービスはスレッドセーフではないため、ワーカーごとに作る
+        if not hasattr(local, 'service'):
+            local.service = get_drive_service()
+        current = existing.get(item['filename'])
+        acquire_token(bucket)
+        try:
+            # md5は書き出し時に計算済みのため、ファイルはアップロード時に1回だけ読む（読み込み済みの内容があればそれを送る）
+            # リトライ・レート制限時の同時実行数の調整は drive_execute が行う
+            content = item.get('content')
+            with (BytesIO(content) if content is not None else open(item['path'], 'rb')) as stream:
+                media = MediaIoBaseUpload(stream, mimetype=item['mime_type'])
+                if current:
+                    drive_execute(local.service.files().update(fileId=current['id'], media_body=media, supportsAllDrives=True))
+                else:
+                    file_metadata = {'name': item['filename'], 'parents': [folder_id]}
+                    drive_execute(local.service.files().create(body=file_metadata, media_body=media, fields='id', supportsAllDrives=True))
+        except Exception as e:
+            print(f'[ERROR] アップロード失敗 ({item["filename"]}): {e}')
+            return 'failed'
+        record_upload(item['size'], skipped=False)
+        return 'uploaded'
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for item, status in zip(pending, executor.map(upload, pending)):
+            results[item['filename']] = status
+    return results
+
+
 def find_folder_by_name(service, folder_name: str, parent_id: str) -> str:
     """親フォルダ内でフォルダ名を検索してIDを返す"""
     if not service:
@@ -179,12 +863,12 @@ def find_folder_by_name(service, folder_name: str, parent_id: str) -> str:
 
     try:
         query = f"name='{folder_name}' and '{parent_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        results = service.files().list(
+        results = drive_execute(service.files().list(
             q=query,
             fields="files(id, name)",
             supportsAllDrives=True,
             includeItemsFromAllDrives=True
-        ).execute()
+        ))
         files = results.get('files', [])
 
         if files:
@@ -196,19 +880,22 @@ def find_folder_by_name(service, folder_name: str, parent_id: str) -> str:
 
 
 def download_file_from_drive(service, file_id: str) -> bytes:
-    """Google DriveからファイルIDでファイルをダウンロード"""
+    """Google DriveからファイルIDでファイルをダウンロード（先読み済みならその内容を返す）"""
+    with _DRIVE_PREFETCH_LOCK:
+        content = _DRIVE_PREFETCH['content'].pop(file_id, None)
+    if content is not None:
+        return content
+
     if not service:
         return None
 
     try:
-        from googleapiclient.http import MediaIoBaseDownload
-
         # ファイルメタデータ取得
-        meta = service.files().get(
+        meta = drive_execute(service.files().get(
             fileId=file_id,
             fields='name,mimeType',
             supportsAllDrives=True
-        ).execute()
+        ))
 
         # スプレッドシートの場合はCSVでエクスポート
         if 'spreadsheet' in meta.get('mimeType', ''):
@@ -216,18 +903,211 @@ def download_file_from_drive(service, file_id: str) -> bytes:
         else:
             request = service.files().get_media(fileId=file_id)
 
-        fh = BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-
-        return fh.getvalue()
+        return drive_download(request)
     except Exception as e:
         print(f'[ERROR] ファイルダウンロード失敗 ({file_id}): {e}')
         return None
 
 
+# ========== Drive入力の先読み ==========
+# 複数のファイル情報・ファイル本体を並列に取得してメモリに保持する（キー: ファイルID）。
+# get_drive_file_metadata / download_file_from_drive は先読み済みの結果があればそれを使う。
+
+DRIVE_PREFETCH_WORKERS = 8
+
+_DRIVE_PREFETCH = {'metadata': {}, 'content': {}}   # metadata: {(ファイルID, fields): dict}, content: {ファイルID: bytes}
+_DRIVE_PREFETCH_LOCK = threading.Lock()
+
+
+def get_drive_file_metadata(service, file_id: str, fields: str) -> dict:
+    """ファイル情報を取得（先読み済みならその結果を返す）"""
+    with _DRIVE_PREFETCH_LOCK:
+        meta = _DRIVE_PREFETCH['metadata'].get((file_id, fields))
+    if meta is not None:
+        return meta
+    meta = drive_execute(service.files().get(fileId=file_id, fields=fields, supportsAllDrives=True))
+    with _DRIVE_PREFETCH_LOCK:
+        _DRIVE_PREFETCH['metadata'][(file_id, fields)] = meta
+    return meta
+
+
+def prefetch_drive_inputs(metadata: list = None, contents: list = None, workers: int = None) -> int:
+    """ファイル情報・ファイル本体をスレッドプールで並列に先読み
+
+    Args:
+        metadata: [(ファイルID, fields), ...]
+        contents: [ファイルID, ...]
+        workers: 同時実行数（ワーカーごとにDriveサービスを作る）
+
+    Returns:
+        int: 取得できた件数
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with _DRIVE_PREFETCH_LOCK:
+        tasks = [('metadata', key) for key in dict.fromkeys(metadata or []) if key not in _DRIVE_PREFETCH['metadata']]
+        tasks += [('content', file_id) for file_id in dict.fromkeys(contents or []) if file_id not in _DRIVE_PREFETCH['content']]
+    if not tasks:
+        return 0
+    local = threading.local()
+
+    def fetch(task):
+        kind, key = task
+        # googleapiclientのサービスはスレッドセーフではないため、ワーカーごとに作る
+        if not hasattr(local, 'service'):
+            local.service = get_drive_service()
+        if not local.service:
+            return False
+        try:
+            if kind == 'metadata':
+                get_drive_file_metadata(local.service, *key)
+                return True
+            content = download_file_from_drive(local.service, key)
+        except Exception as e:
+            print(f'[WARN] 先読み失敗 ({key}): {e}')
+            return False
+        if content is None:
+            return False
+        with _DRIVE_PREFETCH_LOCK:
+            _DRIVE_PREFETCH['content'][key] = content
+        return True
+
+    with ThreadPoolExecutor(max_workers=min(len(tasks), workers or DRIVE_PREFETCH_WORKERS)) as executor:
+        return sum(executor.map(fetch, tasks))
+
+
+# ========== ステージ間の成果物受け渡し ==========
+# 各ステージの出力JSON（pos_data.json など）を、後続ステージが Drive から再ダウンロードせずに使う。
+# 出力時に出力先の cache/artifacts.json へ md5・サイズ・更新日時を記録し、
+# 読み込み時は 同一プロセスのメモリ → 記録と一致するローカルファイル → Google Drive の順で解決する。
+
+ARTIFACT_MANIFEST_NAME = 'artifacts.json'
+
+_ARTIFACT_MEMO = {}   # { 出力ファイルの絶対パス: {'md5', 'header', 'frame'} }
+_ARTIFACT_LOCK = threading.Lock()
+
+
+def _artifact_manifest_path(path: Path) -> Path:
+    return path.parent / 'cache' / ARTIFACT_MANIFEST_NAME
+
+
+def _load_artifact_manifest(path: Path) -> dict:
+    manifest_path = _artifact_manifest_path(path)
+    if not manifest_path.exists():
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _local_artifact_entry(path: Path) -> dict:
+    """ローカルファイルが記録どおり（書き出し後に変更・欠損なし）なら記録を返す"""
+    entry = _load_artifact_manifest(path).get(path.name)
+    if not entry:
+        return None
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    if entry.get('size') != stat.st_size or entry.get('mtime_ns') != stat.st_mtime_ns:
+        return None
+    return entry
+
+
+def publish_artifact(path, md5: str, header: dict = None, frame: pd.DataFrame = None):
+    """ステージの出力ファイルを登録
+
+    Args:
+        path: 書き出したJSONファイル（{**header, 'data': [...]} 形式）
+        md5: ファイル内容のmd5（write_json_records の hasher で計算したもの）
+        header / frame: 指定時は同一プロセスの後続ステージにメモリで渡す（frame は 'data' の中身。
+                        release_artifact で解放するまで保持する）
+    """
+    path = Path(path)
+    stat = path.stat()
+    with _ARTIFACT_LOCK:
+        manifest = _load_artifact_manifest(path)
+        manifest[path.name] = {
+            'md5': md5,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'generated_at': datetime.now().isoformat(),
+        }
+        manifest_path = _artifact_manifest_path(path)
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+        if frame is not None:
+            _ARTIFACT_MEMO[str(path.resolve())] = {'md5': md5, 'header': header or {}, 'frame': frame}
+
+
+def _artifact_content(content: dict, as_frame: bool) -> dict:
+    if as_frame:
+        content['data'] = pd.DataFrame.from_records(content.get('data', []))
+    return content
+
+
+def load_artifact(path, service=None, folder_id: str = None, as_frame: bool = False) -> dict:
+    """前段ステージの出力JSONを読み込み（メモリ → ローカル → Google Drive の順）
+
+    Args:
+        path: ローカルの出力ファイル（Drive上も同じファイル名）
+        service / folder_id: ローカルにない・記録と一致しない場合のダウンロード元
+        as_frame: Trueなら 'data' をDataFrameで返す（メモリにあれば前段のDataFrameをそのまま渡すため、
+                  呼び出し側で変更しないこと）
+
+    Returns:
+        dict: JSONの内容（取得できなければNone）
+    """
+    path = Path(path)
+    entry = _local_artifact_entry(path)
+
+    # 1. 同一プロセス内で出力されたもの（ファイルが書き換えられていなければそのまま使う）
+    with _ARTIFACT_LOCK:
+        memo = _ARTIFACT_MEMO.get(str(path.resolve()))
+    if memo and entry and entry['md5'] == memo['md5']:
+        print(f'[INFO] {path.name}: 前段ステージの結果をメモリから使用')
+        data = memo['frame'] if as_frame else memo['frame'].to_dict(orient='records')
+        return {**memo['header'], 'data': data}
+
+    # 2. 記録と一致するローカルファイル
+    if entry:
+        print(f'[INFO] {path.name}: ローカルファイルを使用（{entry["generated_at"]}）')
+        with open(path, 'r', encoding='utf-8') as f:
+            return _artifact_content(json.load(f), as_frame)
+
+    # 3. Google Drive（ローカルにファイルがなければ保存して次回以降に使う）
+    if service and folder_id:
+        existing = find_drive_file(service, path.name, folder_id)
+        content = download_file_from_drive(service, existing['id']) if existing else None
+        if content:
+            print(f'[INFO] {path.name}: Google Driveから取得')
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(content)
+                publish_artifact(path, hashlib.md5(content).hexdigest())
+            return _artifact_content(json.loads(content.decode('utf-8')), as_frame)
+
+    # 4. 記録のないローカルファイル（以前のバージョンで出力されたもの等）
+    if path.exists():
+        print(f'[WARN] {path.name}: 出力記録と一致しないためローカルファイルをそのまま使用')
+        with open(path, 'r', encoding='utf-8') as f:
+            return _artifact_content(json.load(f), as_frame)
+    return None
+
+
+def release_artifact(path):
+    """メモリに保持している出力を解放（後続ステージがすべて読み込んだ後に呼ぶ）"""
+    with _ARTIFACT_LOCK:
+        _ARTIFACT_MEMO.pop(str(Path(path).resolve()), None)
+
+
 # ========== ジュネストリー店舗マスタ ==========
 # Google Driveに保存されている正式な店舗マスタ
 JUNESTORY_MASTER_FILES = {
@@ -236,8 +1116,25 @@ JUNESTORY_MASTER_FILES = {
 }
 
 
-def load_junestory_master(service=None) -> dict:
-    """ジュネストリーの店舗マスタをGoogle Driveから読み込み
+# 店舗マスタのローカルキャッシュ（全ステージで共有）
+# Drive上のファイルの modifiedTime / md5Checksum が前回と同じならダウンロードしない。
+# 検証から JUNESTORY_MASTER_CACHE_TTL_SEC 秒以内は検証自体も省略する。
+JUNESTORY_MASTER_CACHE_PATH = Path(__file__).parent.parent / 'data' / 'junestory' / 'cache' / 'junestory_master.json'
+JUNESTORY_MASTER_CACHE_VERSION = 1
+JUNESTORY_MASTER_CACHE_TTL_SEC = 600
+
+_JUNESTORY_MASTER_MEMO = {'master': None}
+_JUNESTORY_MASTER_LOCK = threading.Lock()
+
+
+def load_junestory_master(service=None, max_age: float = None) -> dict:
+    """ジュネストリーの店舗マスタをGoogle Driveから読み込み（ローカルキャッシュ付き）
+
+    同一プロセス内では1回だけ読み込み、プロセスをまたいでは
+    JUNESTORY_MASTER_CACHE_PATH のキャッシュを Drive のファイル情報で検証して使う。
+
+    Args:
+        max_age: キャッシュを検証せずに使う秒数（None なら JUNESTORY_MASTER_CACHE_TTL_SEC、0 なら常に検証）
 
     Returns:
         dict: {
@@ -252,13 +1149,134 @@ def load_junestory_master(service=None) -> dict:
             'company_name': '株式会社ジュネストリー',
         }
     """
+    max_age = JUNESTORY_MASTER_CACHE_TTL_SEC if max_age is None else max_age
+
+    # 並列実行中のステージ（pos / pl）が同時に呼んでも取得は1回
+    with _JUNESTORY_MASTER_LOCK:
+        if _JUNESTORY_MASTER_MEMO['master'] is not None:
+            return _JUNESTORY_MASTER_MEMO['master']
+
+        cache = load_junestory_master_cache()
+        if cache and time.time() - cache['checked_at'] < max_age:
+            master = cache['master']
+            print(f'[INFO] 店舗マスタ読み込み: {len(master["stores"])}店舗（キャッシュ）')
+        else:
+            master = _fetch_junestory_master(service, cache)
+
+        _JUNESTORY_MASTER_MEMO['master'] = master
+        return master
+
+
+def load_junestory_master_cache() -> dict:
+    """店舗マスタのキャッシュを読み込み（なし・バージョン不一致・破損ならNone）"""
+    if not JUNESTORY_MASTER_CACHE_PATH.exists():
+        return None
+    try:
+        with open(JUNESTORY_MASTER_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f'[WARN] 店舗マスタキャッシュ読み込み失敗: {e}')
+        return None
+    if cache.get('version') != JUNESTORY_MASTER_CACHE_VERSION:
+        return None
+    return cache
+
+
+def save_junestory_master_cache(master: dict, files: dict):
+    """店舗マスタのキャッシュを保存（files: {キー: {'modifiedTime', 'md5Checksum'}}）"""
+    cache = {
+        'version': JUNESTORY_MASTER_CACHE_VERSION,
+        'checked_at': time.time(),
+        'files': files,
+        'master': master,
+    }
+    try:
+        JUNESTORY_MASTER_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = JUNESTORY_MASTER_CACHE_PATH.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, JUNESTORY_MASTER_CACHE_PATH)
+    except OSError as e:
+        print(f'[WARN] 店舗マスタキャッシュ保存失敗: {e}')
+
+
+def _fetch_junestory_master(service, cache: dict) -> dict:
+    """Drive上のファイル情報でキャッシュを検証し、変わっていればダウンロードして解析"""
     if service is None:
         service = get_drive_service()
 
     if not service:
+        if cache:
+            print('[WARN] Google Drive APIが利用できません。前回取得した店舗マスタを使用')
+            return cache['master']
         print('[WARN] Google Drive APIが利用できません。ローカルファイルを使用')
         return None
 
+    # ファイル情報だけを取得（ダウンロードより軽い）
+    files = fetch_junestory_master_metadata(service)
+
+    if cache and files and cache.get('files') == files:
+        save_junestory_master_cache(cache['master'], files)  # 検証日時を更新
+        print(f'[INFO] 店舗マスタ読み込み: {len(cache["master"]["stores"])}店舗（変更なし・キャッシュ）')
+        return cache['master']
+
+    # 2ファイルを並列にダウンロード（パイプラインで先読み済みならその内容を使う）
+    prefetch_drive_inputs(contents=list(JUNESTORY_MASTER_FILES.values()))
+    mapping_raw = download_file_from_drive(service, JUNESTORY_MASTER_FILES['store_code_mapping'])
+    stores_raw = download_file_from_drive(service, JUNESTORY_MASTER_FILES['stores'])
+    if cache and not (mapping_raw and stores_raw):
+        print('[WARN] 店舗マスタのダウンロードに失敗したため、前回取得した店舗マスタを使用')
+        return cache['master']
+
+    result = parse_junestory_master(mapping_raw, stores_raw)
+    if files and mapping_raw and stores_raw:
+        save_junestory_master_cache(result, files)
+    print(f'[INFO] 店舗マスタ読み込み: {len(result["stores"])}店舗')
+    return result
+
+
+JUNESTORY_MASTER_METADATA_FIELDS = 'modifiedTime,md5Checksum'
+
+
+def fetch_junestory_master_metadata(service) -> dict:
+    """店舗マスタ各ファイルの modifiedTime / md5Checksum を取得（失敗時はNone）"""
+    prefetch_drive_inputs(metadata=[(file_id, JUNESTORY_MASTER_METADATA_FIELDS)
+                                    for file_id in JUNESTORY_MASTER_FILES.values()])
+    files = {}
+    try:
+        for key, file_id in JUNESTORY_MASTER_FILES.items():
+            meta = get_drive_file_metadata(service, file_id, JUNESTORY_MASTER_METADATA_FIELDS)
+            files[key] = {'modifiedTime': meta.get('modifiedTime'), 'md5Checksum': meta.get('md5Checksum')}
+    except Exception as e:
+        print(f'[WARN] 店舗マスタのファイル情報取得失敗: {e}')
+        return None
+    return files
+
+
+def prefetch_junestory_master(service=None):
+    """店舗マスタの検証・ダウンロードに必要なDrive読み込みを並列に先読み
+
+    キャッシュがTTL内なら何もしない。ファイル情報を取得し、キャッシュと異なるファイルだけ本体も先読みする。
+
+    Args:
+        service: Driveサービス（Noneならここで作成）
+    """
+    cache = load_junestory_master_cache()
+    if cache and time.time() - cache['checked_at'] < JUNESTORY_MASTER_CACHE_TTL_SEC:
+        return
+    service = service or get_drive_service()
+    if not service:
+        return
+    files = fetch_junestory_master_metadata(service) or {}
+    cached_files = (cache or {}).get('files', {})
+    if files and files == cached_files:
+        return
+    # 片方でも変われば両方を読み直すため、両方とも先読みする
+    prefetch_drive_inputs(contents=list(JUNESTORY_MASTER_FILES.values()))
+
+
+def parse_junestory_master(mapping_raw: bytes, stores_raw: bytes) -> dict:
+    """store_code_mapping.csv と stores.json の内容から店舗マスタを作成"""
     result = {
         'stores': {},
         'mapping': {
@@ -272,7 +1290,6 @@ def load_junestory_master(service=None) -> dict:
     }
 
     # 1. store_code_mapping.csv を読み込み
-    mapping_raw = download_file_from_drive(service, JUNESTORY_MASTER_FILES['store_code_mapping'])
     if mapping_raw:
         import csv
         content = mapping_raw.decode('utf-8-sig')
@@ -308,7 +1325,6 @@ def load_junestory_master(service=None) -> dict:
                 result['mapping']['dinii'][dinii_name] = store_code
 
     # 2. stores.json を読み込み
-    stores_raw = download_file_from_drive(service, JUNESTORY_MASTER_FILES['stores'])
     if stores_raw:
         stores_data = json.loads(stores_raw.decode('utf-8-sig'))
         result['company_name'] = stores_data.get('company_name', '株式会社ジュネストリー')
@@ -338,10 +1354,403 @@ def load_junestory_master(service=None) -> dict:
                 'opened_at': store.get('オープン日') if store.get('オープン日') not in ['-', 'オープン日'] else None,
             }
 
-    print(f'[INFO] 店舗マスタ読み込み: {len(result["stores"])}店舗')
     return result
 
 
+# ========== 店舗名の照合（索引） ==========
+# 「マッピングを先頭から見て、名前が含まれる／含まれている最初の店舗」という線形走査を、
+# 一度だけ作る索引で置き換える。どのモードでも結果は従来の走査で最初に条件を満たした項目と同じ。
+#   - exact:    名前 == 文字列
+#   - within:   名前 in 文字列（Aho-Corasick で文字列を1回走査）
+#   - contains: 文字列 in 名前（全名前の部分文字列 → 最初の項目番号 の辞書）
+#   - either:   within または contains（項目番号の小さい方）
+
+_NO_MATCH = float('inf')
+
+
+def build_name_index(entries) -> dict:
+    """(名前, 値) の並びから照合用の索引を作成（並び順が優先順位）"""
+    names, values = [], []
+    for name, value in entries:
+        names.append(name)
+        values.append(value)
+
+    exact, substrings = {}, {}
+    goto, fail, best = [{}], [0], [_NO_MATCH]
+    for i, name in enumerate(names):
+        exact.setdefault(name, i)
+        for start in range(len(name) + 1):
+            for end in range(start, len(name) + 1):
+                substrings.setdefault(name[start:end], i)
+        node = 0
+        for ch in name:
+            child = goto[node].get(ch)
+            if child is None:
+                child = len(goto)
+                goto[node][ch] = child
+                goto.append({})
+                fail.append(0)
+                best.append(_NO_MATCH)
+            node = child
+        best[node] = min(best[node], i)
+
+    # 失敗遷移を幅優先で張り、各ノードで一致する名前の最小項目番号を伝播
+    queue = list(goto[0].values())
+    for node in queue:
+        for ch, child in goto[node].items():
+            f = fail[node]
+            while f and ch not in goto[f]:
+                f = fail[f]
+            fail[child] = goto[f].get(ch, 0)
+            best[child] = min(best[child], best[fail[child]])
+            queue.append(child)
+
+    return {
+        'values': values,
+        'exact': exact,
+        'substrings': substrings,
+        'automaton': (goto, fail, best),
+        'memo': {},
+    }
+
+
+def _first_name_within(index: dict, text: str):
+    """文字列に含まれる名前のうち最小の項目番号"""
+    goto, fail, best = index['automaton']
+    node, found = 0, best[0]
+    for ch in text:
+        while node and ch not in goto[node]:
+            node = fail[node]
+        node = goto[node].get(ch, 0)
+        if best[node] < found:
+            found = best[node]
+    return found
+
+
+def match_name(index: dict, text: str, mode: str = 'either'):
+    """索引から文字列に該当する最初の項目の値を返す（該当なしは None、結果はメモ化）"""
+    key = (mode, text)
+    memo = index['memo']
+    if key in memo:
+        return memo[key]
+
+    if mode == 'exact':
+        found = index['exact'].get(text, _NO_MATCH)
+    elif mode == 'within':
+        found = _first_name_within(index, text)
+    elif mode == 'contains':
+        found = index['substrings'].get(text, _NO_MATCH)
+    elif mode == 'either':
+        found = min(_first_name_within(index, text), index['substrings'].get(text, _NO_MATCH))
+    else:
+        raise ValueError(f'不明な照合モード: {mode}')
+
+    value = None if found == _NO_MATCH else index['values'][found]
+    memo[key] = value
+    return value
+
+
+def simplify_store_name(name: str) -> str:
+    """部分一致用に店舗名から「!」「！」と空白を除く"""
+    return name.replace('!', '').replace('！', '').replace(' ', '')
+
+
+# 店舗マスタごとの照合索引 {id(店舗マスタ): (店舗マスタ, 索引)}
+_STORE_RESOLVERS = {}
+
+
+def get_store_resolver(store_master: dict) -> dict:
+    """店舗マスタから店舗特定用の索引を作成（同じマスタには1回だけ）
+
+    マスタに存在しない店番を指すマッピングは、従来の走査と同じく索引に含めない。
+    """
+    cached = _STORE_RESOLVERS.get(id(store_master))
+    if cached and cached[0] is store_master:
+        return cached[1]
+
+    mapping = store_master.get('mapping', {})
+    stores = store_master.get('stores', {})
+    resolver = {
+        'stores': stores,
+        'store_name': build_name_index(
+            (simplify_store_name(store['name']), code) for code, store in stores.items()),
+    }
+    for source in ('pl', 'pos_name', 'fun', 'dinii'):
+        resolver[source] = build_name_index(
+            (name, code) for name, code in mapping.get(source, {}).items() if code in stores)
+
+    _STORE_RESOLVERS[id(store_master)] = (store_master, resolver)
+    return resolver
+
+
+def resolve_store(store_master: dict, text: str, sources: tuple, mode: str = 'either',
+                  fallback: bool = True) -> tuple:
+    """店舗名・ファイル名から店舗を特定
+
+    Args:
+        store_master: 店舗マスタ
+        text: 照合する文字列
+        sources: 優先順に照合するマッピング（'pl', 'pos_name', 'fun', 'dinii'）
+        mode: 照合モード（match_name 参照）
+        fallback: Trueならマッピングで見つからないとき店舗名（空白・「!」除去）と照合
+
+    Returns:
+        (store_code, store_name) or (None, None)
+    """
+    resolver = get_store_resolver(store_master)
+    for source in sources:
+        code = match_name(resolver[source], text, mode)
+        if code is not None:
+            return code, resolver['stores'][code]['name']
+
+    if fallback:
+        code = match_name(resolver['store_name'], text.replace(' ', ''), mode)
+        if code is not None:
+            return code, resolver['stores'][code]['name']
+
+    return None, None
+
+
+# ========== 日別ファクトテーブル ==========
+# POS・fun・dinii の日別売上CSVから取り出した (日付, 店舗コード, 店舗名, 売上, 客数, 組数) を
+# 1つの列指向ファイル（numpy .npz）にまとめる。CSVはPOS変換時に1回だけ読み、
+# 曜日別集計など日別の分析はこのテーブルから集計する。
+
+DAILY_FACTS_FILENAME = 'pos_daily.npz'
+DAILY_FACTS_VERSION = 1
+DAILY_FACT_VALUES = ('sales', 'customers', 'groups')
+
+
+def save_daily_facts(path, facts: list) -> int:
+    """ファイルごとの日別ファクトを連結して保存（店舗コード・店舗名は辞書化して整数で持つ）
+
+    Args:
+        path: 保存先（.npz）
+        facts: [{'store_code': str, 'date': ['YYYY-MM-DD', ...], 'store_name': [str, ...],
+                 'sales': [...], 'customers': [...], 'groups': [...]}, ...]
+
+    Returns:
+        int: 行数
+    """
+    dates, codes, names = [], [], []
+    values = {key: [] for key in DAILY_FACT_VALUES}
+    for fact in facts:
+        dates.extend(fact['date'])
+        codes.extend([fact['store_code']] * len(fact['date']))
+        names.extend(fact['store_name'])
+        for key in DAILY_FACT_VALUES:
+            values[key].extend(fact[key])
+
+    code_table, code_index = np.unique(np.array(codes, dtype=str), return_inverse=True)
+    name_table, name_index = np.unique(np.array(names, dtype=str), return_inverse=True)
+    arrays = {
+        'version': np.array(DAILY_FACTS_VERSION),
+        'date': np.array(dates, dtype='datetime64[D]'),
+        'store_code': code_index.astype(np.int32),
+        'store_codes': code_table,
+        'store_name': name_index.astype(np.int32),
+        'store_names': name_table,
+    }
+    for key in DAILY_FACT_VALUES:
+        arrays[key] = np.array(values[key], dtype=float)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+    return len(dates)
+
+
+def load_daily_facts(path) -> pd.DataFrame:
+    """日別ファクトを読み込み（ファイルがない・形式が違う場合はNone）
+
+    Returns:
+        DataFrame: date, store_code, store_name（カテゴリ）, sales, customers, groups（欠損はNaN）
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != DAILY_FACTS_VERSION:
+                print(f"[WARN] 日別ファクトの形式が異なります: {path.name}")
+                return None
+            frame = pd.DataFrame({
+                'date': data['date'],
+                'store_code': pd.Categorical.from_codes(data['store_code'], data['store_codes']),
+                'store_name': pd.Categorical.from_codes(data['store_name'], data['store_names']),
+            })
+            for key in DAILY_FACT_VALUES:
+                frame[key] = data[key]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[WARN] 日別ファクト読み込み失敗: {e}")
+        return None
+    return frame
+
+
+# ========== 単品ファクト（列形式）・ABC分析 ==========
+# POS単品・fun単品CSVの全商品行を、商品名の辞書（商品ID表）と int32 / float32 の列で1ファイル（.npz）に保存する。
+# 行は 店舗 × 年月 のパーティションごとに連続して並び、パーティション内は売上（または出数）の大きい順。
+# 各行には保存時に計算したABCランクを持たせ、ダッシュボードは生の行ではなく分類結果を使う。
+
+ITEM_FACTS_FILENAME = 'pos_items.npz'
+ITEM_FACTS_VERSION = 1
+ITEM_FACT_VALUES = ('sales', 'quantity')
+
+# ABC分析: 自分より上位の商品の累計構成比が 70%未満 → A、90%未満 → B、それ以外 → C
+ABC_THRESHOLDS = (0.7, 0.9)
+ABC_CLASSES = ('A', 'B', 'C')
+
+
+def classify_abc(groups, values, thresholds=ABC_THRESHOLDS) -> np.ndarray:
+    """グループ（店舗×年月など）ごとのABC分類をまとめて計算
+
+    グループ内で値の大きい順に並べ、自分より上位の累計構成比で A/B/C を決める
+    （構成比の大きい先頭の商品は必ずA）。マイナスの値は構成比0として扱う。
+
+    Args:
+        groups: 各行のグループ番号（整数）
+        values: 各行の値（NaNの行は分類しない）
+
+    Returns:
+        ndarray[int8]: ABC_CLASSES の位置（0=A, 1=B, 2=C）。NaNの行は -1
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    result = np.full(len(values), -1, dtype=np.int8)
+    rows = np.flatnonzero(~np.isnan(values))
+    if len(rows) == 0:
+        return result
+
+    # グループ順・値の大きい順（同じ値は元の順）に並べる
+    weights = np.maximum(values[rows], 0)
+    order = np.lexsort((-weights, groups[rows]))
+    rows, weights, sorted_groups = rows[order], weights[order], groups[rows][order]
+
+    # グループごとの累計（自分を含まない）と合計
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    sizes = np.diff(np.r_[starts, len(rows)])
+    cumulative = np.cumsum(weights)
+    before = cumulative - weights - np.repeat(cumulative[starts] - weights[starts], sizes)
+    totals = np.repeat(np.add.reduceat(weights, starts), sizes)
+    share = np.divide(before, totals, out=np.ones_like(before), where=totals > 0)
+
+    result[rows] = np.searchsorted(np.asarray(thresholds, dtype=float), share, side='right')
+    return result
+
+
+def save_item_facts(path, facts: list) -> tuple:
+    """ファイルごとの単品ファクトをまとめ、店舗×年月ごとにABC分類して保存
+
+    同じ店舗・年月・商品が複数ファイルにある場合は、値ごとに後のファイルの値を優先する
+    （POS単品売上 + POS単品出数のように、ファイルごとに別の値を持つ場合はそれぞれを使う）。
+    ABC分類はパーティション内に売上があれば売上、なければ出数で行う。
+
+    Args:
+        path: 保存先（.npz）
+        facts: [{'store_code': str, 'store_name': str, 'yearmonth': 'YYYY-MM', 'items': [商品名, ...],
+                 'sales': [...] or None, 'quantity': [...] or None}, ...]
+
+    Returns:
+        (int, int): (行数, パーティション数)
+    """
+    columns = {key: [] for key in ('store_code', 'store_name', 'yearmonth', 'item', *ITEM_FACT_VALUES)}
+    for fact in facts:
+        count = len(fact['items'])
+        columns['store_code'].extend([fact['store_code']] * count)
+        columns['store_name'].extend([fact['store_name']] * count)
+        columns['yearmonth'].extend([fact['yearmonth']] * count)
+        columns['item'].extend(fact['items'])
+        for key in ITEM_FACT_VALUES:
+            columns[key].extend(fact[key] if fact.get(key) is not None else [np.nan] * count)
+
+    frame = pd.DataFrame(columns)
+    frame[list(ITEM_FACT_VALUES)] = frame[list(ITEM_FACT_VALUES)].astype(float)
+    # 店舗・年月・商品ごとに、値ごとの最後の非欠損値（groupby.last は欠損を飛ばす）
+    merged = frame.groupby(['store_code', 'yearmonth', 'item'], sort=True).last()
+
+    index = merged.index
+    store_idx, month_idx, item_idx = (np.asarray(codes, dtype=np.int64) for codes in index.codes)
+    partition_keys, partition = np.unique(store_idx * max(len(index.levels[1]), 1) + month_idx,
+                                          return_inverse=True)
+    sales = merged['sales'].to_numpy(dtype=float)
+    quantity = merged['quantity'].to_numpy(dtype=float)
+
+    # ABCの基準: パーティション内に売上があれば売上、なければ出数
+    has_sales = np.bincount(partition, weights=~np.isnan(sales), minlength=len(partition_keys)) > 0
+    basis = np.where(has_sales[partition], sales, quantity)
+    abc = classify_abc(partition, basis)
+
+    # パーティション順・基準値の大きい順（欠損は後ろ）・商品名順に並べる
+    order = np.lexsort((item_idx, np.where(np.isnan(basis), np.inf, -basis), partition))
+    partition = partition[order]
+    offsets = np.searchsorted(partition, np.arange(len(partition_keys) + 1))
+    first_rows = order[offsets[:-1]]
+    name_table, name_index = np.unique(merged['store_name'].fillna('').to_numpy(dtype=str)[first_rows],
+                                       return_inverse=True)
+
+    arrays = {
+        'version': np.array(ITEM_FACTS_VERSION),
+        'items': np.asarray(index.levels[2], dtype=str),
+        'store_codes': np.asarray(index.levels[0], dtype=str),
+        'store_names': name_table,
+        'yearmonths': np.asarray(index.levels[1], dtype=str),
+        'partition_store': store_idx[first_rows].astype(np.int32),
+        'partition_store_name': name_index.astype(np.int32),
+        'partition_yearmonth': month_idx[first_rows].astype(np.int32),
+        'partition_basis': np.where(has_sales, 0, 1).astype(np.int8),
+        'partition_offsets': offsets.astype(np.int64),
+        'item_id': item_idx[order].astype(np.int32),
+        'sales': sales[order].astype(np.float32),
+        'quantity': quantity[order].astype(np.float32),
+        'abc': abc[order],
+    }
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+    return len(order), len(partition_keys)
+
+
+def load_item_facts(path) -> pd.DataFrame:
+    """単品ファクトを読み込み（ファイルがない・形式が違う場合はNone）
+
+    Returns:
+        DataFrame: store_code, store_name, yearmonth, item, basis, abc（カテゴリ）, sales, quantity（欠損はNaN）
+                   行は店舗×年月ごとに連続し、パーティション内は基準値の大きい順
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != ITEM_FACTS_VERSION:
+                print(f"[WARN] 単品ファクトの形式が異なります: {path.name}")
+                return None
+            sizes = np.diff(data['partition_offsets'])
+            frame = pd.DataFrame({
+                'store_code': pd.Categorical.from_codes(np.repeat(data['partition_store'], sizes), data['store_codes']),
+                'store_name': pd.Categorical.from_codes(np.repeat(data['partition_store_name'], sizes),
+                                                        data['store_names']),
+                'yearmonth': pd.Categorical.from_codes(np.repeat(data['partition_yearmonth'], sizes),
+                                                       data['yearmonths']),
+                'item': pd.Categorical.from_codes(data['item_id'], data['items']),
+                'basis': pd.Categorical.from_codes(np.repeat(data['partition_basis'], sizes), ITEM_FACT_VALUES),
+                'abc': pd.Categorical.from_codes(data['abc'], ABC_CLASSES),
+                'sales': data['sales'],
+                'quantity': data['quantity'],
+            })
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[WARN] 単品ファクト読み込み失敗: {e}")
+        return None
+    return frame
+
+
 def convert_shukuhaku_sheet(df: pd.DataFrame) -> list[dict]:
     """宿泊シートを縦持ち形式に変換"""
     records = []
@@ -626,32 +2035,27 @@ def convert_excel_to_master_db(excel_path: str, output_path: str, company_name:
     result_df.to_csv(csv_path, index=False, encoding='utf-8-sig')
     print(f'CSV保存: {csv_path} ({len(result_df)}件)')
 
-    # JSON出力
-    json_data = {
+    # JSON出力（レコードは順次書き出し）
+    json_header = {
         'company_name': company_name,
         'generated_at': datetime.now().isoformat(),
         'format': 'long',
         'columns': ['年月', '部門', '大項目', '中項目', '単位', '区分', '値'],
         'total_records': len(result_df),
         'departments': result_df['部門'].unique().tolist(),
-        'data': result_df.to_dict(orient='records')
     }
 
     json_path = output_path / f'{company_name}_master_data.json'
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(json_data, f, ensure_ascii=False, indent=2)
+    write_json_records(json_path, json_header, iter_dataframe_records(result_df), indent=2)
     print(f'JSON保存: {json_path}')
 
-    # Google Driveアップロード
+    # Google Driveアップロード（ローカル保存したファイルをそのまま送る）
     if drive_folder_id:
         print('\nGoogle Driveにアップロード中...')
         service = get_drive_service()
         if service:
-            csv_content = result_df.to_csv(index=False, encoding='utf-8-sig').encode('utf-8-sig')
-            upload_to_drive(service, csv_content, f'{company_name}_master_data.csv', drive_folder_id, 'text/csv')
-
-            json_content = json.dumps(json_data, ensure_ascii=False, indent=2).encode('utf-8')
-            upload_to_drive(service, json_content, f'{company_name}_master_data.json', drive_folder_id, 'application/json')
+            upload_file_to_drive(service, csv_path, f'{company_name}_master_data.csv', drive_folder_id, 'text/csv')
+            upload_file_to_drive(service, json_path, f'{company_name}_master_data.json', drive_folder_id, 'application/json')
         else:
             print('[WARN] Google Drive APIが利用できません。ローカル保存のみ完了')
 
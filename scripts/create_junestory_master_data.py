@@ -11,20 +11,32 @@
 - 売上比、前年売上比、計画売上比（PLの利益・費用のみ）
 """
 
+import hashlib
 import json
 import os
 import sys
-import csv
-import re
 from pathlib import Path
 from datetime import datetime
 from collections import defaultdict
 
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
 sys.path.insert(0, str(Path(__file__).parent))
-from convert_lib import setup_google_auth, get_drive_service, load_junestory_master, ensure_file_downloaded
+from convert_lib import (
+    setup_google_auth, get_drive_service, load_junestory_master, write_json_records,
+    file_md5, find_drive_file, is_same_on_drive, upload_request_count, record_upload, print_upload_summary,
+    upload_files_concurrently, drive_call, load_artifact,
+    build_name_index, match_name, load_daily_facts, DAILY_FACTS_FILENAME
+)
 
 JUNESTORY_FOLDER_ID = '1Bt8WpIQWUiHiOCct_c1AikDOZ5CKprCL'
 
+# 分割ファイルのアップロード設定（同時アップロード数・1秒あたりのアップロード開始数）
+UPLOAD_WORKERS = 4
+UPLOAD_RATE_PER_SEC = 3.0
+
 # TKC部門コード → 正式店番マッピング
 # PLデータのカラム名に含まれるTKC部門コード（3桁）を正式店番に変換
 TKC_TO_OFFICIAL = {
@@ -59,6 +71,13 @@ def normalize_store_code(code: str) -> str:
         return TKC_TO_OFFICIAL[stripped]
     return code
 
+def normalize_store_codes(records: pd.DataFrame) -> pd.DataFrame:
+    """レコードの店舗コードを正式店番に正規化した新しいDataFrameを返す（records は変更しない）"""
+    if '店舗コード' not in records.columns:
+        return records
+    codes = records['店舗コード'].astype(object).where(records['店舗コード'].notna(), '')
+    return records.assign(店舗コード=codes.map(normalize_store_code))
+
 # 店舗マスタ（Google Driveから読み込み）
 _STORE_MASTER_CACHE = None
 
@@ -75,6 +94,16 @@ def load_json(filepath):
     with open(filepath, 'r', encoding='utf-8') as f:
         return json.load(f)
 
+def load_stage_output(filepath) -> pd.DataFrame:
+    """前段ステージ（pos / pl）の出力レコードをDataFrameで取得（同一プロセスで実行済みならメモリから）
+
+    前段のDataFrameをそのまま受け取るため変更しないこと（列の置き換えは assign 等で新しいDataFrameにする）。
+    """
+    data = load_artifact(filepath, as_frame=True)
+    if data is None:
+        raise FileNotFoundError(f'{filepath} がありません')
+    return data['data']
+
 def get_prev_year_month(yearmonth: str) -> str:
     """前年同月を取得"""
     year, month = yearmonth.split('-')
@@ -106,222 +135,703 @@ def get_month_index_in_fiscal_year(yearmonth: str) -> int:
 
 
 # ========== 曜日別データ集計 ==========
-# POSの日別データから曜日別に集計
+# POS変換で作成した日別ファクト（pos_daily.npz）から、店舗×年月×曜日ごとの1日平均を集計
 
 WEEKDAY_NAMES = ['月', '火', '水', '木', '金', '土', '日']
-POS_ANALYSIS_FOLDER = Path(r"c:\Users\yasuh\OneDrive - 株式会社日本コンサルタントグループ　\MyDocuments\00_Junes\2026年10月期_データ\POS分析")
-
-
-def get_weekday_from_date(date_str: str) -> str:
-    """日付文字列から曜日を取得"""
-    date_str = date_str.strip()
-    # 曜日が既に含まれている場合
-    match = re.search(r'\(([月火水木金土日])\)', date_str)
-    if match:
-        return match.group(1)
-    # 日付をパース
-    for fmt in ['%Y/%m/%d', '%Y-%m-%d']:
-        try:
-            dt = datetime.strptime(date_str.split('(')[0], fmt)
-            return WEEKDAY_NAMES[dt.weekday()]
-        except:
-            pass
-    return None
-
-
-def parse_number_str(value) -> float:
-    """数値をパース（カンマ、円記号などを除去）"""
-    if value is None or value == '':
-        return 0
-    if isinstance(value, (int, float)):
-        return float(value)
-    s = str(value).replace(',', '').replace('\\', '').replace('¥', '').replace('"', '').strip()
-    try:
-        return float(s) if s else 0
-    except:
-        return 0
 
+# 曜日別の出力項目（中項目の接頭辞, 単位）。グループごとにこの順で出力する
+WEEKDAY_ITEMS = [
+    ('曜日別売上高', '円'),
+    ('曜日別客数', '人'),
+    ('曜日別客単価', '円'),
+    ('曜日別組数', '組'),
+    ('曜日別組人数', '人'),
+]
 
-def load_dinii_weekday_data(folder_path: Path) -> list:
-    """dinii売上フォルダから日別データを読み込み"""
-    records = []
-    if not folder_path.exists():
-        return records
 
-    for csv_file in folder_path.glob('売上分析_日別_*.csv'):
-        if not ensure_file_downloaded(str(csv_file)):
-            print(f"  警告: ファイルをダウンロードできませんでした: {csv_file.name}")
-            continue
-        with open(csv_file, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                date_str = row.get('日付', '')
-                if not date_str:
-                    continue
-                weekday = get_weekday_from_date(date_str)
-                if not weekday:
-                    continue
-                try:
-                    dt = datetime.strptime(date_str, '%Y/%m/%d')
-                    yearmonth = dt.strftime('%Y-%m')
-                except:
-                    continue
-                records.append({
-                    'store_name': row.get('店舗名', ''),
-                    'yearmonth': yearmonth,
-                    'weekday': weekday,
-                    'sales': parse_number_str(row.get('売上', 0)),
-                    'customers': parse_number_str(row.get('客数', 0)),
-                    'groups': parse_number_str(row.get('組数', 0)),
-                })
-    return records
-
-
-def load_fun_weekday_data(folder_path: Path) -> list:
-    """fun売上フォルダから日別データを読み込み"""
-    records = []
-    if not folder_path.exists():
-        return records
+def create_weekday_records(store_names: dict, daily_path: Path) -> pd.DataFrame:
+    """曜日別データを集計してmaster_data形式のDataFrameで返す
 
-    for csv_file in folder_path.glob('*_売上詳細_*.csv'):
-        if not ensure_file_downloaded(str(csv_file)):
-            print(f"  警告: ファイルをダウンロードできませんでした: {csv_file.name}")
-            continue
-        store_name = csv_file.name.split('_売上詳細')[0]
-        with open(csv_file, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                date_str = row.get('集計期間', '')
-                if not date_str or '/' not in date_str:
-                    continue
-                weekday = get_weekday_from_date(date_str)
-                if not weekday:
-                    continue
-                try:
-                    dt = datetime.strptime(date_str, '%Y/%m/%d')
-                    yearmonth = dt.strftime('%Y-%m')
-                except:
-                    continue
-                records.append({
-                    'store_name': store_name,
-                    'yearmonth': yearmonth,
-                    'weekday': weekday,
-                    'sales': parse_number_str(row.get('売上高（税抜）', 0)),
-                    'customers': parse_number_str(row.get('客数', 0)),
-                    'groups': parse_number_str(row.get('会計数', 0)),
-                })
-    return records
-
-
-def load_pos_weekday_data(folder_path: Path) -> list:
-    """POS売上フォルダから日別データを読み込み"""
-    records = []
-    if not folder_path.exists():
-        return records
+    店舗名×年月×曜日でグループ化し（グループは日別ファクトでの出現順）、
+    売上・客数・組数の1日平均と客単価・組人数を求める。売上・客数・組数の欠損は0として扱う。
+    """
+    facts = load_daily_facts(daily_path)
+    if facts is None or facts.empty:
+        print("[INFO] 日別ファクトがありません - 曜日別データをスキップ")
+        return records_to_frame([])
+
+    dates = facts['date'].dt
+    keys = pd.DataFrame({
+        'store_name': facts['store_name'].cat.codes,
+        'yearmonth': dates.year * 100 + dates.month,
+        'weekday': dates.weekday,
+    })
+    group_ids = keys.groupby(['store_name', 'yearmonth', 'weekday'], sort=False).ngroup().to_numpy()
+    _, first_rows = np.unique(group_ids, return_index=True)
+
+    # グループ内を行順に加算（np.bincount は行順に足し込むため従来の逐次加算と同じ値）
+    totals = {key: np.bincount(group_ids, weights=facts[key].fillna(0.0).to_numpy())
+              for key in ('sales', 'customers', 'groups')}
+    count = np.bincount(group_ids).astype(float)
+    sales, customers, groups = totals['sales'], totals['customers'], totals['groups']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.column_stack([
+            round_like_python(sales / count, 0),
+            round_like_python(customers / count, 1),
+            np.where(customers > 0, round_like_python(sales / customers, 0), 0.0),
+            round_like_python(groups / count, 1),
+            np.where(groups > 0, round_like_python(customers / groups, 2), 0.0),
+        ])
+    # 従来どおり、round() で整数にした値と割り算できない場合の 0 は int で出力する
+    as_int = np.column_stack([
+        np.ones(len(count), dtype=bool),
+        np.zeros(len(count), dtype=bool),
+        np.ones(len(count), dtype=bool),
+        np.zeros(len(count), dtype=bool),
+        groups <= 0,
+    ])
+
+    # 店舗コードは店舗名ごとに1回だけ検索（店舗名が一致・包含する最初の店舗）
+    store_code_map = {v: k for k, v in store_names.items()}
+    store_code_index = build_name_index(store_code_map.items())
+    categories = facts['store_name'].cat.categories
+    codes_by_name = np.array([match_name(store_code_index, name) or '' for name in categories], dtype=object)
+
+    name_codes = keys['store_name'].to_numpy()[first_rows]
+    weekday_labels = np.array(WEEKDAY_NAMES, dtype=object)[keys['weekday'].to_numpy()[first_rows]]
+    yearmonths = facts['date'].iloc[first_rows].dt.strftime('%Y-%m').to_numpy(dtype=object)
+
+    n_items = len(WEEKDAY_ITEMS)
+    prefixes = np.array([f'{prefix}_' for prefix, _ in WEEKDAY_ITEMS], dtype=object)
+    units = np.array([unit for _, unit in WEEKDAY_ITEMS], dtype=object)
+    n_rows = len(first_rows) * n_items
+    return pd.DataFrame({
+        '年月': to_category(np.repeat(yearmonths, n_items)),
+        '部門': to_category(np.repeat(np.asarray(categories, dtype=object)[name_codes], n_items)),
+        '店舗コード': to_category(np.repeat(codes_by_name[name_codes], n_items)),
+        '大項目': to_category(np.full(n_rows, 'POS_曜日別', dtype=object)),
+        '中項目': to_category(np.tile(prefixes, len(first_rows)) + np.repeat(weekday_labels, n_items)),
+        '単位': to_category(np.tile(units, len(first_rows))),
+        '区分': to_category(np.full(n_rows, '実績', dtype=object)),
+        '値': values.ravel(),
+        MASTER_INT_COLUMN: as_int.ravel(),
+    })
+
+
+# ========== 区分系列の計算（列指向） ==========
+# 実績累計・実績平均・前年・前年累計・前年平均・前年比・売上比などを、
+# レコードごとのループではなく (年度, 店舗, 中項目) 単位の配列演算でまとめて計算する
+
+MASTER_COLUMNS = ['年月', '部門', '店舗コード', '大項目', '中項目', '単位', '区分', '値']
+MASTER_CATEGORY_COLUMNS = MASTER_COLUMNS[:-1]
+# 値は float64 で持ち、従来 int で出力していた値（round() の結果など）はこの列で印を付けて int で書き出す
+MASTER_INT_COLUMN = 'is_int'
+
+
+def round_like_python(values, ndigits: int) -> np.ndarray:
+    """組み込みround()と同じ結果になる配列版の丸め
+
+    np.round()は10^n倍してから丸めるため、端数が0.5付近の値で組み込みround()と
+    結果が変わることがある。該当する値だけ組み込みround()で丸め直す。
+    """
+    values = np.asarray(values, dtype=float)
+    result = np.round(values, ndigits)
+    scaled = values * (10 ** ndigits)
+    frac = np.abs(scaled - np.trunc(scaled))
+    tolerance = np.maximum(1e-9, np.abs(scaled) * 1e-15)
+    for i in np.nonzero((np.abs(frac - 0.5) <= tolerance) & np.isfinite(values))[0]:
+        result[i] = round(float(values[i]), ndigits)
+    return result
 
-    for csv_file in folder_path.glob('*_レジ_*.csv'):
-        if not ensure_file_downloaded(str(csv_file)):
-            print(f"  警告: ファイルをダウンロードできませんでした: {csv_file.name}")
-            continue
-        parts = csv_file.name.split('_')
-        store_name = parts[1] if len(parts) > 1 else ''
-        try:
-            with open(str(csv_file), 'r', encoding='shift_jis', errors='replace') as f:
-                reader = csv.reader(f)
-                next(reader, None)  # skip header
-                for row in reader:
-                    if len(row) <= 8:
-                        continue
-                    date_str = row[0]
-                    if not date_str or date_str == 'TOTAL':
-                        continue
-                    weekday = get_weekday_from_date(date_str)
-                    if not weekday:
-                        continue
-                    try:
-                        dt = datetime.strptime(date_str.split('(')[0], '%Y/%m/%d')
-                        yearmonth = dt.strftime('%Y-%m')
-                    except:
-                        continue
-                    records.append({
-                        'store_name': store_name,
-                        'yearmonth': yearmonth,
-                        'weekday': weekday,
-                        'sales': parse_number_str(row[8]),
-                        'customers': parse_number_str(row[2]),
-                        'groups': parse_number_str(row[1]),
-                    })
-        except Exception:
+
+def grouped_cumsum(values: np.ndarray, group_ids: np.ndarray) -> tuple:
+    """グループ内で行順に累計する
+
+    pandasのgroupby().cumsum()は補正付き加算のため、逐次加算と末尾の桁が変わることがある。
+    従来のループと同じ値にするため、グループ内の位置ごとに逐次加算する。
+
+    Returns:
+        (累計値の配列, グループ内の件数の配列)
+    """
+    n = len(values)
+    order = np.argsort(group_ids, kind='stable')
+    sorted_values = np.asarray(values, dtype=float)[order]
+    sorted_groups = group_ids[order]
+
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    positions = np.arange(n) - np.maximum.accumulate(np.where(starts, np.arange(n), 0))
+
+    running = sorted_values.copy()
+    for k in range(1, int(positions.max()) + 1 if n else 0):
+        idx = np.nonzero(positions == k)[0]
+        running[idx] = running[idx - 1] + sorted_values[idx]
+
+    cumulative = np.empty(n)
+    cumulative[order] = running
+    counts = np.empty(n, dtype=np.int64)
+    counts[order] = positions + 1
+    return cumulative, counts
+
+
+def masked_cumsum(values: np.ndarray, mask: np.ndarray, group_ids: np.ndarray) -> tuple:
+    """maskが立っている行だけをグループ内で累計（それ以外の行はNaN / 0件）"""
+    cumulative = np.full(len(values), np.nan)
+    counts = np.zeros(len(values), dtype=np.int64)
+    idx = np.nonzero(mask)[0]
+    if len(idx):
+        cumulative[idx], counts[idx] = grouped_cumsum(values[idx], group_ids[idx])
+    return cumulative, counts
+
+
+def build_source_frame(records: pd.DataFrame, store_names: dict, prefix: str) -> pd.DataFrame:
+    """POS/PLレコードから計算用のDataFrameを作成（records は変更しない）
+
+    追加列:
+        部門: 店舗マスタの店舗名（なければ元データの店舗名）
+        fy: 会計年度（11月始まり）
+        month_index: 年×12+月（前年同月 = month_index - 12）
+        source_order: 元レコードの順序
+    """
+    df = records.reindex(columns=['年月', '店舗コード', '店舗名', '大項目', '中項目', '単位', '値'])
+    for col in ['年月', '店舗コード', '大項目', '中項目', '単位']:
+        df[col] = df[col].fillna('').astype(object)
+    df['値'] = pd.to_numeric(df['値'], errors='coerce').astype(float)
+
+    raw_names = df['店舗名'].where(df['店舗名'].notna(), df['店舗コード'])
+    df['部門'] = df['店舗コード'].map(store_names).where(df['店舗コード'].isin(store_names.keys()), raw_names)
+    df['大項目'] = prefix + df['大項目']
+
+    # 年月の種類は少ないので、ユニーク値だけパースして展開する
+    codes, yearmonths = pd.factorize(df['年月'])
+    parsed = np.array([ym.split('-') for ym in yearmonths], dtype=int).reshape(-1, 2)
+    year, month = parsed[codes, 0], parsed[codes, 1]
+    df['fy'] = year + (month >= 11)
+    df['month_index'] = year * 12 + month
+    df['source_order'] = np.arange(len(df))
+    return df
+
+
+def lookup_values(df: pd.DataFrame, keys: list, index_df: pd.DataFrame, index_keys: list, value_col: str) -> np.ndarray:
+    """index_df（キー重複時は後勝ち）からdfの各行に対応する値を引く（なければNaN）"""
+    table = index_df.drop_duplicates(subset=index_keys, keep='last')[index_keys + [value_col]]
+    table = table.rename(columns=dict(zip(index_keys, keys)))
+    merged = df[keys].merge(table, on=keys, how='left')
+    return merged[value_col].to_numpy(dtype=float)
+
+
+def running_total_asof(df: pd.DataFrame, running: np.ndarray, item: str) -> np.ndarray:
+    """各行の時点（同じ年度・店舗で当月まで）における item の累計値を取得（なければ0）
+
+    比率項目の累計（分子累計÷分母累計）用。dfは処理順に並んでいること。
+    """
+    source = df.assign(running=running)
+    source = source[(source['中項目'] == item) & source['running'].notna()]
+    source = source.drop_duplicates(subset=['fy', '店舗コード', 'month_index'], keep='last')
+    source = source[['fy', '店舗コード', 'month_index', 'running']].sort_values('month_index')
+
+    query = df[['fy', '店舗コード', 'month_index']].reset_index(drop=True)
+    query['row'] = np.arange(len(query))
+    merged = pd.merge_asof(query.sort_values('month_index'), source, on='month_index',
+                           by=['fy', '店舗コード'], direction='backward')
+    result = np.zeros(len(df))
+    result[merged['row'].to_numpy()] = merged['running'].fillna(0).to_numpy()
+    return result
+
+
+def to_category(values) -> pd.Categorical:
+    """文字列の配列を辞書エンコード（カテゴリ）にする（欠損は None → コード-1）"""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    return pd.Categorical.from_codes(codes, categories=pd.Index(uniques, dtype=object))
+
+
+def records_to_frame(records: list) -> pd.DataFrame:
+    """master_data形式のレコード（dict）を列指向のDataFrameにする"""
+    columns = {col: to_category([r.get(col) for r in records]) for col in MASTER_CATEGORY_COLUMNS}
+    values = [r.get('値') for r in records]
+    columns['値'] = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=float)
+    columns[MASTER_INT_COLUMN] = np.array([isinstance(v, int) and not isinstance(v, bool) for v in values], dtype=bool)
+    return pd.DataFrame(columns)
+
+
+def assemble_series(df: pd.DataFrame, series: list) -> pd.DataFrame:
+    """派生系列を「元レコード順 → 区分の定義順」に並べ、master_data形式のDataFrameにする
+
+    Args:
+        df: 処理順に並んだ元データ
+        series: [(区分, 出力する行のマスク, 値の配列, 単位の上書き or None), ...]
+    """
+    rows, orders, units, values = [], [], [], []
+    base_units = df['単位'].to_numpy(dtype=object)
+    for order, (kubun, mask, vals, unit) in enumerate(series):
+        idx = np.nonzero(mask)[0]
+        rows.append(idx)
+        orders.append(np.full(len(idx), order))
+        units.append(base_units[idx] if unit is None else np.full(len(idx), unit, dtype=object))
+        values.append(np.asarray(vals, dtype=float)[idx])
+
+    rows, orders = np.concatenate(rows), np.concatenate(orders)
+    perm = np.lexsort((orders, rows))
+    rows = rows[perm]
+
+    columns = {}
+    for col in ['年月', '部門', '店舗コード', '大項目', '中項目']:
+        source = to_category(df[col])
+        columns[col] = pd.Categorical.from_codes(source.codes[rows], categories=source.categories)
+    columns['単位'] = to_category(np.concatenate(units)[perm])
+    columns['区分'] = pd.Categorical.from_codes(orders[perm], categories=pd.Index([s[0] for s in series], dtype=object))
+    columns['値'] = np.concatenate(values)[perm]
+    return pd.DataFrame(columns)
+
+
+def derive_pos_series(df: pd.DataFrame, ratio_items: dict) -> pd.DataFrame:
+    """POSの区分系列（実績・実績累計・実績平均・前年・前年累計・前年平均・前年比）を計算
+
+    比率項目（ratio_items）の累計は「分子累計÷分母累計」、それ以外は単純累計。
+    処理順は (年月, 店舗コード, 比率項目を後, 中項目) で、比率項目の時点では
+    同月の分子・分母が累計済みになる。
+
+    Args:
+        df: build_source_frame() で作ったPOSデータ
+    """
+    if df.empty:
+        return records_to_frame([])
+    df['is_ratio'] = df['中項目'].isin(ratio_items.keys()).astype(int)
+
+    # 前年同月の値（同じキーは後勝ち）
+    prev_values = lookup_values(
+        df.assign(prev_month_index=df['month_index'] - 12), ['prev_month_index', '店舗コード', '中項目'],
+        df, ['month_index', '店舗コード', '中項目'], '値')
+    df['prev'] = prev_values
+
+    df = df.sort_values(['年月', '店舗コード', 'is_ratio', '中項目', 'source_order'], kind='stable').reset_index(drop=True)
+    value = df['値'].to_numpy()
+    prev = df['prev'].to_numpy()
+    has_value = ~np.isnan(value)
+    has_prev = ~np.isnan(prev)
+    group_ids = df.groupby(['fy', '店舗コード', '中項目'], sort=False).ngroup().to_numpy()
+
+    cum, cnt = masked_cumsum(value, has_value, group_ids)
+    prev_cum, prev_cnt = masked_cumsum(prev, has_prev, group_ids)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg = round_like_python(cum / cnt, 1)
+        prev_avg = round_like_python(prev_cum / prev_cnt, 1)
+        yoy = round_like_python((value / prev) * 100, 1)
+
+    # 比率項目の累計 = 分子累計 ÷ 分母累計（分母0なら0）
+    cum_value = cum.copy()
+    prev_cum_value = prev_cum.copy()
+    item = df['中項目'].to_numpy(dtype=object)
+    for ratio_item, (numerator, denominator, _) in ratio_items.items():
+        is_item = item == ratio_item
+        if not is_item.any():
             continue
-    return records
+        with np.errstate(divide='ignore', invalid='ignore'):
+            num, den = running_total_asof(df, cum, numerator), running_total_asof(df, cum, denominator)
+            cum_value[is_item] = np.where(den > 0, round_like_python(num / den, 1), 0)[is_item]
+            num, den = running_total_asof(df, prev_cum, numerator), running_total_asof(df, prev_cum, denominator)
+            prev_cum_value[is_item] = np.where(den > 0, round_like_python(num / den, 1), 0)[is_item]
+
+    always = np.ones(len(df), dtype=bool)
+    return assemble_series(df, [
+        ('実績', always, value, None),
+        ('実績累計', has_value, cum_value, None),
+        ('実績平均', has_value, avg, None),
+        ('前年', has_prev, prev, None),
+        ('前年累計', has_prev, prev_cum_value, None),
+        ('前年平均', has_prev, prev_avg, None),
+        ('前年比', has_prev & (prev != 0) & has_value, yoy, '%'),
+    ])
+
+
+def fiscal_sales_cumulative(df: pd.DataFrame, store_codes: list) -> tuple:
+    """売上比累計の分母（当期売上累計・前年売上累計）を各行について求める
+
+    店舗ごとに「年度×12ヶ月」の月軸で月次売上高の配列を作り、年度内の累積和を取る。
+    - 月次売上高: 純売上高（後勝ち）、値がなければ飲食店売上高合計（後勝ち）
+    - 前年売上: 12ヶ月前の月次売上高。PLデータに存在する年月だけ累計に加える
+    - 店舗マスタにない店舗の行はNaN
+
+    Returns:
+        (当期売上累計の配列, 前年売上累計の配列)
+    """
+    cum_sales = np.full(len(df), np.nan)
+    prev_cum_sales = np.full(len(df), np.nan)
+    store_pos = {code: i for i, code in enumerate(store_codes)}
+    if df.empty or not store_pos:
+        return cum_sales, prev_cum_sales
+
+    # 月軸: 最初の年度の11月から最後の年度の10月まで
+    first_fy, last_fy = int(df['fy'].min()), int(df['fy'].max())
+    n_months = (last_fy - first_fy + 1) * 12
+    month_offset = (df['month_index'] - ((first_fy - 1) * 12 + 11)).to_numpy()
+    store_idx = df['店舗コード'].map(store_pos).to_numpy(dtype=float)
+    in_master = ~np.isnan(store_idx)
+
+    present = np.zeros(n_months, dtype=bool)
+    present[month_offset] = True
+
+    monthly = np.full((len(store_pos), n_months), np.nan)
+    for item in ['飲食店売上高合計', '純売上高']:  # 後の項目ほど優先
+        rows = (df['中項目'] == item).to_numpy() & in_master
+        table = pd.DataFrame({'s': store_idx[rows].astype(int), 'm': month_offset[rows], 'v': df['値'].to_numpy()[rows]})
+        table = table.drop_duplicates(subset=['s', 'm'], keep='last')
+        table = table[table['v'].notna()]
+        monthly[table['s'].to_numpy(), table['m'].to_numpy()] = table['v'].to_numpy()
+    monthly = np.nan_to_num(monthly, nan=0.0)
+
+    prev_monthly = np.zeros_like(monthly)
+    prev_monthly[:, 12:] = monthly[:, :-12]
+    prev_monthly[:, ~present] = 0.0
+
+    # 年度ごとに区切った累積和（逐次加算なので従来の累計と同じ値）
+    shape = (len(store_pos), n_months // 12, 12)
+    cum = monthly.reshape(shape).cumsum(axis=2).reshape(monthly.shape)
+    prev_cum = prev_monthly.reshape(shape).cumsum(axis=2).reshape(monthly.shape)
+
+    s, m = store_idx[in_master].astype(int), month_offset[in_master]
+    cum_sales[in_master] = cum[s, m]
+    prev_cum_sales[in_master] = prev_cum[s, m]
+    return cum_sales, prev_cum_sales
+
+
+def derive_pl_series(df: pd.DataFrame, store_names: dict) -> tuple:
+    """PLの区分系列（実績〜前年売上比累計）を計算
+
+    売上比の分母は (年月, 店舗) の純売上高（なければ飲食店売上高合計）。
+    レコードは元の順序で累計する。
+
+    Args:
+        df: build_source_frame() で作ったPLデータ
+        store_names: 店舗マスタ（売上累計はマスタにある店舗のみ）
+
+    Returns:
+        (master_data形式のDataFrame, KPI計算用の縦持ちDataFrame（区分: 実績・実績累計）)
+    """
+    if df.empty:
+        return records_to_frame([]), pd.DataFrame(columns=['年月', '店舗コード', '中項目', '区分', '値'])
+    month_keys = ['month_index', '店舗コード']
+
+    # 売上高（比率計算用）: 純売上高は後勝ち、なければ最初の飲食店売上高合計
+    sales_rows = df[df['中項目'].isin(['純売上高', '飲食店売上高合計'])]
+    net_sales = sales_rows[sales_rows['中項目'] == '純売上高'].drop_duplicates(subset=month_keys, keep='last')
+    restaurant_sales = sales_rows[sales_rows['中項目'] == '飲食店売上高合計'].drop_duplicates(subset=month_keys, keep='first')
+    sales_table = pd.concat([net_sales, restaurant_sales]).drop_duplicates(subset=month_keys, keep='first')
+    sales_table = sales_table[month_keys + ['値']].rename(columns={'値': 'sales'})
+    prev_sales_table = sales_table.assign(month_index=sales_table['month_index'] + 12).rename(columns={'sales': 'prev_sales'})
+    # 前年売上高は当月の売上高がある (年月, 店舗) のみ
+    prev_sales_table = prev_sales_table.merge(sales_table[month_keys], on=month_keys, how='inner')
+
+    df = df.merge(sales_table, on=month_keys, how='left').merge(prev_sales_table, on=month_keys, how='left')
+    df['prev'] = lookup_values(
+        df.assign(prev_month_index=df['month_index'] - 12), ['prev_month_index', '店舗コード', '中項目'],
+        df, ['month_index', '店舗コード', '中項目'], '値')
+
+    df = df.sort_values('source_order', kind='stable').reset_index(drop=True)
+    df['cum_sales'], df['prev_cum_sales'] = fiscal_sales_cumulative(df, list(store_names.keys()))
+
+    value = df['値'].to_numpy()
+    prev = df['prev'].to_numpy()
+    sales = df['sales'].fillna(0).to_numpy()
+    prev_sales = df['prev_sales'].fillna(0).to_numpy()
+    cum_sales = df['cum_sales'].fillna(0).to_numpy()
+    prev_cum_sales = df['prev_cum_sales'].fillna(0).to_numpy()
+    has_value = ~np.isnan(value)
+    has_prev = ~np.isnan(prev)
+    group_ids = df.groupby(['fy', '店舗コード', '中項目'], sort=False).ngroup().to_numpy()
+
+    cum, cnt = masked_cumsum(value, has_value, group_ids)
+    prev_cum, prev_cnt = masked_cumsum(prev, has_prev, group_ids)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg = round_like_python(cum / cnt, 1)
+        prev_avg = round_like_python(prev_cum / prev_cnt, 1)
+        sales_ratio = round_like_python((value / sales) * 100, 1)
+        cum_sales_ratio = round_like_python((cum / cum_sales) * 100, 1)
+        yoy = round_like_python((value / prev) * 100, 1)
+        prev_sales_ratio = round_like_python((prev / prev_sales) * 100, 1)
+        prev_cum_sales_ratio = round_like_python((prev_cum / prev_cum_sales) * 100, 1)
+
+    # KPI（FL比・粗利率など）の入力: 実績は全行、実績累計は値がある行のみ（出力レコードと同じ）
+    keys = df[['年月', '店舗コード', '中項目']]
+    kpi_source = pd.concat([
+        keys.assign(区分='実績', 値=value),
+        keys[has_value].assign(区分='実績累計', 値=cum[has_value]),
+    ], ignore_index=True)
+
+    always = np.ones(len(df), dtype=bool)
+    return assemble_series(df, [
+        ('実績', always, value, None),
+        ('実績累計', has_value, cum, None),
+        ('実績平均', has_value, avg, None),
+        ('売上比', has_value & (sales != 0), sales_ratio, '%'),
+        ('売上比累計', has_value & (cum_sales != 0), cum_sales_ratio, '%'),
+        ('前年', has_prev, prev, None),
+        ('前年累計', has_prev, prev_cum, None),
+        ('前年平均', has_prev, prev_avg, None),
+        ('前年比', has_prev & (prev != 0) & has_value, yoy, '%'),
+        ('前年売上比', has_prev & (prev_sales != 0), prev_sales_ratio, '%'),
+        ('前年売上比累計', has_prev & (prev_cum_sales != 0) & (prev_cum != 0), prev_cum_sales_ratio, '%'),
+    ]), kpi_source
+
+
+# ========== 比率・KPIの計算式 ==========
+# 計算式は宣言的に定義し、(年月, 店舗[, 区分]) × 中項目 の行列に対して一括で評価する。
+# - numerator: 分子の項のリスト（和を取る）。各項は候補の中項目で、左から順に最初に値があるものを使う
+# - denominator: 分母の候補の中項目
+# - 分子の項・分母のどれかが欠けている行、分母が0の行（positive_denominator なら0以下の行）は出力しない
+# - 値 = round(分子 ÷ 分母 × scale, digits)
+# 新しいKPIはここに1行追加すればよい（データの再走査は不要）
+
+# POS: 元データにない場合だけ生成する比率項目
+POS_RATIO_FORMULAS = [
+    # 組単価 = 純売上高(税抜) ÷ 組数
+    {'name': '組単価', 'numerator': [['純売上高(税抜)']], 'denominator': ['組数'],
+     'scale': 1, 'digits': 1, 'unit': '円', 'positive_denominator': True},
+    # 組人数 = 客数 ÷ 組数
+    {'name': '組人数', 'numerator': [['客数']], 'denominator': ['組数'],
+     'scale': 1, 'digits': 2, 'unit': '人', 'positive_denominator': True},
+]
+
+# PL: 実績・実績累計から計算するKPI（group ごとにまとめて出力）
+PL_KPI_FORMULAS = [
+    # FL比 = (当期売上原価|飲食店原価合計 + 人件費合計) ÷ 純売上高 × 100
+    {'group': 'FL/FLR', 'name': 'FL比',
+     'numerator': [['当期売上原価', '飲食店原価合計'], ['人件費合計']], 'denominator': ['純売上高'],
+     'scale': 100, 'digits': 1, 'unit': '%'},
+    # FLR比 = (当期売上原価|飲食店原価合計 + 人件費合計 + 店舗家賃) ÷ 純売上高 × 100
+    {'group': 'FL/FLR', 'name': 'FLR比',
+     'numerator': [['当期売上原価', '飲食店原価合計'], ['人件費合計'], ['店舗家賃']], 'denominator': ['純売上高'],
+     'scale': 100, 'digits': 1, 'unit': '%'},
+    # 粗利率 = 売上総利益 ÷ 純売上高 × 100
+    {'group': '粗利率・営業利益率', 'name': '粗利率',
+     'numerator': [['売上総利益']], 'denominator': ['純売上高'],
+     'scale': 100, 'digits': 1, 'unit': '%'},
+    # 営業利益率 = 営業利益(損失)|営業利益 ÷ 純売上高 × 100
+    {'group': '粗利率・営業利益率', 'name': '営業利益率',
+     'numerator': [['営業利益(損失)', '営業利益']], 'denominator': ['純売上高'],
+     'scale': 100, 'digits': 1, 'unit': '%'},
+]
 
+PL_KPI_KUBUNS = ['実績', '実績累計']
 
-def create_weekday_records(store_names: dict) -> list:
-    """曜日別データを集計してmaster_data形式で返す"""
-    if not POS_ANALYSIS_FOLDER.exists():
-        print("[INFO] POS分析フォルダがありません - 曜日別データをスキップ")
-        return []
 
-    # 日別データを読み込み
-    all_records = []
-    all_records.extend(load_dinii_weekday_data(POS_ANALYSIS_FOLDER / 'dinii売上'))
-    all_records.extend(load_fun_weekday_data(POS_ANALYSIS_FOLDER / 'fun売上'))
-    all_records.extend(load_pos_weekday_data(POS_ANALYSIS_FOLDER / 'POS売上'))
+def pivot_items(long_df: pd.DataFrame, index_cols: list) -> pd.DataFrame:
+    """縦持ちデータを index_cols × 中項目 の行列にする（同じキーは後勝ち、欠損はNaN）"""
+    deduped = long_df.drop_duplicates(subset=index_cols + ['中項目'], keep='last')
+    return deduped.pivot(index=index_cols, columns='中項目', values='値').astype(float)
+
+
+def evaluate_formula(matrix: pd.DataFrame, formula: dict) -> tuple:
+    """計算式を行列の全行に対して評価
+
+    Returns:
+        (値の配列, 出力する行のマスク)
+    """
+    def term(candidates):
+        values = np.full(len(matrix), np.nan)
+        for item in reversed(candidates):  # 左の候補を優先
+            if item in matrix.columns:
+                column = matrix[item].to_numpy()
+                values = np.where(np.isnan(column), values, column)
+        return values
+
+    numerator = None
+    for candidates in formula['numerator']:
+        numerator = term(candidates) if numerator is None else numerator + term(candidates)
+    denominator = term(formula['denominator'])
+
+    valid = ~np.isnan(numerator) & ~np.isnan(denominator)
+    if formula.get('positive_denominator'):
+        valid &= denominator > 0
+    else:
+        valid &= denominator != 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = round_like_python((numerator / denominator) * formula['scale'], formula['digits'])
+    return values, valid
+
 
-    if not all_records:
+def generate_pos_ratio_records(pos_records: pd.DataFrame, store_names: dict) -> list:
+    """POS_RATIO_FORMULAS の項目を、元データにない (年月, 店舗) について生成"""
+    df = pos_records.reindex(columns=['年月', '店舗コード', '店舗名', '中項目', '値'])
+    df = df[df['年月'].fillna('').astype(bool) & df['店舗コード'].fillna('').astype(bool)]
+    if df.empty:
         return []
+    df = df.assign(値=pd.to_numeric(df['値'], errors='coerce'))
+    matrix = pivot_items(df, ['年月', '店舗コード'])
+
+    # 店舗名: 店舗マスタ優先、なければ元データの店舗名
+    raw_names = df.drop_duplicates(subset=['年月', '店舗コード']).set_index(['年月', '店舗コード'])['店舗名']
+    raw_names = raw_names.reindex(matrix.index)
+
+    generated = []
+    for formula in POS_RATIO_FORMULAS:
+        values, valid = evaluate_formula(matrix, formula)
+        existing = df[df['中項目'] == formula['name']].set_index(['年月', '店舗コード']).index
+        valid &= ~matrix.index.isin(existing)
+        for i in np.nonzero(valid)[0]:
+            ym, sc = matrix.index[i]
+            sn = raw_names.iloc[i]
+            generated.append({
+                '年月': ym,
+                '店舗コード': sc,
+                '店舗名': store_names.get(sc, sn if isinstance(sn, str) and sn else sc),
+                '大項目': '効率',
+                '中項目': formula['name'],
+                '単位': formula['unit'],
+                '値': float(values[i]),
+            })
+    return generated
 
-    # 店舗×年月×曜日でグループ化
-    grouped = defaultdict(lambda: {'sales': 0, 'customers': 0, 'groups': 0, 'count': 0})
-    for r in all_records:
-        key = (r['store_name'], r['yearmonth'], r['weekday'])
-        grouped[key]['sales'] += r['sales']
-        grouped[key]['customers'] += r['customers']
-        grouped[key]['groups'] += r['groups']
-        grouped[key]['count'] += 1
 
-    # 店舗名→店舗コードのマッピング
-    store_code_map = {v: k for k, v in store_names.items()}
+def derive_pl_kpis(kpi_source: pd.DataFrame, store_names: dict) -> dict:
+    """PL_KPI_FORMULAS を (年月, 店舗, 区分) ごとに計算
 
-    # master_data形式に変換
-    result = []
-    for (store_name, yearmonth, weekday), data in grouped.items():
-        if data['count'] == 0:
-            continue
+    出力順は (年月, 店舗コード) → 区分 → 計算式の定義順。
 
-        avg_sales = round(data['sales'] / data['count'])
-        avg_customers = round(data['customers'] / data['count'], 1)
-        avg_groups = round(data['groups'] / data['count'], 1)
-        avg_spend = round(data['sales'] / data['customers']) if data['customers'] > 0 else 0
-        persons_per_group = round(data['customers'] / data['groups'], 2) if data['groups'] > 0 else 0
-
-        # 店舗コードを検索
-        store_code = ''
-        for name, code in store_code_map.items():
-            if name in store_name or store_name in name:
-                store_code = code
-                break
-
-        base = {'年月': yearmonth, '部門': store_name, '店舗コード': store_code, '大項目': 'POS_曜日別', '区分': '実績'}
-        result.append({**base, '中項目': f'曜日別売上高_{weekday}', '単位': '円', '値': avg_sales})
-        result.append({**base, '中項目': f'曜日別客数_{weekday}', '単位': '人', '値': avg_customers})
-        result.append({**base, '中項目': f'曜日別客単価_{weekday}', '単位': '円', '値': avg_spend})
-        result.append({**base, '中項目': f'曜日別組数_{weekday}', '単位': '組', '値': avg_groups})
-        result.append({**base, '中項目': f'曜日別組人数_{weekday}', '単位': '人', '値': persons_per_group})
+    Returns:
+        dict: { group: [master_data形式のレコード, ...] }（group は定義順）
+    """
+    groups = {}
+    for formula in PL_KPI_FORMULAS:
+        groups.setdefault(formula['group'], [])
+    if kpi_source.empty:
+        return groups
+
+    # 全 (年月, 店舗) × 区分 の行列（値のない組み合わせもNaNで持つ）
+    pairs = kpi_source[['年月', '店舗コード']].drop_duplicates().sort_values(['年月', '店舗コード'])
+    index = pd.MultiIndex.from_tuples(
+        [(ym, sc, kubun) for ym, sc in pairs.itertuples(index=False) for kubun in PL_KPI_KUBUNS],
+        names=['年月', '店舗コード', '区分'])
+    matrix = pivot_items(kpi_source, ['年月', '店舗コード', '区分']).reindex(index)
+
+    for group in groups:
+        formulas = [f for f in PL_KPI_FORMULAS if f['group'] == group]
+        results = [evaluate_formula(matrix, formula) for formula in formulas]
+        records = groups[group]
+        for i, (ym, sc, kubun) in enumerate(matrix.index):
+            for formula, (values, valid) in zip(formulas, results):
+                if valid[i]:
+                    records.append({
+                        '年月': ym,
+                        '部門': store_names.get(sc, sc),
+                        '店舗コード': sc,
+                        '大項目': 'POS_効率',
+                        '中項目': formula['name'],
+                        '単位': formula['unit'],
+                        '区分': kubun,
+                        '値': float(values[i]),
+                    })
+    return groups
 
-    return result
+
+# ========== 統合レコード（列指向） ==========
+# レコードはdictで持たず、文字列の列はカテゴリ（辞書エンコード）、値はfloat64配列で持つ。
+# combined_data を何度も全件走査しないよう、追加時に1回だけ見て索引（ビュー）を更新する。
+# dictへの変換はJSON書き出しの直前に、チャンク単位でのみ行う（iter_record_chunks → write_json_records）
+
+# 値の索引を持つ (大項目, 中項目)（統合売上高の作成で参照）
+INDEXED_ITEMS = [('PL_売上高', '純売上高'), ('POS_売上', '純売上高')]
+
+
+def create_record_store(indexed_items: list = None) -> dict:
+    """統合レコードと索引を持つストアを作成
+
+    ビュー:
+        chunks: 追加されたDataFrame（追加順）
+        size: 全レコード数
+        by_category: 大項目 → レコード位置の配列のリスト
+        by_store: 店舗コード → レコード位置の配列のリスト
+        departments: 部門 → 件数
+        kubun_counts: 区分 → 件数
+        yearmonths: 年月 → 件数
+        values: (大項目, 中項目) → {(年月, 店舗コード, 区分): 値}（indexed_items のみ、後勝ち）
+    """
+    return {
+        'chunks': [],
+        'size': 0,
+        'by_category': defaultdict(list),
+        'by_store': defaultdict(list),
+        'departments': defaultdict(int),
+        'kubun_counts': defaultdict(int),
+        'yearmonths': defaultdict(int),
+        'values': {key: {} for key in (indexed_items or [])},
+    }
+
+
+def append_records(store: dict, frame: pd.DataFrame):
+    """レコード（master_data形式のDataFrame）を追加し、各ビューを更新"""
+    if frame.empty:
+        return
+    positions = np.arange(store['size'], store['size'] + len(frame))
+
+    for col, view in [('大項目', store['by_category']), ('店舗コード', store['by_store'])]:
+        for key, idx in frame.groupby(col, observed=True, sort=False, dropna=False).indices.items():
+            view[key].append(positions[idx])
+
+    for col, view in [('部門', store['departments']), ('区分', store['kubun_counts']), ('年月', store['yearmonths'])]:
+        for key, count in frame[col].value_counts(sort=False).items():
+            if count:
+                view[key] += int(count)
+
+    for (big, item), index in store['values'].items():
+        rows = ((frame['大項目'] == big) & (frame['中項目'] == item)).to_numpy()
+        if rows.any():
+            sub = frame[rows]
+            keys = zip(sub['年月'].tolist(), sub['店舗コード'].tolist(), sub['区分'].tolist())
+            index.update(zip(keys, [None if v != v else v for v in sub['値'].tolist()]))
+
+    store['chunks'].append(frame)
+    store['size'] += len(frame)
+
+
+def combine_records(store: dict) -> pd.DataFrame:
+    """追加されたDataFrameを1つにまとめる（カテゴリは統合して再エンコード）"""
+    chunks = store['chunks'] or [records_to_frame([])]
+    columns = {col: union_categoricals([chunk[col].array for chunk in chunks]) for col in MASTER_CATEGORY_COLUMNS}
+    columns['値'] = np.concatenate([chunk['値'].to_numpy(dtype=float) for chunk in chunks])
+    columns[MASTER_INT_COLUMN] = np.concatenate([
+        chunk[MASTER_INT_COLUMN].to_numpy(dtype=bool) if MASTER_INT_COLUMN in chunk.columns
+        else np.zeros(len(chunk), dtype=bool)
+        for chunk in chunks])
+    return pd.DataFrame(columns)
+
+
+def iter_record_chunks(frame: pd.DataFrame, positions=None, chunk_size: int = 50000):
+    """DataFrameの行をmaster_data形式のdictにして、チャンクごとに返す"""
+    positions = np.arange(len(frame)) if positions is None else np.asarray(positions)
+    columns = []
+    for col in MASTER_CATEGORY_COLUMNS:
+        categorical = frame[col].array
+        # コード-1（欠損）は末尾の None を指す
+        lookup = np.append(np.asarray(categorical.categories, dtype=object), None)
+        columns.append((categorical.codes, lookup))
+    values = frame['値'].to_numpy(dtype=float)
+    as_int = frame[MASTER_INT_COLUMN].to_numpy(dtype=bool) if MASTER_INT_COLUMN in frame.columns else None
+    if as_int is not None and as_int.any():
+        # int で出力する値は object 配列に int として入れておく
+        values = values.astype(object)
+        values[as_int] = [int(v) for v in values[as_int]]
+
+    for start in range(0, len(positions), chunk_size):
+        idx = positions[start:start + chunk_size]
+        ym, dept, sc, big, item, unit, kubun = (lookup[codes[idx]].tolist() for codes, lookup in columns)
+        yield [
+            {'年月': a, '部門': b, '店舗コード': c, '大項目': d, '中項目': e,
+             '単位': f, '区分': g, '値': None if v != v else v}
+            for a, b, c, d, e, f, g, v in zip(ym, dept, sc, big, item, unit, kubun, values[idx].tolist())
+        ]
 
 
 def create_master_data():
-    """POS/PLデータを統合してmaster_data形式に変換"""
+    """POS/PLデータを統合してmaster_data形式に変換
+
+    Returns:
+        (master_data（'data' は列指向のDataFrame）, 統合レコードのストア)
+    """
     script_dir = Path(__file__).parent
     project_dir = script_dir.parent
     data_dir = project_dir / 'data' / 'junestory'
 
-    # データ読み込み
-    pos_data = load_json(data_dir / 'pos_data.json')
-    pl_data = load_json(data_dir / 'pl_data.json')
-
     # 店舗マスタをGoogle Driveから取得
     drive_master = get_store_master_from_drive()
 
@@ -337,7 +847,7 @@ def create_master_data():
         print(f"[INFO] ローカルから店舗マスタ取得: {len(store_names)}店舗")
 
     # 統合データを作成
-    combined_data = []
+    combined = create_record_store(INDEXED_ITEMS)
 
     # ========== 比率項目の定義 ==========
     # 比率項目は累計を「分子累計÷分母累計」で計算する
@@ -349,517 +859,48 @@ def create_master_data():
     }
 
     # ========== POSデータ処理 ==========
-    pos_records = pos_data.get('data', [])
+    # 元データは計算用のDataFrameを作ったら手放す（ピークメモリ削減）
+    pos_records = load_stage_output(data_dir / 'pos_data.json')
 
     # POSデータの店舗コードを正規化
-    for record in pos_records:
-        raw_code = record.get('店舗コード', '')
-        record['店舗コード'] = normalize_store_code(raw_code)
-
-    # POSデータをインデックス化
-    pos_index = {}
-    for record in pos_records:
-        key = (record.get('年月'), record.get('店舗コード'), record.get('中項目'))
-        pos_index[key] = record.get('値')
+    pos_records = normalize_store_codes(pos_records)
 
     # 組単価・組人数を計算して追加（元データにない場合）
-    # まず、年月×店舗コードの組み合わせを取得
-    yearmonth_store_pairs = set()
-    for record in pos_records:
-        ym = record.get('年月')
-        sc = record.get('店舗コード')
-        sn = record.get('店舗名')
-        if ym and sc:
-            yearmonth_store_pairs.add((ym, sc, sn))
-
-    # 組単価・組人数を生成
-    generated_ratio_records = []
-    for ym, sc, sn in yearmonth_store_pairs:
-        store_name = store_names.get(sc, sn or sc)
-
-        # 必要なデータを取得
-        sales = pos_index.get((ym, sc, '純売上高(税抜)'))
-        customers = pos_index.get((ym, sc, '客数'))
-        groups = pos_index.get((ym, sc, '組数'))
-
-        # 組単価: 純売上高 / 組数
-        if sales is not None and groups is not None and groups > 0:
-            if (ym, sc, '組単価') not in pos_index:
-                group_unit_price = round(sales / groups, 1)
-                pos_index[(ym, sc, '組単価')] = group_unit_price
-                generated_ratio_records.append({
-                    '年月': ym,
-                    '店舗コード': sc,
-                    '店舗名': store_name,
-                    '大項目': '効率',
-                    '中項目': '組単価',
-                    '単位': '円',
-                    '値': group_unit_price,
-                })
-
-        # 組人数: 客数 / 組数
-        if customers is not None and groups is not None and groups > 0:
-            if (ym, sc, '組人数') not in pos_index:
-                persons_per_group = round(customers / groups, 2)
-                pos_index[(ym, sc, '組人数')] = persons_per_group
-                generated_ratio_records.append({
-                    '年月': ym,
-                    '店舗コード': sc,
-                    '店舗名': store_name,
-                    '大項目': '効率',
-                    '中項目': '組人数',
-                    '単位': '人',
-                    '値': persons_per_group,
-                })
+    generated_ratio_records = generate_pos_ratio_records(pos_records, store_names)
 
     # 生成した比率レコードをpos_recordsに追加
-    pos_records = pos_records + generated_ratio_records
+    if generated_ratio_records:
+        pos_records = pd.concat([pos_records, pd.DataFrame.from_records(generated_ratio_records)], ignore_index=True)
     print(f"生成した比率レコード: {len(generated_ratio_records)}")
 
-    # POS累計・平均計算用
-    pos_cumulative = defaultdict(float)  # (年度, 店舗コード, 中項目) -> 累計値
-    pos_count = defaultdict(int)         # (年度, 店舗コード, 中項目) -> 月数
-    pos_prev_cumulative = defaultdict(float)  # 前年累計
-    pos_prev_count = defaultdict(int)
-
-    # レコードを並べ替え：比率項目は分子・分母の後に処理する
-    def sort_key(record):
-        item = record.get('中項目', '')
-        yearmonth = record.get('年月', '')
-        store_code = record.get('店舗コード', '')
-        # 比率項目は後ろに（sort order = 1）、それ以外は先に（sort order = 0）
-        is_ratio = 1 if item in RATIO_ITEMS else 0
-        return (yearmonth, store_code, is_ratio, item)
-
-    sorted_pos_records = sorted(pos_records, key=sort_key)
-
-    for record in sorted_pos_records:
-        yearmonth = record.get('年月', '')
-        store_code = record.get('店舗コード', '')
-        store_name = store_names.get(store_code, record.get('店舗名', store_code))
-        category = record.get('大項目', '')
-        item = record.get('中項目', '')
-        unit = record.get('単位', '')
-        value = record.get('値')
-
-        big_category = f"POS_{category}"
-        fiscal_year = get_fiscal_year(yearmonth)
-        cum_key = (fiscal_year, store_code, item)
-
-        # 実績
-        combined_data.append({
-            '年月': yearmonth,
-            '部門': store_name,
-            '店舗コード': store_code,
-            '大項目': big_category,
-            '中項目': item,
-            '単位': unit,
-            '区分': '実績',
-            '値': value,
-        })
-
-        # 実績累計・平均
-        if value is not None:
-            # 比率項目かどうかをチェック
-            if item in RATIO_ITEMS:
-                # 比率項目は分子・分母の累計から計算
-                numerator_item, denominator_item, _ = RATIO_ITEMS[item]
-                num_key = (fiscal_year, store_code, numerator_item)
-                den_key = (fiscal_year, store_code, denominator_item)
-
-                # 分子・分母の累計値を取得（既に加算済みのはず）
-                num_cum = pos_cumulative.get(num_key, 0)
-                den_cum = pos_cumulative.get(den_key, 0)
-
-                # 累計値を計算（分母が0でない場合のみ）
-                if den_cum > 0:
-                    cum_value = round(num_cum / den_cum, 1)
-                else:
-                    cum_value = 0
-
-                # 平均は各月の値の単純平均
-                pos_cumulative[cum_key] += value
-                pos_count[cum_key] += 1
-                avg_value = round(pos_cumulative[cum_key] / pos_count[cum_key], 1)
-            else:
-                # 通常項目は単純累計
-                pos_cumulative[cum_key] += value
-                pos_count[cum_key] += 1
-                cum_value = pos_cumulative[cum_key]
-                avg_value = round(cum_value / pos_count[cum_key], 1)
-
-            combined_data.append({
-                '年月': yearmonth,
-                '部門': store_name,
-                '店舗コード': store_code,
-                '大項目': big_category,
-                '中項目': item,
-                '単位': unit,
-                '区分': '実績累計',
-                '値': cum_value,
-            })
-
-            combined_data.append({
-                '年月': yearmonth,
-                '部門': store_name,
-                '店舗コード': store_code,
-                '大項目': big_category,
-                '中項目': item,
-                '単位': unit,
-                '区分': '実績平均',
-                '値': avg_value,
-            })
-
-        # 前年実績
-        prev_yearmonth = get_prev_year_month(yearmonth)
-        prev_key = (prev_yearmonth, store_code, item)
-        prev_value = pos_index.get(prev_key)
-
-        if prev_value is not None:
-            combined_data.append({
-                '年月': yearmonth,
-                '部門': store_name,
-                '店舗コード': store_code,
-                '大項目': big_category,
-                '中項目': item,
-                '単位': unit,
-                '区分': '前年',
-                '値': prev_value,
-            })
-
-            # 前年累計・平均
-            prev_fiscal_year = get_fiscal_year(prev_yearmonth)
-            prev_cum_key = (prev_fiscal_year, store_code, item, 'prev')
-
-            # 比率項目かどうかをチェック
-            if item in RATIO_ITEMS:
-                # 比率項目は分子・分母の前年累計から計算
-                numerator_item, denominator_item, _ = RATIO_ITEMS[item]
-                num_prev_key = (prev_fiscal_year, store_code, numerator_item, 'prev')
-                den_prev_key = (prev_fiscal_year, store_code, denominator_item, 'prev')
-
-                num_prev_cum = pos_prev_cumulative.get(num_prev_key, 0)
-                den_prev_cum = pos_prev_cumulative.get(den_prev_key, 0)
-
-                if den_prev_cum > 0:
-                    prev_cum_value = round(num_prev_cum / den_prev_cum, 1)
-                else:
-                    prev_cum_value = 0
-
-                pos_prev_cumulative[prev_cum_key] += prev_value
-                pos_prev_count[prev_cum_key] += 1
-                prev_avg = round(pos_prev_cumulative[prev_cum_key] / pos_prev_count[prev_cum_key], 1)
-            else:
-                pos_prev_cumulative[prev_cum_key] += prev_value
-                pos_prev_count[prev_cum_key] += 1
-                prev_cum_value = pos_prev_cumulative[prev_cum_key]
-                prev_avg = round(prev_cum_value / pos_prev_count[prev_cum_key], 1)
-
-            combined_data.append({
-                '年月': yearmonth,
-                '部門': store_name,
-                '店舗コード': store_code,
-                '大項目': big_category,
-                '中項目': item,
-                '単位': unit,
-                '区分': '前年累計',
-                '値': prev_cum_value,
-            })
-
-            combined_data.append({
-                '年月': yearmonth,
-                '部門': store_name,
-                '店舗コード': store_code,
-                '大項目': big_category,
-                '中項目': item,
-                '単位': unit,
-                '区分': '前年平均',
-                '値': prev_avg,
-            })
-
-            # 前年比（%）
-            if prev_value != 0 and value is not None:
-                yoy_ratio = round((value / prev_value) * 100, 1)
-                combined_data.append({
-                    '年月': yearmonth,
-                    '部門': store_name,
-                    '店舗コード': store_code,
-                    '大項目': big_category,
-                    '中項目': item,
-                    '単位': '%',
-                    '区分': '前年比',
-                    '値': yoy_ratio,
-                })
+    # 区分系列（実績累計・実績平均・前年・前年累計・前年平均・前年比）
+    pos_source = build_source_frame(pos_records, store_names, 'POS_')
+    del pos_records, generated_ratio_records
+    append_records(combined, derive_pos_series(pos_source, RATIO_ITEMS))
+    del pos_source
 
     # ========== PLデータ処理 ==========
-    pl_records = pl_data.get('data', [])
+    pl_records = load_stage_output(data_dir / 'pl_data.json')
 
     # PLデータの店舗コードを正規化
-    for record in pl_records:
-        raw_code = record.get('店舗コード', '')
-        record['店舗コード'] = normalize_store_code(raw_code)
-
-    # 売上高を取得（比率計算用）
-    sales_by_store_month = {}
-    prev_sales_by_store_month = {}
-
-    for record in pl_records:
-        if record.get('中項目') in ['純売上高', '飲食店売上高合計']:
-            key = (record.get('年月'), record.get('店舗コード'))
-            if record.get('中項目') == '純売上高' or key not in sales_by_store_month:
-                sales_by_store_month[key] = record.get('値', 0)
-
-    # 前年売上高もインデックス化
-    for (ym, sc), val in sales_by_store_month.items():
-        prev_ym = get_prev_year_month(ym)
-        prev_key = (prev_ym, sc)
-        if prev_key in sales_by_store_month:
-            prev_sales_by_store_month[(ym, sc)] = sales_by_store_month[prev_key]
-
-    # PLデータをインデックス化
-    pl_index = {}
-    for record in pl_records:
-        key = (record.get('年月'), record.get('店舗コード'), record.get('中項目'))
-        pl_index[key] = record.get('値')
-
-    # PL累計・平均計算用
-    pl_cumulative = defaultdict(float)
-    pl_count = defaultdict(int)
-    pl_prev_cumulative = defaultdict(float)
-    pl_prev_count = defaultdict(int)
-
-    # 売上累計（売上比累計の分母用）- 事前計算
-    sales_cumulative = defaultdict(float)  # (fiscal_year, store_code, yearmonth) -> 累計売上
-    prev_sales_cumulative = defaultdict(float)  # 前年売上累計
-
-    # 年月でソートして売上累計を事前計算
-    sales_items = ['純売上高', '飲食店売上高合計']
-    yearmonths_sorted = sorted(set(r.get('年月') for r in pl_records if r.get('年月')))
-
-    for store_code in store_names.keys():
-        for fiscal_year in set(get_fiscal_year(ym) for ym in yearmonths_sorted):
-            running_sales = 0
-            running_prev_sales = 0
-            for ym in yearmonths_sorted:
-                if get_fiscal_year(ym) != fiscal_year:
-                    continue
-                # 当期売上
-                for sales_item in sales_items:
-                    key = (ym, store_code, sales_item)
-                    val = pl_index.get(key)
-                    if val is not None:
-                        running_sales += val
-                        break
-                sales_cumulative[(fiscal_year, store_code, ym)] = running_sales
-
-                # 前年売上
-                prev_ym = get_prev_year_month(ym)
-                for sales_item in sales_items:
-                    prev_key = (prev_ym, store_code, sales_item)
-                    prev_val = pl_index.get(prev_key)
-                    if prev_val is not None:
-                        running_prev_sales += prev_val
-                        break
-                prev_sales_cumulative[(fiscal_year, store_code, ym)] = running_prev_sales
-
-    for record in pl_records:
-        yearmonth = record.get('年月', '')
-        store_code = record.get('店舗コード', '')
-        store_name = store_names.get(store_code, record.get('店舗名', store_code))
-        category = record.get('大項目', '')
-        item = record.get('中項目', '')
-        unit = record.get('単位', '')
-        value = record.get('値')
-
-        big_category = f"PL_{category}"
-        fiscal_year = get_fiscal_year(yearmonth)
-        cum_key = (fiscal_year, store_code, item)
-
-        # 実績
-        combined_data.append({
-            '年月': yearmonth,
-            '部門': store_name,
-            '店舗コード': store_code,
-            '大項目': big_category,
-            '中項目': item,
-            '単位': unit,
-            '区分': '実績',
-            '値': value,
-        })
-
-        # 実績累計・平均
-        if value is not None:
-            pl_cumulative[cum_key] += value
-            pl_count[cum_key] += 1
-
-            combined_data.append({
-                '年月': yearmonth,
-                '部門': store_name,
-                '店舗コード': store_code,
-                '大項目': big_category,
-                '中項目': item,
-                '単位': unit,
-                '区分': '実績累計',
-                '値': pl_cumulative[cum_key],
-            })
-
-            avg_value = round(pl_cumulative[cum_key] / pl_count[cum_key], 1)
-            combined_data.append({
-                '年月': yearmonth,
-                '部門': store_name,
-                '店舗コード': store_code,
-                '大項目': big_category,
-                '中項目': item,
-                '単位': unit,
-                '区分': '実績平均',
-                '値': avg_value,
-            })
-
-        # 売上比（%）- PLの利益・費用項目（月次）
-        sales_key = (yearmonth, store_code)
-        sales = sales_by_store_month.get(sales_key, 0)
-        if sales and sales != 0 and value is not None:
-            ratio = round((value / sales) * 100, 1)
-            combined_data.append({
-                '年月': yearmonth,
-                '部門': store_name,
-                '店舗コード': store_code,
-                '大項目': big_category,
-                '中項目': item,
-                '単位': '%',
-                '区分': '売上比',
-                '値': ratio,
-            })
-
-        # 売上比累計（%）- PLの利益・費用項目（累計ベース）
-        if value is not None:
-            sales_cum_key = (fiscal_year, store_code, yearmonth)
-            cum_sales = sales_cumulative.get(sales_cum_key, 0)
-            if cum_sales and cum_sales != 0:
-                cum_ratio = round((pl_cumulative[cum_key] / cum_sales) * 100, 1)
-                combined_data.append({
-                    '年月': yearmonth,
-                    '部門': store_name,
-                    '店舗コード': store_code,
-                    '大項目': big_category,
-                    '中項目': item,
-                    '単位': '%',
-                    '区分': '売上比累計',
-                    '値': cum_ratio,
-                })
-
-        # 前年実績
-        prev_yearmonth = get_prev_year_month(yearmonth)
-        prev_key = (prev_yearmonth, store_code, item)
-        prev_value = pl_index.get(prev_key)
-
-        if prev_value is not None:
-            combined_data.append({
-                '年月': yearmonth,
-                '部門': store_name,
-                '店舗コード': store_code,
-                '大項目': big_category,
-                '中項目': item,
-                '単位': unit,
-                '区分': '前年',
-                '値': prev_value,
-            })
-
-            # 前年累計・平均
-            prev_fiscal_year = get_fiscal_year(prev_yearmonth)
-            prev_cum_key = (prev_fiscal_year, store_code, item, 'prev')
-            pl_prev_cumulative[prev_cum_key] += prev_value
-            pl_prev_count[prev_cum_key] += 1
-
-            combined_data.append({
-                '年月': yearmonth,
-                '部門': store_name,
-                '店舗コード': store_code,
-                '大項目': big_category,
-                '中項目': item,
-                '単位': unit,
-                '区分': '前年累計',
-                '値': pl_prev_cumulative[prev_cum_key],
-            })
-
-            prev_avg = round(pl_prev_cumulative[prev_cum_key] / pl_prev_count[prev_cum_key], 1)
-            combined_data.append({
-                '年月': yearmonth,
-                '部門': store_name,
-                '店舗コード': store_code,
-                '大項目': big_category,
-                '中項目': item,
-                '単位': unit,
-                '区分': '前年平均',
-                '値': prev_avg,
-            })
+    pl_records = normalize_store_codes(pl_records)
 
-            # 前年比（%）
-            if prev_value != 0 and value is not None:
-                yoy_ratio = round((value / prev_value) * 100, 1)
-                combined_data.append({
-                    '年月': yearmonth,
-                    '部門': store_name,
-                    '店舗コード': store_code,
-                    '大項目': big_category,
-                    '中項目': item,
-                    '単位': '%',
-                    '区分': '前年比',
-                    '値': yoy_ratio,
-                })
-
-            # 前年売上比（%）- PLの利益・費用項目（月次）
-            prev_sales = prev_sales_by_store_month.get(sales_key)
-            if prev_sales and prev_sales != 0 and prev_value is not None:
-                prev_ratio = round((prev_value / prev_sales) * 100, 1)
-                combined_data.append({
-                    '年月': yearmonth,
-                    '部門': store_name,
-                    '店舗コード': store_code,
-                    '大項目': big_category,
-                    '中項目': item,
-                    '単位': '%',
-                    '区分': '前年売上比',
-                    '値': prev_ratio,
-                })
-
-            # 前年売上比累計（%）- PLの利益・費用項目（累計ベース）
-            # 事前計算済みの前年売上累計を使用
-            prev_sales_cum_key = (fiscal_year, store_code, yearmonth)
-            prev_cum_sales = prev_sales_cumulative.get(prev_sales_cum_key, 0)
-            if prev_cum_sales and prev_cum_sales != 0 and pl_prev_cumulative[prev_cum_key] != 0:
-                prev_cum_ratio = round((pl_prev_cumulative[prev_cum_key] / prev_cum_sales) * 100, 1)
-                combined_data.append({
-                    '年月': yearmonth,
-                    '部門': store_name,
-                    '店舗コード': store_code,
-                    '大項目': big_category,
-                    '中項目': item,
-                    '単位': '%',
-                    '区分': '前年売上比累計',
-                    '値': prev_cum_ratio,
-                })
+    # 区分系列（実績〜前年売上比累計）
+    pl_source = build_source_frame(pl_records, store_names, 'PL_')
+    del pl_records
+    pl_series, pl_kpi_source = derive_pl_series(pl_source, store_names)
+    append_records(combined, pl_series)
+    del pl_source, pl_series
 
     # ========== 統合売上高（PL優先→POSフォールバック）==========
     # PLの純売上高がない月はPOSの純売上高で補完
 
-    # PLの純売上高をインデックス化
-    pl_sales_index = {}
-    for r in combined_data:
-        if r['大項目'] == 'PL_売上高' and r['中項目'] == '純売上高':
-            key = (r['年月'], r['店舗コード'], r['区分'])
-            pl_sales_index[key] = r['値']
-
-    # POSの純売上高をインデックス化
-    pos_sales_index = {}
-    for r in combined_data:
-        if r['大項目'] == 'POS_売上' and r['中項目'] == '純売上高':
-            key = (r['年月'], r['店舗コード'], r['区分'])
-            pos_sales_index[key] = r['値']
+    pl_sales_index = combined['values'][('PL_売上高', '純売上高')]
+    pos_sales_index = combined['values'][('POS_売上', '純売上高')]
 
     # 統合売上高を生成（PL優先、なければPOS）
     integrated_sales = []
-    all_keys = set(pl_sales_index.keys()) | set(pos_sales_index.keys())
+    all_keys = list(pl_sales_index.keys()) + [key for key in pos_sales_index if key not in pl_sales_index]
 
     for key in all_keys:
         yearmonth, store_code, kubun = key
@@ -886,137 +927,22 @@ def create_master_data():
             '値': value,
         })
 
-    combined_data.extend(integrated_sales)
+    append_records(combined, records_to_frame(integrated_sales))
     print(f"統合売上高レコード: {len(integrated_sales)}")
 
-    # ========== FL / FLR 比率計算 ==========
-    # FL = (Food原価 + Labor人件費) / 売上 × 100
-    # FLR = (Food原価 + Labor人件費 + Rent家賃) / 売上 × 100
-
-    # PLデータをインデックス化（年月, 店舗コード, 中項目, 区分）
-    pl_values = {}
-    for r in combined_data:
-        if r['大項目'].startswith('PL_'):
-            key = (r['年月'], r['店舗コード'], r['中項目'], r['区分'])
-            pl_values[key] = r['値']
-
-    # FL/FLR計算に必要な項目
-    food_items = ['当期売上原価', '飲食店原価合計']
-    labor_items = ['人件費合計']
-    rent_items = ['店舗家賃']
-    sales_items = ['純売上高']
-
-    # 年月×店舗の組み合わせを取得
-    yearmonth_stores = set()
-    for r in combined_data:
-        if r['大項目'].startswith('PL_'):
-            yearmonth_stores.add((r['年月'], r['店舗コード'], store_names.get(r['店舗コード'], r['店舗コード'])))
-
-    fl_records = []
-    for yearmonth, store_code, store_name in sorted(yearmonth_stores):
-        for kubun in ['実績', '実績累計']:
-            # 各項目の値を取得
-            def get_value(items):
-                for item in items:
-                    key = (yearmonth, store_code, item, kubun)
-                    if key in pl_values and pl_values[key] is not None:
-                        return pl_values[key]
-                return None
-
-            food = get_value(food_items)
-            labor = get_value(labor_items)
-            rent = get_value(rent_items)
-            sales = get_value(sales_items)
-
-            # FL比計算
-            if food is not None and labor is not None and sales and sales != 0:
-                fl_ratio = round(((food + labor) / sales) * 100, 1)
-                fl_records.append({
-                    '年月': yearmonth,
-                    '部門': store_name,
-                    '店舗コード': store_code,
-                    '大項目': 'POS_効率',
-                    '中項目': 'FL比',
-                    '単位': '%',
-                    '区分': kubun,
-                    '値': fl_ratio,
-                })
-
-            # FLR比計算
-            if food is not None and labor is not None and rent is not None and sales and sales != 0:
-                flr_ratio = round(((food + labor + rent) / sales) * 100, 1)
-                fl_records.append({
-                    '年月': yearmonth,
-                    '部門': store_name,
-                    '店舗コード': store_code,
-                    '大項目': 'POS_効率',
-                    '中項目': 'FLR比',
-                    '単位': '%',
-                    '区分': kubun,
-                    '値': flr_ratio,
-                })
-
-    combined_data.extend(fl_records)
-    print(f"FL/FLRレコード: {len(fl_records)}")
-
-    # ========== 粗利率・営業利益率 計算 ==========
-    # 粗利率 = 売上総利益 ÷ 純売上高 × 100
-    # 営業利益率 = 営業利益(損失) ÷ 純売上高 × 100
-    gross_profit_items = ['売上総利益']
-    operating_profit_items = ['営業利益(損失)', '営業利益']
-
-    ratio_records = []
-    for yearmonth, store_code, store_name in sorted(yearmonth_stores):
-        for kubun in ['実績', '実績累計']:
-            def get_val(items):
-                for item in items:
-                    key = (yearmonth, store_code, item, kubun)
-                    if key in pl_values and pl_values[key] is not None:
-                        return pl_values[key]
-                return None
-
-            sales = get_val(sales_items)
-            gross_profit = get_val(gross_profit_items)
-            operating_profit = get_val(operating_profit_items)
-
-            # 粗利率
-            if gross_profit is not None and sales and sales != 0:
-                gross_ratio = round((gross_profit / sales) * 100, 1)
-                ratio_records.append({
-                    '年月': yearmonth,
-                    '部門': store_name,
-                    '店舗コード': store_code,
-                    '大項目': 'POS_効率',
-                    '中項目': '粗利率',
-                    '単位': '%',
-                    '区分': kubun,
-                    '値': gross_ratio,
-                })
-
-            # 営業利益率
-            if operating_profit is not None and sales and sales != 0:
-                op_ratio = round((operating_profit / sales) * 100, 1)
-                ratio_records.append({
-                    '年月': yearmonth,
-                    '部門': store_name,
-                    '店舗コード': store_code,
-                    '大項目': 'POS_効率',
-                    '中項目': '営業利益率',
-                    '単位': '%',
-                    '区分': kubun,
-                    '値': op_ratio,
-                })
-
-    combined_data.extend(ratio_records)
-    print(f"粗利率・営業利益率レコード: {len(ratio_records)}")
+    # ========== 比率・KPI（FL比・FLR比・粗利率・営業利益率）==========
+    # 計算式は PL_KPI_FORMULAS を参照
+    for group, kpi_records in derive_pl_kpis(pl_kpi_source, store_names).items():
+        append_records(combined, records_to_frame(kpi_records))
+        print(f"{group}レコード: {len(kpi_records)}")
 
     # ========== 曜日別データの統合 ==========
-    weekday_records = create_weekday_records(store_names)
-    combined_data.extend(weekday_records)
-    print(f"曜日別データ: {len(weekday_records)}件")
+    weekday_frame = create_weekday_records(store_names, data_dir / DAILY_FACTS_FILENAME)
+    append_records(combined, weekday_frame)
+    print(f"曜日別データ: {len(weekday_frame)}件")
 
     # 部門リストを生成
-    departments = sorted(set(r['部門'] for r in combined_data if r['部門']))
+    departments = sorted(dept for dept in combined['departments'] if dept)
 
     # master_data形式で出力
     master_data = {
@@ -1025,36 +951,32 @@ def create_master_data():
         'generated_at': datetime.now().isoformat(),
         'columns': ['年月', '部門', '店舗コード', '大項目', '中項目', '単位', '区分', '値'],
         'departments': departments,
-        'total_records': len(combined_data),
-        'data': combined_data,
+        'total_records': combined['size'],
+        'data': combine_records(combined),
     }
 
-    return master_data
+    return master_data, combined
 
 def upload_to_drive(service, filepath, filename, folder_id):
     """Google Driveにresumable uploadでアップロード（大容量ファイル対応）"""
     from googleapiclient.http import MediaFileUpload
-    import time
 
     # ファイルサイズ確認
     file_size = os.path.getsize(filepath)
     print(f'ファイルサイズ: {file_size / 1024 / 1024:.1f} MB')
 
-    # 既存ファイルを検索
-    query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
-    results = service.files().list(
-        q=query,
-        fields='files(id)',
-        supportsAllDrives=True,
-        includeItemsFromAllDrives=True
-    ).execute()
-    existing = results.get('files', [])
+    # 既存ファイルを検索（内容が同じならアップロードしない）
+    existing = find_drive_file(service, filename, folder_id)
+    if is_same_on_drive(existing, file_md5(filepath)):
+        record_upload(file_size, skipped=True, requests=upload_request_count(file_size, resumable=True))
+        print(f'変更なし（スキップ）: {filename}')
+        return
 
     # Resumable upload（大容量ファイル対応）
     media = MediaFileUpload(filepath, mimetype='application/json', resumable=True)
 
     if existing:
-        file_id = existing[0]['id']
+        file_id = existing['id']
         request = service.files().update(
             fileId=file_id,
             media_body=media,
@@ -1069,65 +991,16 @@ def upload_to_drive(service, filepath, filename, folder_id):
             supportsAllDrives=True
         )
 
-    # チャンク単位でアップロード（リトライ付き）
+    # チャンク単位でアップロード（チャンクごとのリトライ・レート制限は drive_call が行う）
     response = None
-    retries = 0
-    max_retries = 3
-
     while response is None:
-        try:
-            status, response = request.next_chunk()
-            if status:
-                print(f'  進捗: {int(status.progress() * 100)}%')
-            retries = 0  # 成功したらリトライカウントをリセット
-        except Exception as e:
-            retries += 1
-            if retries > max_retries:
-                print(f'アップロード失敗（{max_retries}回リトライ後）: {e}')
-                raise
-            print(f'  リトライ {retries}/{max_retries}...')
-            time.sleep(2 ** retries)  # 指数バックオフ
+        status, response = drive_call(request.next_chunk)
+        if status:
+            print(f'  進捗: {int(status.progress() * 100)}%')
 
+    record_upload(file_size, skipped=False)
     print(f'{"更新" if existing else "作成"}: {filename}')
 
-def upload_small_json(service, data, filename, folder_id, max_retries=5):
-    """小さいJSONをメモリからアップロード（リトライ付き、レート制限対応）"""
-    import time
-    from googleapiclient.http import MediaInMemoryUpload
-
-    content = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
-
-    retries = 0
-    while True:
-        try:
-            # ファイル検索もリトライ対象に含める
-            query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
-            results = service.files().list(
-                q=query, fields='files(id)',
-                supportsAllDrives=True, includeItemsFromAllDrives=True
-            ).execute()
-            existing = results.get('files', [])
-
-            media = MediaInMemoryUpload(content, mimetype='application/json')
-            if existing:
-                service.files().update(fileId=existing[0]['id'], media_body=media, supportsAllDrives=True).execute()
-            else:
-                file_metadata = {'name': filename, 'parents': [folder_id]}
-                service.files().create(body=file_metadata, media_body=media, fields='id', supportsAllDrives=True).execute()
-
-            # レート制限回避のため少し待機
-            time.sleep(0.3)
-            return
-        except Exception as e:
-            retries += 1
-            if retries > max_retries:
-                print(f'  アップロード失敗（{max_retries}回リトライ後）: {e}')
-                raise
-            wait_time = min(2 ** retries, 30)  # 最大30秒
-            print(f'  リトライ {retries}/{max_retries}... ({wait_time}秒待機)')
-            time.sleep(wait_time)
-
-
 def is_new_store(opened_at: str, fiscal_year: str) -> bool:
     """今期の新店かどうかを判定（11月始まり）"""
     if not opened_at:
@@ -1155,14 +1028,12 @@ def main():
         setup_google_auth(str(env_path))
 
     # master_data作成
-    master_data = create_master_data()
+    master_data, combined = create_master_data()
     print(f"統合レコード数: {master_data['total_records']}")
     print(f"部門数: {len(master_data['departments'])}")
 
     # 区分の内訳を表示
-    kubun_counts = defaultdict(int)
-    for r in master_data['data']:
-        kubun_counts[r['区分']] += 1
+    kubun_counts = combined['kubun_counts']
     print("\n区分別レコード数:")
     for k in ['実績', '実績平均', '実績累計', '前年', '前年平均', '前年累計', '前年比', '売上比', '売上比累計', '前年売上比', '前年売上比累計']:
         if k in kubun_counts:
@@ -1177,7 +1048,7 @@ def main():
         store_info = {s['store_code']: s for s in stores_master.get('stores', [])}
 
     # 今期の年度（最新データから判定）
-    latest_yearmonth = max(r['年月'] for r in master_data['data'] if r.get('年月'))
+    latest_yearmonth = max(ym for ym in combined['yearmonths'] if ym)
     current_fy = get_fiscal_year(latest_yearmonth)
     print(f"今期: {current_fy}年10月期")
 
@@ -1185,41 +1056,52 @@ def main():
     output_dir = project_dir / 'data' / 'junestory' / 'split'
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    # 各グループ用のデータ
-    by_store = defaultdict(list)      # 店舗別
-    by_brand = defaultdict(list)      # 業態別
-    by_status = defaultdict(list)     # 新店/既存店別
-
-    for r in master_data['data']:
-        raw_code = r.get('店舗コード') or 'unknown'
-        store_code = normalize_store_code(raw_code)
-        # レコードの店舗コードも更新（ファイル内データも正規化）
-        r['店舗コード'] = store_code
+    # 店舗コードを正規化（ファイル内データも正規化）。カテゴリの種類ごとに1回だけ変換する
+    records = master_data['data']
+    store_column = records['店舗コード'].array
+    raw_codes = list(store_column.categories) + [None]  # 末尾はコード-1（欠損）用
+    codes, normalized = pd.factorize(np.array(
+        [normalize_store_code(code if isinstance(code, str) and code else 'unknown') for code in raw_codes], dtype=object))
+    records['店舗コード'] = pd.Categorical.from_codes(
+        codes[store_column.codes], categories=pd.Index(normalized, dtype=object))
+
+    # 各グループ用のデータ（店舗コードの索引から作るレコード位置。レコードは元の順序を保つ）
+    store_positions = defaultdict(list)
+    for raw_code, positions in combined['by_store'].items():
+        store_code = normalize_store_code(raw_code if isinstance(raw_code, str) and raw_code else 'unknown')
+        store_positions[store_code].extend(positions)
+
+    brand_positions = defaultdict(list)
+    status_positions = defaultdict(list)
+    for store_code, positions in store_positions.items():
         info = store_info.get(store_code, {})
+        brand_positions[info.get('brand', 'other')].extend(positions)
+        status = 'new' if is_new_store(info.get('opened_at'), current_fy) else 'existing'
+        status_positions[status].extend(positions)
 
-        # 店舗別
-        by_store[store_code].append(r)
+    def collect(groups):
+        return {key: np.sort(np.concatenate(positions)) for key, positions in groups.items()}
 
-        # 業態別
-        brand = info.get('brand', 'other')
-        by_brand[brand].append(r)
-
-        # 新店/既存店別
-        opened_at = info.get('opened_at')
-        if is_new_store(opened_at, current_fy):
-            by_status['new'].append(r)
-        else:
-            by_status['existing'].append(r)
+    by_store = collect(store_positions)     # 店舗別
+    by_brand = collect(brand_positions)     # 業態別
+    by_status = collect(status_positions)   # 新店/既存店別
 
     # ========== ファイル保存 ==========
     all_files = []
+    upload_items = []   # 書き出し時にmd5を計算しておき、アップロード時に再計算しない
+
+    def write_split_file(filename, file_data, positions):
+        filepath = output_dir / filename
+        hasher = hashlib.md5()
+        write_json_records(filepath, file_data, iter_record_chunks(records, positions), hasher=hasher)
+        upload_items.append({'path': filepath, 'filename': filename, 'md5': hasher.hexdigest(),
+                             'size': filepath.stat().st_size, 'mime_type': 'application/json'})
 
     # 1. 店舗別ファイル（付帯情報を含む）
     print(f"\n[店舗別] {len(by_store)}店舗")
-    for store_code, records in sorted(by_store.items()):
+    for store_code, positions in sorted(by_store.items()):
         info = store_info.get(store_code, {})
         filename = f"store_{store_code}.json"
-        filepath = output_dir / filename
         file_data = {
             'type': 'store',
             'store_code': store_code,
@@ -1231,49 +1113,41 @@ def main():
             'seats': info.get('seats'),
             'rent': info.get('rent'),
             'opened_at': info.get('opened_at'),
-            'record_count': len(records),
-            'data': records
+            'record_count': len(positions),
         }
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(file_data, f, ensure_ascii=False, separators=(',', ':'))
-        all_files.append({'type': 'store', 'key': store_code, 'filename': filename, 'records': len(records)})
+        write_split_file(filename, file_data, positions)
+        all_files.append({'type': 'store', 'key': store_code, 'filename': filename, 'records': len(positions)})
 
     # 2. 業態別ファイル
     brand_names = {'kintaro': '均タロー', 'toriyaro': '鶏ヤロー', 'kintaro_single': 'きんたろう', 'uoemon': '魚ゑもん', 'other': 'その他'}
     print(f"\n[業態別] {len(by_brand)}業態")
-    for brand, records in sorted(by_brand.items()):
+    for brand, positions in sorted(by_brand.items()):
         filename = f"brand_{brand}.json"
-        filepath = output_dir / filename
         file_data = {
             'type': 'brand',
             'brand': brand,
             'brand_name': brand_names.get(brand, brand),
-            'record_count': len(records),
-            'data': records
+            'record_count': len(positions),
         }
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(file_data, f, ensure_ascii=False, separators=(',', ':'))
-        all_files.append({'type': 'brand', 'key': brand, 'filename': filename, 'records': len(records)})
-        print(f"  {brand_names.get(brand, brand)}: {len(records):,}件")
+        write_split_file(filename, file_data, positions)
+        all_files.append({'type': 'brand', 'key': brand, 'filename': filename, 'records': len(positions)})
+        print(f"  {brand_names.get(brand, brand)}: {len(positions):,}件")
 
     # 3. 新店/既存店別ファイル
     status_names = {'new': '新店', 'existing': '既存店'}
     print(f"\n[新店/既存店別]")
-    for status, records in sorted(by_status.items()):
+    for status, positions in sorted(by_status.items()):
         filename = f"status_{status}.json"
-        filepath = output_dir / filename
         file_data = {
             'type': 'status',
             'status': status,
             'status_name': status_names.get(status, status),
             'fiscal_year': current_fy,
-            'record_count': len(records),
-            'data': records
+            'record_count': len(positions),
         }
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(file_data, f, ensure_ascii=False, separators=(',', ':'))
-        all_files.append({'type': 'status', 'key': status, 'filename': filename, 'records': len(records)})
-        print(f"  {status_names.get(status, status)}: {len(records):,}件")
+        write_split_file(filename, file_data, positions)
+        all_files.append({'type': 'status', 'key': status, 'filename': filename, 'records': len(positions)})
+        print(f"  {status_names.get(status, status)}: {len(positions):,}件")
 
     # 4. インデックスファイル（付帯情報を含む）
     stores_list = []
@@ -1298,13 +1172,16 @@ def main():
         'brands': list(brand_names.items()),
     }
     index_path = output_dir / 'index.json'
-    with open(index_path, 'w', encoding='utf-8') as f:
-        json.dump(index_data, f, ensure_ascii=False, indent=2)
+    index_bytes = json.dumps(index_data, ensure_ascii=False, indent=2).encode('utf-8')
+    with open(index_path, 'wb') as f:
+        f.write(index_bytes)
+    upload_items.insert(0, {'path': index_path, 'filename': 'index.json', 'md5': hashlib.md5(index_bytes).hexdigest(),
+                            'size': len(index_bytes), 'mime_type': 'application/json', 'content': index_bytes})
 
     # 5. 統合master_data.json（API用）
     master_data_path = project_dir / 'data' / 'junestory' / 'junestory_master_data.json'
-    with open(master_data_path, 'w', encoding='utf-8') as f:
-        json.dump(master_data, f, ensure_ascii=False, separators=(',', ':'))
+    header = {key: value for key, value in master_data.items() if key != 'data'}
+    write_json_records(master_data_path, header, iter_record_chunks(records))
     print(f"\nローカルmaster_data更新: {master_data_path}")
 
     print(f"\n保存先: {output_dir}")
@@ -1319,17 +1196,17 @@ def main():
         print(f"  junestory_master_data.json (大容量ファイル)...")
         upload_to_drive(service, str(master_data_path), 'junestory_master_data.json', JUNESTORY_FOLDER_ID)
 
-        # インデックスファイルをアップロード
-        upload_small_json(service, index_data, 'index.json', JUNESTORY_FOLDER_ID)
-        print(f"  index.json")
-
-        # 各ファイルをアップロード
-        for i, f_info in enumerate(all_files):
-            filepath = output_dir / f_info['filename']
-            with open(filepath, 'r', encoding='utf-8') as f:
-                file_data = json.load(f)
-            upload_small_json(service, file_data, f_info['filename'], JUNESTORY_FOLDER_ID)
-            print(f"  [{i+1}/{len(all_files)}] {f_info['filename']}")
+        # インデックス・分割ファイルをまとめてアップロード（フォルダ一覧1回 + 並列 + レート制限）
+        print(f"  index.json + 分割ファイル {len(all_files)}件 (並列{UPLOAD_WORKERS}, {UPLOAD_RATE_PER_SEC}件/秒)...")
+        results = upload_files_concurrently(service, upload_items, JUNESTORY_FOLDER_ID,
+                                            workers=UPLOAD_WORKERS, rate=UPLOAD_RATE_PER_SEC)
+        for item in upload_items:
+            status = results.get(item['filename'])
+            if status != 'uploaded':
+                print(f"  {item['filename']}（{'変更なし' if status == 'skipped' else '失敗'}）")
+        failed = [name for name, status in results.items() if status == 'failed']
+        if failed:
+            raise RuntimeError(f'アップロード失敗: {len(failed)}件')
 
         print(f"\nフォルダURL: https://drive.google.com/drive/folders/{JUNESTORY_FOLDER_ID}")
     else:
@@ -1339,10 +1216,4 @@ def main():
 
 if __name__ == '__main__':
     main()
-
-    # 次のスクリプトを自動実行
-    print("\n" + "=" * 50)
-    print("続けて 店舗指標計算を実行...")
-    print("=" * 50 + "\n")
-    from calc_store_metrics import main as metrics_main
-    metrics_main()
+    print_upload_summary()
@@ -13,7 +13,10 @@ from pathlib import Path
 from datetime import datetime
 
 sys.path.insert(0, str(Path(__file__).parent))
-from convert_lib import setup_google_auth, get_drive_service, upload_to_drive
+from convert_lib import (
+    setup_google_auth, get_drive_service, upload_to_drive, drive_execute, drive_download,
+    print_upload_summary
+)
 
 # ジュネストリーフォルダID
 JUNESTORY_FOLDER_ID = '1Bt8WpIQWUiHiOCct_c1AikDOZ5CKprCL'
@@ -62,61 +65,50 @@ def upload_json_to_drive(service, data, filename, folder_id):
 
     # 既存ファイルを検索
     query = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
-    results = service.files().list(
+    results = drive_execute(service.files().list(
         q=query,
         fields='files(id)',
         supportsAllDrives=True,
         includeItemsFromAllDrives=True
-    ).execute()
+    ))
     existing = results.get('files', [])
 
     media = MediaInMemoryUpload(content, mimetype='application/json')
 
     if existing:
         file_id = existing[0]['id']
-        service.files().update(
+        drive_execute(service.files().update(
             fileId=file_id,
             media_body=media,
             supportsAllDrives=True
-        ).execute()
+        ))
         print(f'  更新: {filename}')
     else:
         file_metadata = {'name': filename, 'parents': [folder_id]}
-        service.files().create(
+        drive_execute(service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id',
             supportsAllDrives=True
-        ).execute()
+        ))
         print(f'  作成: {filename}')
 
 def load_existing_clients(service, pdca_folder_id):
     """既存のclients.jsonを読み込み"""
     query = f"name='clients.json' and '{pdca_folder_id}' in parents and trashed=false"
-    results = service.files().list(
+    results = drive_execute(service.files().list(
         q=query,
         fields='files(id)',
         supportsAllDrives=True,
         includeItemsFromAllDrives=True
-    ).execute()
+    ))
     files = results.get('files', [])
 
     if not files:
         return []
 
-    from googleapiclient.http import MediaIoBaseDownload
-    import io
-
     file_id = files[0]['id']
-    request = service.files().get_media(fileId=file_id)
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
-    done = False
-    while not done:
-        _, done = downloader.next_chunk()
-
-    fh.seek(0)
-    content = fh.read().decode('utf-8')
+    content = drive_download(service.files().get_media(fileId=file_id)).decode('utf-8')
     return json.loads(content)
 
 def main():
@@ -172,3 +164,4 @@ def main():
 
 if __name__ == '__main__':
     main()
+    print_upload_summary()
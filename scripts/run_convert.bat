@@ -63,17 +63,8 @@ echo   Junestory - Full Convert
 echo ========================================
 echo.
 cd /d "%~dp0"
-echo [1/4] Converting POS data...
-python convert_junestory_pos.py
-echo.
-echo [2/4] Converting PL data...
-python convert_junestory_pl.py
-echo.
-echo [3/4] Creating master data...
-python create_junestory_master_data.py
-echo.
-echo [4/4] Calculating store metrics...
-python calc_store_metrics.py
+echo POS + PL -^> Master data + Store metrics
+python run_junestory_pipeline.py
 echo.
 echo ----------------------------------------
 echo   All done!
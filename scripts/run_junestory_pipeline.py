@@ -0,0 +1,390 @@
+"""
+ジュネストリーのデータ変換パイプライン
+
+POS変換 → PL変換 → master_data作成 → 店舗指標計算 を依存関係に沿って1回ずつ実行する。
+
+ステージ構成:
+- pos:     POS分析フォルダのCSV → pos_data.json / pos_daily.npz（日別ファクト）/
+           pos_items.npz（単品ファクト）/ pos_items_abc.json（ABC分類）
+- pl:      損益元データのCSV → pl/<年月>.json（変更のあった月のみ再変換）/ pl_data.json（全月統合）
+- master:  pos + pl（+ 日別ファクト）→ junestory_master_data.json / split/*.json
+- metrics: pos + pl → store_metrics.json
+
+pos と pl は互いに依存しないため並列に実行する。
+metrics は店舗マスタ（junestory_stores.json）を更新することがあるため、master の完了後に実行する。
+各ステージの入力ファイル（パス・サイズ・更新日時）とDrive上の入力（店舗マスタ・店舗管理表の
+ファイル情報）が前回実行時と同じで、出力ファイルも揃っている場合はスキップする（--force で強制実行）。
+
+使い方:
+    python run_junestory_pipeline.py
+    python run_junestory_pipeline.py --force
+    python run_junestory_pipeline.py --only master metrics
+    python run_junestory_pipeline.py --jobs 4
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_DIR = SCRIPT_DIR.parent
+DATA_DIR = PROJECT_DIR / 'data' / 'junestory'
+PL_SOURCE_DIR = DATA_DIR / 'pl_source'
+STATE_FILE = DATA_DIR / '.pipeline_state.json'
+
+
+# ========== ステージ実行関数 ==========
+# 各スクリプトのimportは実行時に行う（不要なステージの依存ライブラリを読み込まない）
+
+def run_pos(options: dict):
+    from convert_junestory_pos import main as pos_main
+    pos_main(jobs=options.get('jobs', 1))
+
+
+def run_pl(options: dict):
+    from convert_junestory_pl import main as pl_main
+    pl_main()
+
+
+def run_master(options: dict):
+    from create_junestory_master_data import main as master_main
+    master_main()
+
+
+def run_metrics(options: dict):
+    from calc_store_metrics import main as metrics_main
+    metrics_main()
+
+
+# ========== ステージ入力の列挙 ==========
+
+def pos_inputs() -> list:
+    """POSステージの入力（POS分析フォルダ内の全CSV）"""
+    from convert_junestory_pos import POS_FOLDER
+    if not POS_FOLDER.exists():
+        return []
+    return sorted(POS_FOLDER.glob('*/*.csv'))
+
+
+def pl_inputs() -> list:
+    """PLステージの入力（損益元データのCSVと自動学習マッピング）"""
+    if not PL_SOURCE_DIR.exists():
+        return []
+    files = sorted(PL_SOURCE_DIR.glob('*.csv'))
+    files.extend(sorted(PL_SOURCE_DIR.glob('**/store_map_auto.json')))
+    return files
+
+
+def master_inputs() -> list:
+    """masterステージの入力（pos/pl出力 + 曜日別集計用の日別ファクト + Drive不可時に使うローカル店舗マスタ）"""
+    return [DATA_DIR / 'pos_data.json', DATA_DIR / 'pl_data.json', DATA_DIR / 'pos_daily.npz',
+            SCRIPT_DIR / 'junestory_stores.json']
+
+
+def metrics_inputs() -> list:
+    """metricsステージの入力（pos/pl出力 + ローカル店舗マスタ）"""
+    return [DATA_DIR / 'pos_data.json', DATA_DIR / 'pl_data.json', SCRIPT_DIR / 'junestory_stores.json']
+
+
+# ========== Google Drive上の入力 ==========
+# ローカルファイルのフィンガープリントに加え、Drive上の入力のファイル情報も比較する
+# （店舗マスタや店舗管理表だけが更新された場合もステージを実行する）。
+
+def junestory_master_remote(service) -> dict:
+    """店舗マスタ（pos / pl / master が使用）のファイル情報
+
+    Driveが使えない場合は前回取得時の記録（cache/junestory_master.json）を使う。
+    """
+    from convert_lib import fetch_junestory_master_metadata, load_junestory_master_cache
+    files = fetch_junestory_master_metadata(service) if service else None
+    if not files:
+        cache = load_junestory_master_cache()
+        files = cache.get('files') if cache else None
+    return {'junestory_master': files}
+
+
+def store_management_remote(service) -> dict:
+    """店舗管理表（metrics が店舗マスタの更新判定に使用）の更新日時"""
+    from convert_lib import get_drive_file_metadata
+    from update_store_master import STORE_MANAGEMENT_FILE_ID
+    if not service:
+        return {'store_management': None}
+    try:
+        meta = get_drive_file_metadata(service, STORE_MANAGEMENT_FILE_ID, 'modifiedTime')
+    except Exception as e:
+        print(f'[WARN] 店舗管理表のファイル情報取得失敗: {e}')
+        return {'store_management': None}
+    return {'store_management': meta.get('modifiedTime')}
+
+
+# ステージ定義（依存関係・入力・Drive上の入力・出力）
+STAGES = {
+    'pos': {
+        'label': 'POSデータ変換',
+        'deps': [],
+        'run': run_pos,
+        'inputs': pos_inputs,
+        'remote': junestory_master_remote,
+        'outputs': [DATA_DIR / 'pos_data.json', DATA_DIR / 'pos_data.csv', DATA_DIR / 'pos_daily.npz',
+                    DATA_DIR / 'pos_items.npz', DATA_DIR / 'pos_items_abc.json'],
+    },
+    'pl': {
+        'label': 'PLデータ変換',
+        'deps': [],
+        'run': run_pl,
+        'inputs': pl_inputs,
+        'remote': junestory_master_remote,
+        'outputs': [DATA_DIR / 'pl_data.json', DATA_DIR / 'pl_data.csv', DATA_DIR / 'pl' / 'manifest.json'],
+    },
+    'master': {
+        'label': 'マスターデータ作成',
+        'deps': ['pos', 'pl'],
+        'run': run_master,
+        'inputs': master_inputs,
+        'remote': junestory_master_remote,
+        'outputs': [DATA_DIR / 'junestory_master_data.json', DATA_DIR / 'split' / 'index.json'],
+    },
+    'metrics': {
+        'label': '店舗指標計算',
+        # 店舗マスタ（junestory_stores.json）を更新することがあるため、それを読む master の後に実行する
+        'deps': ['pos', 'pl', 'master'],
+        'run': run_metrics,
+        'inputs': metrics_inputs,
+        'remote': store_management_remote,
+        'outputs': [DATA_DIR / 'store_metrics.json'],
+    },
+}
+
+
+def fingerprint_files(files: list, remote: dict = None) -> str:
+    """ファイル群のパス・サイズ・更新日時（+ Drive上の入力のファイル情報）からフィンガープリントを作成"""
+    h = hashlib.md5()
+    if remote:
+        h.update(json.dumps(remote, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+    for path in files:
+        path = Path(path)
+        try:
+            stat = path.stat()
+            h.update(f'{path}|{stat.st_size}|{stat.st_mtime_ns}\n'.encode('utf-8'))
+        except OSError:
+            h.update(f'{path}|missing\n'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def load_state() -> dict:
+    """前回実行時のステージ状態を読み込み"""
+    if not STATE_FILE.exists():
+        return {}
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state: dict):
+    """ステージ状態を保存"""
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+
+
+def collect_remote_inputs(names: list, service) -> dict:
+    """ステージごとのDrive上の入力のファイル情報（同じ入力は1回だけ取得）
+
+    Returns:
+        dict: {ステージ名: ファイル情報}
+    """
+    from convert_lib import prefetch_drive_inputs, JUNESTORY_MASTER_FILES, JUNESTORY_MASTER_METADATA_FIELDS
+    if service:
+        metadata = []
+        if any(STAGES[name]['remote'] is junestory_master_remote for name in names):
+            metadata.extend((file_id, JUNESTORY_MASTER_METADATA_FIELDS) for file_id in JUNESTORY_MASTER_FILES.values())
+        if any(STAGES[name]['remote'] is store_management_remote for name in names):
+            from update_store_master import STORE_MANAGEMENT_FILE_ID
+            metadata.append((STORE_MANAGEMENT_FILE_ID, 'modifiedTime'))
+        prefetch_drive_inputs(metadata=metadata)
+
+    fetched = {}
+    remote = {}
+    for name in names:
+        fetch = STAGES[name]['remote']
+        if fetch not in fetched:
+            fetched[fetch] = fetch(service)
+        remote[name] = fetched[fetch]
+    return remote
+
+
+def stage_fingerprint(name: str, remote: dict) -> str:
+    """ステージの入力（ローカルファイル + Drive上の入力）のフィンガープリント"""
+    return fingerprint_files(STAGES[name]['inputs'](), remote.get(name))
+
+
+def is_up_to_date(name: str, state: dict, remote: dict) -> bool:
+    """入力が前回実行時から変わっておらず、出力が揃っていればTrue"""
+    stage = STAGES[name]
+    if not all(Path(p).exists() for p in stage['outputs']):
+        return False
+    previous = state.get(name, {})
+    return previous.get('fingerprint') == stage_fingerprint(name, remote)
+
+
+def stages_to_run(targets: list, force: bool, state: dict, remote: dict) -> list:
+    """実行されるステージ（入力が変わったステージと、その後続ステージ）"""
+    running = []
+    for name in STAGES:
+        if name not in targets:
+            continue
+        upstream_ran = any(dep in running for dep in STAGES[name]['deps'])
+        if force or upstream_ran or not is_up_to_date(name, state, remote):
+            running.append(name)
+    return running
+
+
+def prefetch_inputs(names: list, service):
+    """実行するステージがGoogle Driveから読む入力を、ステージ開始前に先読み
+
+    ファイル情報は collect_remote_inputs で取得済みのため、ここでは変更のあった
+    店舗マスタ（pos / pl / master）の本体を先読みし、各ステージは convert_lib の先読み結果を使う。
+
+    Args:
+        service: Driveサービス（Noneなら先読みしない）
+    """
+    from convert_lib import prefetch_junestory_master
+    if not names or not service:
+        return
+
+    started = time.perf_counter()
+    if any(STAGES[name]['remote'] is junestory_master_remote for name in names):
+        prefetch_junestory_master(service)
+    print(f'[INFO] Drive入力の先読み: {time.perf_counter() - started:.1f}秒')
+
+
+def run_pipeline(targets: list = None, force: bool = False, max_workers: int = 2,
+                 options: dict = None, service=None) -> dict:
+    """ステージを依存関係順に実行（独立したステージは並列実行）
+
+    Args:
+        targets: 実行するステージ名（None なら全ステージ）
+        force: Trueなら入力が変わっていなくても実行
+        max_workers: 同時実行するステージ数
+        options: 各ステージに渡すオプション（例: {'jobs': 4}）
+        service: Driveサービス（入力の先読みに使う。Noneなら先読みしない）
+
+    Returns:
+        dict: {ステージ名: 'done' | 'skipped' | 'failed' | 'blocked'}
+    """
+    from convert_lib import release_artifact
+    targets = list(STAGES.keys()) if not targets else targets
+    options = options or {}
+    state = load_state()
+    remote = collect_remote_inputs([name for name in STAGES if name in targets], service)
+    prefetch_inputs(stages_to_run(targets, force, state, remote), service)
+    results = {}
+    pending = [name for name in STAGES if name in targets]
+    running = {}
+    released = set()
+
+    def deps_finished(name):
+        return all(dep in results or dep not in targets for dep in STAGES[name]['deps'])
+
+    def release_consumed_outputs():
+        # 後続ステージがすべて終わった出力はメモリから解放する（pos / pl の DataFrame を保持し続けない）
+        for name in list(results):
+            if name in released:
+                continue
+            dependents = [n for n in STAGES if name in STAGES[n]['deps'] and n in targets]
+            if all(n in results for n in dependents):
+                for path in STAGES[name]['outputs']:
+                    release_artifact(path)
+                released.add(name)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # 依存ステージが完了したものを投入
+            for name in [n for n in pending if deps_finished(n)]:
+                pending.remove(name)
+                stage = STAGES[name]
+
+                if any(results.get(dep) in ('failed', 'blocked') for dep in stage['deps']):
+                    print(f'[SKIP] {name}: 依存ステージが失敗しました')
+                    results[name] = 'blocked'
+                    continue
+
+                upstream_ran = any(results.get(dep) == 'done' for dep in stage['deps'])
+                if not force and not upstream_ran and is_up_to_date(name, state, remote):
+                    print(f'[SKIP] {name}: 入力に変更なし（{stage["label"]}）')
+                    results[name] = 'skipped'
+                    continue
+
+                print(f'\n[START] {name}: {stage["label"]}')
+                running[executor.submit(stage['run'], options)] = (name, time.perf_counter())
+
+            release_consumed_outputs()
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, started = running.pop(future)
+                elapsed = time.perf_counter() - started
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f'[ERROR] {name}: {e} ({elapsed:.1f}秒)')
+                    results[name] = 'failed'
+                    continue
+
+                results[name] = 'done'
+                state[name] = {
+                    'fingerprint': stage_fingerprint(name, remote),
+                    'completed_at': datetime.now().isoformat(),
+                    'elapsed_sec': round(elapsed, 1),
+                }
+                save_state(state)
+                print(f'[DONE] {name}: {elapsed:.1f}秒')
+    release_consumed_outputs()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ジュネストリー データ変換パイプライン')
+    parser.add_argument('--force', action='store_true', help='入力に変更がなくても全ステージを実行')
+    parser.add_argument('--only', nargs='+', choices=list(STAGES.keys()), help='実行するステージを限定')
+    parser.add_argument('--jobs', type=int, default=1, help='POS CSV変換の並列プロセス数（既定: 1）')
+    args = parser.parse_args()
+
+    print('========== ジュネストリー パイプライン開始 ==========')
+    started = time.perf_counter()
+
+    # Drive認証（各ステージの main() より前に読み込み、入力の先読みに使う）
+    from convert_lib import setup_google_auth, get_drive_service
+    env_path = PROJECT_DIR / '.env.local'
+    if env_path.exists():
+        setup_google_auth(str(env_path))
+    service = get_drive_service()
+
+    results = run_pipeline(targets=args.only, force=args.force, options={'jobs': args.jobs}, service=service)
+
+    print('\n========== 実行結果 ==========')
+    for name, status in results.items():
+        print(f'  {name}: {status}')
+    print(f'合計時間: {time.perf_counter() - started:.1f}秒')
+
+    from convert_lib import print_upload_summary
+    print_upload_summary()
+
+    if any(status in ('failed', 'blocked') for status in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,8 @@ from datetime import datetime
 from io import BytesIO
 
 sys.path.insert(0, str(Path(__file__).parent))
-from convert_lib import setup_google_auth, get_drive_service
+from convert_lib import setup_google_auth, get_drive_service, drive_execute, print_drive_api_summary, \
+    build_name_index, match_name
 
 # 店舗管理表のファイルID
 STORE_MANAGEMENT_FILE_ID = '1o8mLajjm8FOKVeJc2a-qaGNBMRCF0NDu'
@@ -17,8 +18,7 @@ STORE_MANAGEMENT_FILE_ID = '1o8mLajjm8FOKVeJc2a-qaGNBMRCF0NDu'
 
 def download_excel(service, file_id):
     """Google DriveからExcelファイルをダウンロード"""
-    request = service.files().get_media(fileId=file_id)
-    content = request.execute()
+    content = drive_execute(service.files().get_media(fileId=file_id))
     return BytesIO(content)
 
 
@@ -125,35 +125,47 @@ def parse_store_management(excel_data):
     return stores
 
 
-def match_store(pos_name, master_stores):
-    """POS店舗名からマスタ店舗をマッチング"""
+def build_store_index(master_stores):
+    """店舗管理表の店舗一覧から match_store 用の索引を作成（業態別 + 全店舗）"""
+    by_brand = {}
+    for s in master_stores:
+        by_brand.setdefault(s['brand'], []).append(s)
+
+    kichijoji = None
+    for s in master_stores:
+        if s['brand'] == 'きんたろう' and s['store_name'] == '吉祥寺店':
+            kichijoji = s
+            break
+
+    return {
+        'kichijoji': kichijoji,
+        'brands': {brand: build_name_index((s['store_name'], s) for s in stores)
+                   for brand, stores in by_brand.items()},
+        'all': build_name_index((s['store_name'], s) for s in master_stores),
+    }
+
+
+def match_store(pos_name, store_index):
+    """POS店舗名からマスタ店舗をマッチング（store_index は build_store_index の戻り値）"""
     import re
 
     # 吉祥寺店は「きんたろう」にマッチ
-    if '吉祥寺' in pos_name:
-        for s in master_stores:
-            if s['brand'] == 'きんたろう' and s['store_name'] == '吉祥寺店':
-                return s
+    if '吉祥寺' in pos_name and store_index['kichijoji']:
+        return store_index['kichijoji']
 
-    # 業態と店名を分離
+    # 業態と店名を分離（同じ業態の店舗から、店名が一致・包含する最初の店舗）
     match = re.match(r'^(均タロー|きんたろう|鶏ヤロー|魚ゑもん|豚ギャング)[!！\s]?(.+)$', pos_name)
     if match:
         pos_brand = match.group(1)
         pos_store_name = match.group(2).strip()
 
-        for s in master_stores:
-            if s['brand'] == pos_brand:
-                if (s['store_name'] == pos_store_name or
-                    s['store_name'] in pos_store_name or
-                    pos_store_name in s['store_name']):
-                    return s
+        brand_index = store_index['brands'].get(pos_brand)
+        matched = match_name(brand_index, pos_store_name) if brand_index else None
+        if matched:
+            return matched
 
     # 業態なしの場合
-    for s in master_stores:
-        if s['store_name'] in pos_name or pos_name in s['store_name']:
-            return s
-
-    return None
+    return match_name(store_index['all'], pos_name)
 
 
 def update_junestory_stores(master_stores):
@@ -165,10 +177,11 @@ def update_junestory_stores(master_stores):
         data = json.load(f)
 
     updated_count = 0
+    store_index = build_store_index(master_stores)
 
     for store in data['stores']:
         pos_name = store['name']
-        matched = match_store(pos_name, master_stores)
+        matched = match_store(pos_name, store_index)
 
         if matched:
             store['tsubo'] = matched['tsubo']
@@ -239,3 +252,4 @@ def main():
 
 if __name__ == '__main__':
     main()
+    print_drive_api_summary()